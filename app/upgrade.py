@@ -7,339 +7,3000 @@ https://github.com/BrilliantTeam/Minecraft-ResourcePack-Migrator/blob/main/conve
 
 """
 
+import argparse
+import atexit
+import contextlib
+import copy
+import cProfile
+import ctypes
+import ctypes.util
+import difflib
+import hashlib
+import io
 import json
+import mmap
 import os
 import sys
-import glob
 import shutil
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
 import zipfile
+import zlib
 import platform
+import select
+import sqlite3
 import urllib.request
-from typing import Dict, Set
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 MINECRAFT_VERSION = "1.21.11"
+CACHE_DIR = "cache"
+LINK_MODES = ("copy", "hardlink", "reflink", "symlink")
+JSON_STYLES = ("pretty", "minified")
+IO_THREADS = 8
+# Bump whenever convert_json_format produces different output, invalidating persisted conversions
+CONVERTER_VERSION = 1
+# Default size cap of the persistent conversion cache, in megabytes
+CONVERSION_CACHE_SIZE = 64
+# Conversions kept in memory by a conversion cache, the least recently used are dropped beyond it
+CONVERSION_CACHE_ENTRIES = 10000
+# Seconds without further changes before --watch upgrades, and between polls without inotify
+WATCH_DEBOUNCE = 0.2
+WATCH_POLL_INTERVAL = 0.5
+# ioctl request cloning a whole file on btrfs, xfs and other CoW filesystems
+FICLONE = 0x40049409
+
+def json_loads(data: bytes) -> Any:
+    """Parse UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter (NaN, integers beyond 64 bits), let json decide
+            pass
+    return json.loads(data.decode('utf-8'))
+
+def json_dumps(data: Any, style: str = "pretty") -> bytes:
+    """
+    Serialize data to UTF-8 JSON bytes, with orjson when it is installed.
+
+    "pretty" indents with two spaces, "minified" leaves out all whitespace.
+    Non-ASCII characters are written as UTF-8 rather than escaped.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 if style == "pretty" else 0)
+        except TypeError:
+            # Integers beyond 64 bits and other values orjson refuses
+            pass
+    if style == "pretty":
+        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+
+def json_dumps_canonical(data: Any) -> bytes:
+    """Serialize data minified with sorted keys, so equal documents give equal bytes."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+
+LOG_LEVELS = ("quiet", "summary", "verbose", "debug")
+
+class UpgradeLog:
+    """
+    Buffered run log with verbosity levels.
+
+    Per-file records are collected and written to stdout in batches rather
+    than one unbuffered print per file. Warnings and errors are shown at every level,
+    as GitHub Actions annotations. With a JSON-lines path, every shown record
+    is also written there as an object with its level, message and fields.
+    """
+
+    BUFFER_LINES = 1000
+
+    def __init__(self, level: str = "verbose", json_path: Optional[str] = None):
+        self._lines: List[str] = []
+        self._json = None
+        self._records: Optional[List[Dict[str, Any]]] = None
+        self.configure(level, json_path)
+
+    def configure(self, level: str = "verbose", json_path: Optional[str] = None):
+        """Set the verbosity level and JSON-lines output of later records."""
+        self.close()
+        self.level = LOG_LEVELS.index(level)
+        if json_path:
+            os.makedirs(os.path.dirname(json_path) or ".", exist_ok=True)
+            self._json = open(json_path, 'w', encoding='utf-8')
+
+    def _emit(self, level: int, kind: str, line: str, message: str, fields: Dict[str, Any]):
+        if level > self.level:
+            return
+        if self._records is not None:
+            self._records.append({"level": kind, "message": message.strip("\n"), **fields})
+            return
+        self._lines.append(line)
+        if self._json is not None:
+            self._json.write(json.dumps({"level": kind, "message": message.strip("\n"), **fields}) + "\n")
+        # Summaries are rare and show the progress of a run, write them right away
+        if level <= 1 or len(self._lines) >= self.BUFFER_LINES:
+            self.flush()
+
+    def summary(self, message: str = "", **fields):
+        """Stage results and other lines shown unless quiet."""
+        self._emit(1, "summary", message, message, fields)
+
+    def verbose(self, message: str = "", **fields):
+        """Per-file progress."""
+        self._emit(2, "verbose", message, message, fields)
+
+    def debug(self, message: str = "", **fields):
+        """Diagnostics for troubleshooting the upgrader itself."""
+        self._emit(3, "debug", message, message, fields)
+
+    @staticmethod
+    def _annotation(kind: str, message: str) -> str:
+        # Workflow commands are single lines, newlines are escaped
+        message = message.strip("\n").replace("%", "%25").replace("\r", "%0D").replace("\n", "%0A")
+        return f"::{kind}::{message}"
+
+    def warning(self, message: str, **fields):
+        self._emit(0, "warning", self._annotation("warning", message), message, fields)
+
+    def error(self, message: str, **fields):
+        self._emit(0, "error", self._annotation("error", message), message, fields)
+
+    def flush(self):
+        """Write buffered records."""
+        if self._lines:
+            sys.stdout.write("\n".join(self._lines) + "\n")
+            self._lines.clear()
+        sys.stdout.flush()
+        if self._json is not None:
+            self._json.flush()
+
+    @contextlib.contextmanager
+    def capture(self, level: str = "summary"):
+        """
+        Collect the records of a block in a list instead of writing them.
+
+        Yields:
+            The list the records are appended to, as the objects of the JSON-lines output
+        """
+        self.flush()
+        previous = self.level, self._records
+        self.level, self._records = LOG_LEVELS.index(level), []
+        try:
+            yield self._records
+        finally:
+            self.level, self._records = previous
+
+    def replay(self, output: str, records: str = ""):
+        """Show the output and JSON-lines records captured from another process."""
+        self.flush()
+        sys.stdout.write(output)
+        if self._json is not None:
+            self._json.write(records)
+        self.flush()
+
+    def close(self):
+        """Flush and close the JSON-lines output."""
+        self.flush()
+        if self._json is not None:
+            self._json.close()
+            self._json = None
+
+log = UpgradeLog()
+atexit.register(log.close)
+
+class StageProfiler:
+    """
+    Per-stage resource report for process_directory.
+
+    Every stage records wall and CPU time (worker processes included once they
+    have exited), the tracemalloc peak and the I/O counters the backends and
+    the JAR source maintain. Counting is always on, it is a dictionary update;
+    timing and memory tracing only happen while the profiler is enabled.
+    """
+
+    COUNTERS = ("files_read", "bytes_read", "files_written", "bytes_written",
+                "files_copied", "bytes_copied", "jar_extractions")
+
+    def __init__(self):
+        self.counters: Dict[str, int] = dict.fromkeys(self.COUNTERS, 0)
+        self.enabled = False
+        self.stats_dir: Optional[str] = None
+        self.stages: List[Dict[str, Any]] = []
+
+    def start(self, stats_dir: Optional[str] = None):
+        """Enable profiling, optionally writing cProfile stats per stage to stats_dir."""
+        self.enabled = True
+        self.stats_dir = stats_dir
+        self.stages = []
+        if stats_dir:
+            os.makedirs(stats_dir, exist_ok=True)
+        tracemalloc.start()
+
+    def stop(self):
+        if self.enabled:
+            tracemalloc.stop()
+        self.enabled = False
+
+    def count(self, counter: str, amount: int = 1):
+        self.counters[counter] += amount
+
+    @staticmethod
+    def _cpu_time() -> float:
+        # Exited worker processes only show up in os.times, which has a coarse resolution
+        times = os.times()
+        return time.process_time() + times.children_user + times.children_system
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Profile the enclosed block as one stage."""
+        if not self.enabled:
+            yield
+            return
+
+        counters = dict(self.counters)
+        tracemalloc.reset_peak()
+        profile = cProfile.Profile() if self.stats_dir else None
+        wall, cpu = time.perf_counter(), self._cpu_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(os.path.join(self.stats_dir, f"{name}.prof"))
+            record = {
+                "stage": name,
+                "wall_seconds": round(time.perf_counter() - wall, 6),
+                "cpu_seconds": round(self._cpu_time() - cpu, 6),
+                "peak_memory_bytes": tracemalloc.get_traced_memory()[1],
+            }
+            record.update({counter: self.counters[counter] - counters[counter] for counter in self.COUNTERS})
+            self.stages.append(record)
+
+    def report(self) -> Dict[str, Any]:
+        """Stage records and their totals."""
+        total: Dict[str, Any] = {"stage": "total"}
+        for key in ("wall_seconds", "cpu_seconds") + self.COUNTERS:
+            total[key] = sum(record[key] for record in self.stages)
+        total["wall_seconds"] = round(total["wall_seconds"], 6)
+        total["cpu_seconds"] = round(total["cpu_seconds"], 6)
+        total["peak_memory_bytes"] = max((record["peak_memory_bytes"] for record in self.stages), default=0)
+        return {"stages": self.stages, "total": total}
+
+    def markdown(self) -> str:
+        """Report as a Markdown table, for the GitHub step summary."""
+        lines = ["### Resource pack upgrade profile", "",
+                 "| Stage | Wall (s) | CPU (s) | Peak memory (MiB) | Files read | Files written "
+                 "| Files copied | Bytes copied | JAR extractions |",
+                 "|---|---:|---:|---:|---:|---:|---:|---:|---:|"]
+        report = self.report()
+        for record in report["stages"] + [report["total"]]:
+            lines.append(f"| {record['stage']} | {record['wall_seconds']:.3f} | {record['cpu_seconds']:.3f} "
+                         f"| {record['peak_memory_bytes'] / 2 ** 20:.1f} | {record['files_read']} "
+                         f"| {record['files_written']} | {record['files_copied']} | {record['bytes_copied']} "
+                         f"| {record['jar_extractions']} |")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path: str):
+        """Write the report as JSON and, when running in GitHub Actions, as a step summary."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+        log.summary("\nProfile:")
+        for record in self.report()["stages"]:
+            log.summary(f"  {record['stage']:<16} {record['wall_seconds']:8.3f}s wall {record['cpu_seconds']:8.3f}s cpu "
+                        f"{record['peak_memory_bytes'] / 2 ** 20:8.1f} MiB peak", event="profile", **record)
+        log.summary(f"Profile written to {path}")
+
+        if os.environ.get('GITHUB_STEP_SUMMARY'):
+            with open(os.environ['GITHUB_STEP_SUMMARY'], 'a') as f:
+                f.write(self.markdown())
+
+profiler = StageProfiler()
+
+class PackIndex:
+    """
+    In-memory listing of a directory tree.
+
+    Built with a single os.scandir traversal (or from zip entry names), then
+    answers existence and listing questions without touching the filesystem.
+    On network filesystems and bind mounts every stat is a round trip, and a
+    large pack is probed hundreds of thousands of times. Paths are relative to
+    the indexed root, with forward slashes; "" is the root itself.
+    """
+
+    def __init__(self):
+        self._files: Dict[str, Set[str]] = {}
+        self._dirs: Dict[str, Set[str]] = {}
+
+    @classmethod
+    def scan(cls, root: str) -> "PackIndex":
+        """Index every file and directory below root."""
+        index = cls()
+        if not os.path.isdir(root):
+            return index
+        index.add_dir("")
+        visited = set()
+        pending = [("", root)]
+        while pending:
+            rel, directory = pending.pop()
+            try:
+                # Symlinked directories are followed, but only once
+                stat = os.stat(directory)
+                if (stat.st_dev, stat.st_ino) in visited:
+                    continue
+                visited.add((stat.st_dev, stat.st_ino))
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        name = f"{rel}/{entry.name}" if rel else entry.name
+                        if entry.is_dir():
+                            index.add_dir(name)
+                            pending.append((name, entry.path))
+                        else:
+                            index.add(name)
+            except OSError:
+                continue
+        return index
+
+    @classmethod
+    def from_names(cls, names: List[str]) -> "PackIndex":
+        """Index a flat list of file names, such as the entries of a zip archive."""
+        index = cls()
+        index.add_dir("")
+        for name in names:
+            index.add(name)
+        return index
+
+    def add_dir(self, rel: str):
+        """Record a directory and its parents."""
+        if rel in self._dirs:
+            return
+        self._dirs[rel] = set()
+        self._files[rel] = set()
+        if rel:
+            parent, _, name = rel.rpartition("/")
+            self.add_dir(parent)
+            self._dirs[parent].add(name)
+
+    def add(self, rel: str):
+        """Record a file, creating its parent directories."""
+        parent, _, name = rel.rpartition("/")
+        self.add_dir(parent)
+        self._files[parent].add(name)
+
+    def discard(self, rel: str):
+        """Forget a removed file. Directories stay, as they do on disk."""
+        parent, _, name = rel.rpartition("/")
+        self._files.get(parent, set()).discard(name)
+
+    def exists(self, rel: str) -> bool:
+        parent, _, name = rel.rpartition("/")
+        return rel in self._dirs or name in self._files.get(parent, ())
+
+    def is_file(self, rel: str) -> bool:
+        parent, _, name = rel.rpartition("/")
+        return name in self._files.get(parent, ())
+
+    def is_dir(self, rel: str) -> bool:
+        return rel in self._dirs
+
+    def list_dirs(self, rel: str) -> List[str]:
+        """List the names of a directory's subdirectories."""
+        return sorted(self._dirs.get(rel, ()))
+
+    def list_files(self, rel: str, recursive: bool = False) -> List[str]:
+        """List files in a directory as paths relative to the index root."""
+        if rel not in self._dirs:
+            return []
+        found = []
+        pending = [rel]
+        while pending:
+            directory = pending.pop()
+            prefix = f"{directory}/" if directory else ""
+            found.extend(prefix + name for name in self._files[directory])
+            if recursive:
+                pending.extend(prefix + name for name in self._dirs[directory])
+        return found
+
+def index_relpath(root: str, path: str) -> Optional[str]:
+    """
+    Path relative to an indexed root, or None if it lies outside of it.
+
+    Cheaper than os.path.relpath, which resolves both paths against the
+    working directory on every call.
+    """
+    if path == root:
+        return ""
+    prefix = os.path.join(root, "")
+    if not path.startswith(prefix):
+        return None
+    rel = os.path.normpath(path[len(prefix):])
+    if rel == ".":
+        return ""
+    if rel == ".." or rel.startswith(".." + os.sep) or os.path.isabs(rel):
+        return None
+    return rel.replace(os.sep, "/")
+
+def materialize_file(source: str, target: str, mode: str = "copy") -> str:
+    """
+    Create target with the contents of source.
+
+    Args:
+        source: Existing file
+        target: File to create, replaced if it exists
+        mode: "copy", "hardlink", "reflink" (copy-on-write clone) or "symlink"
+
+    Returns:
+        The mode that was used; anything the filesystem does not support
+        falls back to "copy"
+    """
+    if os.path.lexists(target):
+        os.remove(target)
+
+    try:
+        if mode == "hardlink":
+            os.link(source, target)
+            return mode
+        if mode == "symlink":
+            os.symlink(os.path.relpath(source, os.path.dirname(target) or "."), target)
+            return mode
+        if mode == "reflink" and fcntl is not None:
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(source, target)
+            return mode
+    except OSError:
+        # Cross-device links, no CoW support, no symlink permission, ...
+        pass
+
+    shutil.copy2(source, target)
+    return "copy"
+
+class DirectoryBackend:
+    """
+    Storage backend for an extracted resource pack directory, modified in place.
+
+    Lookups below assets/ are answered by a PackIndex scanned on first use and
+    kept up to date on commit, anything else goes to the filesystem. Copies are
+    materialized with link_mode, see materialize_file. On commit, copies and
+    writes are spread over io_threads threads; every target appears once in
+    the pending changes, so no two threads touch the same file.
+    """
+
+    def __init__(self, root: str = "", link_mode: str = "copy", io_threads: int = IO_THREADS):
+        self.root = root
+        self.link_mode = link_mode
+        self.io_threads = io_threads
+        self.assets_dir = os.path.join(root, "assets") if root else ""
+        self._index: Optional[PackIndex] = None
+
+    def _indexed(self, path: str) -> Optional[str]:
+        """Path relative to the index, scanning it on first use, or None if not indexed."""
+        if not self.assets_dir:
+            return None
+        rel = index_relpath(self.assets_dir, path)
+        if rel is not None and self._index is None:
+            self._index = PackIndex.scan(self.assets_dir)
+        return rel
+
+    def exists(self, path: str) -> bool:
+        rel = self._indexed(path)
+        if rel is not None:
+            return self._index.exists(rel)
+        return os.path.exists(path)
+
+    def is_dir(self, path: str) -> bool:
+        rel = self._indexed(path)
+        if rel is not None:
+            return self._index.is_dir(rel)
+        return os.path.isdir(path)
+
+    def read_bytes(self, path: str) -> bytes:
+        with open(path, 'rb') as f:
+            data = f.read()
+        profiler.count("files_read")
+        profiler.count("bytes_read", len(data))
+        return data
+
+    def stat(self, path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def size(self, path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def list_dirs(self, directory: str) -> List[str]:
+        rel = self._indexed(directory)
+        if rel is not None:
+            return self._index.list_dirs(rel)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(entry.name for entry in os.scandir(directory) if entry.is_dir())
+
+    def list_files(self, directory: str, recursive: bool = False) -> List[str]:
+        rel = self._indexed(directory)
+        if rel is not None:
+            return [os.path.join(self.assets_dir, *name.split("/")) for name in self._index.list_files(rel, recursive)]
+        if not os.path.isdir(directory):
+            return []
+        if not recursive:
+            return [os.path.join(directory, f) for f in os.listdir(directory)
+                    if os.path.isfile(os.path.join(directory, f))]
+        found = []
+        for root, _, files in os.walk(directory):
+            found.extend(os.path.join(root, f) for f in files)
+        return found
+
+    def _map(self, func: Any, items: List[Any]) -> List[Any]:
+        """Apply func to every item, on the I/O thread pool when it pays off."""
+        if self.io_threads <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.io_threads, len(items))) as pool:
+            return list(pool.map(func, items))
+
+    def commit(self, copies: Dict[str, str], files: Dict[str, bytes], removed: Set[str]):
+        for directory in sorted({os.path.dirname(path) or "." for path in list(copies) + list(files)}):
+            os.makedirs(directory, exist_ok=True)
+
+        def copy_file(item: Tuple[str, str]) -> Tuple[bool, int]:
+            target, source = item
+            mode = self.link_mode
+            if mode == "symlink" and (source in files or source in removed):
+                # The copy must keep the content the source has now
+                mode = "copy"
+            used = materialize_file(source, target, mode)
+            return used != mode, os.path.getsize(target) if used == "copy" and profiler.enabled else 0
+
+        # Copies read their sources before any of them is rewritten below
+        copied = self._map(copy_file, sorted(copies.items()))
+        fallbacks = sum(1 for fell_back, _ in copied if fell_back)
+        profiler.count("files_copied", len(copied))
+        profiler.count("bytes_copied", sum(size for _, size in copied))
+        if fallbacks:
+            log.warning(f"Could not {self.link_mode} {fallbacks} files, copied them instead")
+
+        def write_file(item: Tuple[str, bytes]):
+            path, data = item
+            if os.path.islink(path) or (os.path.exists(path) and os.stat(path).st_nlink > 1):
+                # Never write through a link, the linked file keeps its content
+                os.remove(path)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+        self._map(write_file, sorted(files.items()))
+        profiler.count("files_written", len(files))
+        profiler.count("bytes_written", sum(len(data) for data in files.values()))
+
+        for path in sorted(removed):
+            if self.exists(path):
+                os.remove(path)
+
+        if self._index is not None:
+            for path in list(copies) + list(files):
+                rel = self._indexed(path)
+                if rel is not None:
+                    self._index.add(rel)
+            for path in removed:
+                rel = self._indexed(path)
+                if rel is not None:
+                    self._index.discard(rel)
+
+    def refresh(self, paths: Iterable[str]):
+        """
+        Update the index for files changed on disk by someone else, such as an editor.
+
+        A changed directory makes the whole tree be scanned again on the next lookup.
+        """
+        if self._index is None:
+            return
+        for path in paths:
+            rel = self._indexed(path)
+            if rel is None:
+                continue
+            if os.path.isdir(path) or self._index.is_dir(rel):
+                self._index = None
+                return
+            if os.path.isfile(path):
+                self._index.add(rel)
+            else:
+                self._index.discard(rel)
+
+    def close(self):
+        pass
+
+def copy_zip_entry_raw(source: zipfile.ZipFile, target: zipfile.ZipFile, info: zipfile.ZipInfo, name: str = ""):
+    """
+    Copy a zip entry into another archive without decompressing it.
+
+    zipfile has no public raw-copy API, so the compressed bytes are read from
+    behind the local file header and written after a freshly generated one.
+    """
+    source.fp.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, source.fp.read(zipfile.sizeFileHeader))
+    source.fp.seek(info.header_offset + zipfile.sizeFileHeader
+                   + header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH])
+    data = source.fp.read(info.compress_size)
+
+    new_info = copy.copy(info)
+    new_info.filename = name or info.filename
+    # Sizes and CRC are known up front, so no trailing data descriptor is needed
+    new_info.flag_bits &= ~0x08
+    new_info.extra = zipfile._strip_extra(info.extra, (1,))
+    new_info.header_offset = target.fp.tell()
+
+    target.fp.write(new_info.FileHeader(zip64=new_info.file_size > zipfile.ZIP64_LIMIT
+                                        or new_info.compress_size > zipfile.ZIP64_LIMIT))
+    target.fp.write(data)
+    target.start_dir = target.fp.tell()
+    target.filelist.append(new_info)
+    target.NameToInfo[new_info.filename] = new_info
+    target._didModify = True
+
+class ZipBackend:
+    """
+    Storage backend for a zipped resource pack.
+
+    Entries are read straight from the input archive. On commit a new archive
+    is written: untouched and copied entries are transferred raw, without
+    recompression, and only new or modified files are compressed.
+    """
+
+    def __init__(self, zip_path: str, output_path: Optional[str] = None):
+        self.root = zip_path
+        self.output_path = output_path or f"{os.path.splitext(zip_path)[0]}_upgraded.zip"
+        self.archive = zipfile.ZipFile(zip_path, 'r')
+        self.entries = {info.filename: info for info in self.archive.infolist() if not info.is_dir()}
+        self.index = PackIndex.from_names(list(self.entries))
+
+    def entry_name(self, path: str) -> str:
+        name = index_relpath(self.root, path)
+        if name is None:
+            return os.path.relpath(path, self.root).replace(os.sep, "/")
+        return name
+
+    def entry_path(self, name: str) -> str:
+        return os.path.join(self.root, *name.split("/"))
+
+    def exists(self, path: str) -> bool:
+        return self.entry_name(path) in self.entries
+
+    def is_dir(self, path: str) -> bool:
+        return self.index.is_dir(self.entry_name(path))
+
+    def read_bytes(self, path: str) -> bytes:
+        try:
+            data = self.archive.read(self.entries[self.entry_name(path)])
+        except KeyError:
+            raise FileNotFoundError(path)
+        profiler.count("files_read")
+        profiler.count("bytes_read", len(data))
+        return data
+
+    def stat(self, path: str) -> Optional[Tuple[int, int]]:
+        # Entries are rewritten into a new archive, their stats never carry over
+        return None
+
+    def size(self, path: str) -> int:
+        info = self.entries.get(self.entry_name(path))
+        return info.file_size if info else 0
+
+    def list_dirs(self, directory: str) -> List[str]:
+        return self.index.list_dirs(self.entry_name(directory))
+
+    def list_files(self, directory: str, recursive: bool = False) -> List[str]:
+        return [self.entry_path(name) for name in self.index.list_files(self.entry_name(directory), recursive)]
+
+    def commit(self, copies: Dict[str, str], files: Dict[str, bytes], removed: Set[str]):
+        copies = {self.entry_name(target): self.entry_name(source) for target, source in copies.items()}
+        files = {self.entry_name(path): data for path, data in files.items()}
+        removed = {self.entry_name(path) for path in removed}
+
+        temp_path = self.output_path + ".tmp"
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as output:
+            for info in self.archive.infolist():
+                name = info.filename
+                if name in removed or name in files or name in copies:
+                    continue
+                self._transfer(output, info, name)
+
+            for target, source in sorted(copies.items()):
+                self._transfer(output, self.entries[source], target)
+                profiler.count("files_copied")
+                profiler.count("bytes_copied", self.entries[source].compress_size)
+
+            for name, data in sorted(files.items()):
+                output.writestr(name, data)
+                profiler.count("files_written")
+                profiler.count("bytes_written", len(data))
+
+        os.replace(temp_path, self.output_path)
+
+    def _transfer(self, output: zipfile.ZipFile, info: zipfile.ZipInfo, name: str):
+        if info.flag_bits & 0x01:
+            # Encrypted entries cannot be re-framed, fall back to a normal copy
+            output.writestr(name, self.archive.read(info))
+        else:
+            copy_zip_entry_raw(self.archive, output, info, name)
+
+    def close(self):
+        self.archive.close()
+
+class MemoryBackend:
+    """
+    Storage backend for a pack held in memory, used by Upgrader.
+
+    files maps entry names ("assets/minecraft/...") to their contents; paths
+    are rooted at a virtual root directory and nothing is read from or written
+    to disk. On commit the changes are applied to files, and recorded in
+    changes with paths relative to the root.
+    """
+
+    def __init__(self, files: Mapping[str, bytes], root: str = "pack"):
+        self.root = root
+        self.files: Dict[str, bytes] = {}
+        for name, data in files.items():
+            name = name.replace("\\", "/").lstrip("/")
+            if name.startswith("./"):
+                name = name[2:]
+            if name and not name.endswith("/"):
+                self.files[name] = bytes(data)
+        self.index = PackIndex.from_names(list(self.files))
+        self.changes: List[Dict[str, Any]] = []
+
+    def entry_name(self, path: str) -> str:
+        name = index_relpath(self.root, path)
+        if name is None:
+            return os.path.relpath(path, self.root).replace(os.sep, "/")
+        return name
+
+    def entry_path(self, name: str) -> str:
+        return os.path.join(self.root, *name.split("/"))
+
+    def exists(self, path: str) -> bool:
+        return self.index.exists(self.entry_name(path))
+
+    def is_dir(self, path: str) -> bool:
+        return self.index.is_dir(self.entry_name(path))
+
+    def read_bytes(self, path: str) -> bytes:
+        try:
+            data = self.files[self.entry_name(path)]
+        except KeyError:
+            raise FileNotFoundError(path)
+        profiler.count("files_read")
+        profiler.count("bytes_read", len(data))
+        return data
+
+    def stat(self, path: str) -> Optional[Tuple[int, int]]:
+        return None
+
+    def size(self, path: str) -> int:
+        return len(self.files.get(self.entry_name(path), b""))
+
+    def list_dirs(self, directory: str) -> List[str]:
+        return self.index.list_dirs(self.entry_name(directory))
+
+    def list_files(self, directory: str, recursive: bool = False) -> List[str]:
+        return [self.entry_path(name) for name in self.index.list_files(self.entry_name(directory), recursive)]
+
+    def commit(self, copies: Dict[str, str], files: Dict[str, bytes], removed: Set[str]):
+        # Copies take their sources as they are before anything is written
+        copied = {self.entry_name(target): (self.entry_name(source), self.files[self.entry_name(source)])
+                  for target, source in copies.items()}
+        for name, (source, data) in sorted(copied.items()):
+            self.changes.append({"op": "copy", "path": name, "source": source, "size": len(data)})
+            self.files[name] = data
+            self.index.add(name)
+        for path, data in sorted(files.items()):
+            name = self.entry_name(path)
+            if name in self.files:
+                self.changes.append({"op": "update", "path": name, "size": len(data),
+                                     "previous_size": len(self.files[name])})
+            else:
+                self.changes.append({"op": "write", "path": name, "size": len(data)})
+            self.files[name] = data
+            self.index.add(name)
+        for path in sorted(removed):
+            name = self.entry_name(path)
+            if name in self.files:
+                self.changes.append({"op": "remove", "path": name, "size": len(self.files.pop(name))})
+                self.index.discard(name)
+
+    def close(self):
+        pass
+
+class PackStore:
+    """
+    In-memory document store for a resource pack.
+
+    Every JSON document is parsed at most once and shared between all stages.
+    Writes, copies and removals are recorded and applied in a single flush at
+    the end of the run, so each changed file is serialized exactly once.
+    """
+
+    def __init__(self, backend: Optional[Any] = None, json_style: str = "pretty"):
+        self.backend = backend or DirectoryBackend()
+        self.json_style = json_style
+        self.manifest: Optional["UpgradeManifest"] = None
+        self._documents: Dict[str, Any] = {}
+        self._dirty: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._copies: Dict[str, str] = {}
+        self._files: Dict[str, bytes] = {}
+        self._origins: Dict[str, str] = {}
+        self._fingerprints: Dict[str, Optional[str]] = {}
+        self._task: Optional[Dict] = None
+
+    def relpath(self, path: str) -> str:
+        """Path relative to the pack root, with forward slashes."""
+        rel = index_relpath(self.backend.root, path)
+        if rel is None:
+            rel = os.path.relpath(path, self.backend.root).replace(os.sep, "/")
+        return rel
+
+    def abspath(self, rel: str) -> str:
+        """Inverse of relpath."""
+        return os.path.join(self.backend.root, rel.replace("/", os.sep))
+
+    def exists(self, path: str) -> bool:
+        """Check whether a file exists in the pack, including pending changes."""
+        self.depend(path)
+        if path in self._removed:
+            return False
+        return (path in self._documents or path in self._copies or path in self._files
+                or self.backend.exists(path))
+
+    def is_dir(self, path: str) -> bool:
+        """Check whether a directory exists in the pack."""
+        return self.backend.is_dir(path)
+
+    def read_bytes(self, path: str) -> bytes:
+        """Return the raw contents of a file, including pending writes and copies."""
+        self.depend(path)
+        if path in self._removed:
+            raise FileNotFoundError(path)
+        if path in self._files:
+            return self._files[path]
+        return self.backend.read_bytes(self._copies.get(path, path))
+
+    def load(self, path: str) -> Any:
+        """Return the parsed JSON document at path, reading it on first access."""
+        self.depend(path)
+        if path not in self._documents:
+            self._documents[path] = json_loads(self.read_bytes(path))
+        return self._documents[path]
+
+    def serialize(self, path: str) -> bytes:
+        """Serialize a document exactly as flush will write it."""
+        return json_dumps(self._documents[path], self.json_style)
+
+    def fingerprint(self, path: str) -> Optional[str]:
+        """
+        Content hash of a file in its current state, or None if it does not exist.
+
+        Pending documents are hashed as they will be written, so fingerprints
+        taken now match the files on disk after the flush.
+        """
+        if path in self._fingerprints:
+            return self._fingerprints[path]
+
+        if path in self._removed:
+            fingerprint = None
+        elif path in self._files:
+            fingerprint = hashlib.sha1(self._files[path]).hexdigest()
+        elif path in self._dirty:
+            fingerprint = hashlib.sha1(self.serialize(path)).hexdigest()
+        elif not self.backend.exists(self._copies.get(path, path)):
+            fingerprint = None
+        else:
+            source = self._copies.get(path, path)
+            fingerprint = None
+            if self.manifest:
+                rel = self.relpath(source)
+                fingerprint = self.manifest.unchanged_fingerprint(rel)
+                if fingerprint is None:
+                    stat = self.backend.stat(source)
+                    fingerprint = self.manifest.known_fingerprint(rel, stat) if stat else None
+            if fingerprint is None:
+                try:
+                    fingerprint = hashlib.sha1(self.backend.read_bytes(source)).hexdigest()
+                except OSError:
+                    fingerprint = None
+
+        self._fingerprints[path] = fingerprint
+        return fingerprint
+
+    def depend(self, path: str):
+        """Record a file as an input of the running task."""
+        if self._task is not None and path not in self._task["inputs"]:
+            self._task["inputs"][path] = self.fingerprint(path)
+
+    def _changed(self, path: str, op: Tuple):
+        self._fingerprints.pop(path, None)
+        self._origins.pop(path, None)
+        if self._task is not None:
+            self._task["ops"].append(op)
+
+    def save(self, path: str, data: Any):
+        """Store a document and mark it to be written on flush, in the store's JSON style."""
+        self._documents[path] = data
+        self._dirty.add(path)
+        self._removed.discard(path)
+        self._copies.pop(path, None)
+        self._files.pop(path, None)
+        self._changed(path, ("save", path))
+
+    def mark_dirty(self, path: str):
+        """Mark an already loaded document as modified."""
+        self.save(path, self._documents[path])
+
+    def write_bytes(self, path: str, data: bytes, origin: str = ""):
+        """Write a binary file, such as a texture, on flush. origin names where it came from in the plan."""
+        self._files[path] = data
+        self._documents.pop(path, None)
+        self._dirty.discard(path)
+        self._removed.discard(path)
+        self._copies.pop(path, None)
+        self._changed(path, ("bytes", path))
+        if origin:
+            self._origins[path] = origin
+
+    def remove(self, path: str):
+        """Remove a file from the pack on flush."""
+        self._documents.pop(path, None)
+        self._dirty.discard(path)
+        self._copies.pop(path, None)
+        self._files.pop(path, None)
+        self._removed.add(path)
+        self._changed(path, ("remove", path))
+
+    def copy(self, source: str, target: str):
+        """Copy a file within the pack, as it is at the time of the call."""
+        if source in self._documents:
+            self.save(target, copy.deepcopy(self._documents[source]))
+            return
+        if source in self._files:
+            self.write_bytes(target, self._files[source])
+            return
+        self._copies[target] = self._copies.get(source, source)
+        self._removed.discard(target)
+        self._changed(target, ("copy", source, target))
+
+    def list_files(self, directory: str, recursive: bool = False, extension: str = "") -> List[str]:
+        """List files with an extension in a directory, including files created during this run."""
+        found = {path for path in self.backend.list_files(directory, recursive) if path.lower().endswith(extension)}
+
+        prefix = os.path.join(directory, "")
+        for path in self._dirty | set(self._copies) | set(self._files):
+            if not path.lower().endswith(extension) or not path.startswith(prefix):
+                continue
+            if recursive or os.path.dirname(path) == os.path.normpath(directory):
+                found.add(path)
+
+        return sorted(found - self._removed)
+
+    def list_json(self, directory: str, recursive: bool = False) -> List[str]:
+        """List JSON files in a directory, including documents created during this run."""
+        return self.list_files(directory, recursive, '.json')
+
+    def list_dirs(self, directory: str) -> List[str]:
+        """List the names of a directory's subdirectories, including ones created during this run."""
+        found = set(self.backend.list_dirs(directory))
+
+        prefix = os.path.join(directory, "")
+        for path in self._dirty | set(self._copies) | set(self._files):
+            if path.startswith(prefix) and os.sep in path[len(prefix):]:
+                found.add(path[len(prefix):].split(os.sep, 1)[0])
+
+        return sorted(found)
+
+    def pending_files(self) -> Dict[str, bytes]:
+        """Contents of every file flush will write, documents serialized."""
+        files = dict(self._files)
+        for path in self._dirty:
+            files[path] = self.serialize(path)
+        return files
+
+    def plan(self) -> List[Dict[str, Any]]:
+        """
+        Describe the pending changes in the order flush applies them.
+
+        Returns:
+            Serializable operations with paths relative to the pack root:
+            copy (from another file), extract (from the vanilla JAR), write (a
+            new file), update (replacing an existing one) and remove, each with
+            the size in bytes of the file it creates or deletes
+        """
+        operations = []
+        for target, source in sorted(self._copies.items()):
+            operations.append({"op": "copy", "path": self.relpath(target), "source": self.relpath(source),
+                               "size": self.backend.size(source)})
+
+        for path, data in sorted(self.pending_files().items()):
+            if path in self._origins:
+                operations.append({"op": "extract", "path": self.relpath(path), "source": self._origins[path],
+                                   "size": len(data)})
+            elif self.backend.exists(path):
+                operations.append({"op": "update", "path": self.relpath(path), "size": len(data),
+                                   "previous_size": self.backend.size(path)})
+            else:
+                operations.append({"op": "write", "path": self.relpath(path), "size": len(data)})
+
+        for path in sorted(self._removed):
+            if self.backend.exists(path):
+                operations.append({"op": "remove", "path": self.relpath(path), "size": self.backend.size(path)})
+        return operations
+
+    def flush(self) -> int:
+        """
+        Apply all pending changes through the storage backend.
+
+        Copies see the files as they were when the copy was requested, then
+        modified documents are written and removed files deleted.
+
+        Returns:
+            Number of files written or copied
+        """
+        if self.manifest is not None:
+            self.manifest.finish(self)
+
+        files = self.pending_files()
+        self.backend.commit(self._copies, files, self._removed)
+        written = len(self._copies) + len(files)
+
+        self._copies.clear()
+        self._dirty.clear()
+        self._removed.clear()
+        self._files.clear()
+        self._origins.clear()
+        self._fingerprints.clear()
+
+        if self.manifest is not None:
+            self.manifest.save(self)
+        return written
+
+    def begin_task(self):
+        """Start recording the inputs and changes of a unit of work."""
+        self._task = {"inputs": {}, "ops": []}
+
+    def end_task(self) -> Tuple[Dict[str, Optional[str]], List[Dict]]:
+        """
+        Stop recording and return what the task read and changed.
+
+        Returns:
+            Tuple of ({relative path: fingerprint}, serialized operations)
+        """
+        task, self._task = self._task, None
+        inputs = {self.relpath(path): fingerprint for path, fingerprint in task["inputs"].items()}
+
+        ops = []
+        saved = set()
+        for op in task["ops"]:
+            kind, path = op[0], op[-1]
+            if kind == "save":
+                # Documents can be saved repeatedly, keep their final content once
+                if path in saved or path not in self._documents:
+                    continue
+                saved.add(path)
+                ops.append({"op": "save", "path": self.relpath(path),
+                            "data": json_loads(json_dumps(self._documents[path], "minified"))})
+            elif kind == "bytes":
+                if path in self._files:
+                    ops.append({"op": "bytes", "path": self.relpath(path),
+                                "sha1": self.manifest.write_blob(self._files[path])})
+            elif kind == "copy":
+                ops.append({"op": "copy", "path": self.relpath(path), "source": self.relpath(op[1])})
+            else:
+                ops.append({"op": "remove", "path": self.relpath(path)})
+        return inputs, ops
+
+    def replay(self, ops: List[Dict]):
+        """Re-apply operations recorded by end_task in an earlier run."""
+        for op in ops:
+            path = self.abspath(op["path"])
+            if op["op"] == "save":
+                self.save(path, copy.deepcopy(op["data"]))
+            elif op["op"] == "bytes":
+                self.write_bytes(path, self.manifest.read_blob(op["sha1"]))
+            elif op["op"] == "copy":
+                self.copy(self.abspath(op["source"]), path)
+            else:
+                self.remove(path)
+
+    def run_task(self, stage: str, path: str, func: Any, noop: Any = None) -> Any:
+        """
+        Run one unit of work of a stage, reusing the previous run when possible.
+
+        Args:
+            stage: Stage name, combined with path into the manifest key
+            path: File the unit of work is about
+            func: Callable doing the work and returning a JSON-serializable result
+            noop: Result to return when the files are exactly as the last run left them
+            
+        Returns:
+            Result of func, or of the run it was reused from
+        """
+        if self.manifest is None:
+            return func()
+        return self.manifest.run(self, f"{stage}:{self.relpath(path)}", func, noop)
+
+    def close(self):
+        """Release the storage backend."""
+        self.backend.close()
+
+def tool_fingerprint() -> str:
+    """Hash of the upgrader itself, so code changes invalidate incremental state."""
+    with open(os.path.abspath(__file__), 'rb') as f:
+        return hashlib.sha1(f.read() + MINECRAFT_VERSION.encode('utf-8')).hexdigest()
+
+class UpgradeManifest:
+    """
+    Content-hash manifest of the previous run, used for incremental upgrades.
+
+    Every unit of work (converting one model, migrating one block model or
+    item, ...) is recorded with the fingerprints of all files it read and the
+    operations it produced. On the next run a unit is
+      - replayed from the manifest when its inputs are unchanged, e.g. in a
+        fresh checkout of the same sources, or
+      - skipped when the files it read and wrote are exactly as the last run
+        left them, e.g. when re-running on an already upgraded pack,
+    and only units whose files or dependencies changed are executed again.
+    Options that change the output, like the JSON style, invalidate it.
+    """
+
+    FORMAT = 2
+    MISSING = object()
+
+    def __init__(self, path: str, options: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.blob_dir = os.path.splitext(path)[0] + ".objects"
+        self.tool = tool_fingerprint()
+        self.options = options or {}
+        self.tasks: Dict[str, Dict] = {}
+        self.final: Dict[str, Optional[str]] = {}
+        self.previous_tasks: Dict[str, Dict] = {}
+        self.previous_final: Dict[str, Optional[str]] = {}
+        self.previous_stats: Dict[str, list] = {}
+        self.stats: Dict[str, list] = {}
+        # Files changed since the last run as reported by a watcher, None when unknown
+        self.changed: Optional[Set[str]] = None
+        # Whether save writes the manifest file, see write
+        self.persist = True
+        self.replayed = 0
+        self.skipped = 0
+        self.executed = 0
+
+        try:
+            with open(path, 'rb') as f:
+                data = json_loads(f.read())
+            if (data.get("format") == self.FORMAT and data.get("tool") == self.tool
+                    and data.get("options") == self.options):
+                self.previous_tasks = data["tasks"]
+                self.previous_final = data["final"]
+                self.previous_stats = data["stats"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def known_fingerprint(self, rel: str, stat: Tuple[int, int]) -> Optional[str]:
+        """Fingerprint of a file left untouched since the last run, without reading it."""
+        previous = self.previous_stats.get(rel)
+        if previous and previous[0] == stat[0] and previous[1] == stat[1]:
+            return self.previous_final.get(rel)
+        return None
+
+    def unchanged_fingerprint(self, rel: str) -> Optional[str]:
+        """Fingerprint of a file a watcher saw no change of since the last run, without looking at it."""
+        if self.changed is None or rel in self.changed:
+            return None
+        return self.previous_final.get(rel)
+
+    def advance(self, changed: Optional[Set[str]]):
+        """
+        Make this run the previous one of the next, without a round trip through the manifest file.
+
+        Args:
+            changed: Relative paths of the files changed since this run, or None
+                to check every file
+        """
+        self.previous_tasks, self.previous_final, self.previous_stats = self.tasks, self.final, self.stats
+        self.tasks, self.final, self.stats = {}, {}, {}
+        self.changed = changed
+        self.replayed = self.skipped = self.executed = 0
+
+    def write_blob(self, data: bytes) -> str:
+        digest = hashlib.sha1(data).hexdigest()
+        blob_path = os.path.join(self.blob_dir, digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(self.blob_dir, exist_ok=True)
+            with open(blob_path, 'wb') as f:
+                f.write(data)
+        return digest
+
+    def read_blob(self, digest: str) -> bytes:
+        with open(os.path.join(self.blob_dir, digest), 'rb') as f:
+            return f.read()
+
+    def reuse(self, store: PackStore, key: str) -> Tuple[str, Any]:
+        """
+        Try to reuse the previous run of a unit of work.
+        
+        Returns:
+            ("replayed", result), ("skipped", None) or ("", None) if it has to run
+        """
+        previous = self.previous_tasks.get(key)
+        if previous is None:
+            return "", None
+
+        current = {rel: store.fingerprint(store.abspath(rel)) for rel in previous["inputs"]}
+        if (all(self.previous_final.get(rel, self.MISSING) == fingerprint for rel, fingerprint in current.items())
+                and all(self.previous_final.get(op["path"], self.MISSING) == store.fingerprint(store.abspath(op["path"]))
+                        for op in previous["ops"])):
+            # Its files are exactly as the last run left them, running again would change nothing
+            self.tasks[key] = previous
+            self.skipped += 1
+            log.debug(f"Unchanged since the last run: {key}", event="skipped", key=key)
+            return "skipped", None
+
+        if current == previous["inputs"]:
+            store.replay(previous["ops"])
+            self.tasks[key] = previous
+            self.replayed += 1
+            log.debug(f"Replayed from manifest: {key}", event="replayed", key=key)
+            return "replayed", previous["result"]
+
+        return "", None
+
+    def execute(self, store: PackStore, key: str, func: Any) -> Any:
+        """Run a unit of work and record its inputs and operations."""
+        store.begin_task()
+        try:
+            result = func()
+        finally:
+            inputs, ops = store.end_task()
+        self.tasks[key] = {"inputs": inputs, "ops": ops, "result": result}
+        self.executed += 1
+        return result
+
+    def retain_previous(self):
+        """Keep units not seen this run, e.g. conversions whose source the last run removed."""
+        for key, task in self.previous_tasks.items():
+            self.tasks.setdefault(key, task)
+
+    def run(self, store: PackStore, key: str, func: Any, noop: Any = None) -> Any:
+        status, result = self.reuse(store, key)
+        if status == "replayed":
+            return result
+        if status == "skipped":
+            return noop
+        return self.execute(store, key, func)
+
+    def finish(self, store: PackStore):
+        """Fingerprint every file the recorded work touched, as it will be after the flush."""
+        self.retain_previous()
+        paths = set()
+        for task in self.tasks.values():
+            paths.update(task["inputs"])
+            paths.update(op["path"] for op in task["ops"])
+        self.final = {rel: store.fingerprint(store.abspath(rel)) for rel in sorted(paths)}
+
+    def save(self, store: PackStore):
+        """Record the size and mtime of the files of this run after the flush, and persist the manifest."""
+        self.stats = {}
+        for rel, fingerprint in self.final.items():
+            stat = store.backend.stat(store.abspath(rel)) if fingerprint else None
+            if stat:
+                self.stats[rel] = list(stat)
+        if self.persist:
+            self.write()
+
+        log.summary(f"\nIncremental upgrade: {self.executed} units processed, "
+                    f"{self.replayed} replayed from manifest, {self.skipped} unchanged",
+                    event="incremental_complete", executed=self.executed, replayed=self.replayed, skipped=self.skipped)
+
+    def write(self):
+        """Write the manifest file and drop blobs it no longer references."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(json_dumps({
+                "format": self.FORMAT,
+                "tool": self.tool,
+                "options": self.options,
+                "tasks": self.tasks,
+                "final": self.final,
+                "stats": self.stats
+            }, "minified"))
+        os.replace(temp_path, self.path)
+
+        referenced = {op["sha1"] for task in self.tasks.values() for op in task["ops"] if op["op"] == "bytes"}
+        if os.path.isdir(self.blob_dir):
+            for name in os.listdir(self.blob_dir):
+                if name not in referenced:
+                    os.remove(os.path.join(self.blob_dir, name))
+
+def convert_json_format(input_json: Dict, compact: bool = True) -> Dict:
+    """Convert JSON format, following the conversion rule of the item; compact drops redundant range entries"""
+    base_texture = input_json.get("textures", {}).get("layer0", "")
+    if not base_texture:
+        return input_json
+    
+    # Normalize base texture path
+    if base_texture == "item/crossbow_standby":
+        base_texture = "item/crossbow"
+    if not base_texture.startswith("minecraft:") and ":" not in base_texture:
+        base_texture = f"minecraft:item/{base_texture.replace('item/', '')}"
+
+    rule = CONVERSION_RULES.get(item_id(base_texture), DEFAULT_RULE)
+
+    # Create base format
+    fallback_model = {"type": "model", "model": base_texture}
+    
+    # Add dye tint for dyeable items such as leather armor
+    if "tint" in rule.options:
+        fallback_model["tints"] = [{"type": "minecraft:dye", "default": rule.options["tint"]}]
+    
+    new_format = {
+        "model": {
+            "type": "range_dispatch",
+            "property": "custom_model_data",
+            "fallback": fallback_model,
+            "entries": []
+        }
+    }
+
+    if "display" in input_json:
+        new_format["display"] = input_json["display"]
+
+    if "overrides" not in input_json:
+        return new_format
+
+    rule.convert(input_json["overrides"], new_format["model"], base_texture, rule)
+
+    if compact:
+        compact_range_dispatch(new_format["model"])
+    return new_format
+
+def item_id(base_texture: str) -> str:
+    """Item id a normalized base texture belongs to, e.g. "minecraft:item/bow" -> "minecraft:bow"."""
+    namespace, path = split_resource(base_texture)
+    if path.startswith("item/"):
+        path = path[5:]
+    return f"{namespace}:{path}"
+
+def convert_bow_overrides(overrides: List[Dict], model: Dict, base_texture: str, rule: "ConversionRule"):
+    """Bows and crossbows: pulling states per custom_model_data, and charge types for crossbows."""
+    is_crossbow = rule.handler == "crossbow"
+    is_bow = not is_crossbow
+    cmd_groups = {}
+    for override in overrides:
+        if "predicate" not in override or "model" not in override:
+            continue
+
+        predicate = override["predicate"]
+        cmd = predicate.get("custom_model_data")
+        if cmd is None:
+            continue
+
+        if cmd not in cmd_groups:
+            cmd_groups[cmd] = {"base": None, "pulling_states": [], "arrow": None, "firework": None}
+
+        if is_crossbow:
+            if "pulling" in predicate:
+                cmd_groups[cmd]["pulling_states"].append({
+                    "pull": predicate.get("pull", 0.0),
+                    "model": override["model"]
+                })
+            elif "charged" in predicate:
+                if predicate.get("firework", 0):
+                    cmd_groups[cmd]["firework"] = override["model"]
+                else:
+                    cmd_groups[cmd]["arrow"] = override["model"]
+            else:
+                cmd_groups[cmd]["base"] = override["model"]
+        else:  # Bow
+            if "pulling" in predicate:
+                cmd_groups[cmd]["pulling_states"].append({
+                    "pull": predicate.get("pull", 0.0),
+                    "model": override["model"]
+                })
+            else:
+                cmd_groups[cmd]["base"] = override["model"]
+
+    for cmd, group in cmd_groups.items():
+        pulling_states = sorted(group["pulling_states"], key=lambda x: x["pull"])
+        base_model = group["base"] or (pulling_states[0]["model"] if pulling_states else base_texture)
+        
+        entry = {
+            "threshold": int(cmd),
+            "model": {
+                "type": "minecraft:condition",
+                "property": "minecraft:using_item",
+                "on_false": {
+                    "type": "minecraft:model",
+                    "model": base_model
+                } if not is_crossbow else {
+                    "type": "minecraft:select",
+                    "property": "minecraft:charge_type",
+                    "fallback": {"type": "minecraft:model", "model": base_model},
+                    "cases": []
+                },
+                "on_true": {
+                    "type": "minecraft:range_dispatch",
+                    "property": "minecraft:use_duration" if is_bow else "minecraft:crossbow/pull",
+                    "scale": 0.05 if is_bow else None,
+                    "fallback": {"type": "minecraft:model", "model": base_model},
+                    "entries": []
+                }
+            }
+        }
+
+        if is_crossbow and group["arrow"]:
+            entry["model"]["on_false"]["cases"].extend([
+                {"model": {"type": "minecraft:model", "model": group["arrow"]}, "when": "arrow"},
+                {"model": {"type": "minecraft:model", "model": group["firework"]}, "when": "rocket"}
+            ] if group["firework"] else [
+                {"model": {"type": "minecraft:model", "model": group["arrow"]}, "when": "arrow"}
+            ])
+
+        for state in pulling_states:
+            if state["model"] != base_model:
+                entry["model"]["on_true"]["entries"].append({
+                    "threshold": state["pull"],
+                    "model": {"type": "minecraft:model", "model": state["model"]}
+                })
+
+        model["entries"].append(entry)
+
+def convert_threshold_overrides(overrides: List[Dict], model: Dict, base_texture: str, rule: "ConversionRule"):
+    """Normal, dyeable and damage-based items: one entry per custom_model_data or damage threshold."""
+    damage_only = rule.handler == "damage"
+    if damage_only:
+        model["property"] = "damage"
+
+    for override in overrides:
+        if "predicate" not in override:
+            continue
+
+        predicate = override["predicate"]
+        if "custom_model_data" in predicate and not damage_only:
+            cmd = int(predicate["custom_model_data"])
+        elif "damage" in predicate:
+            model["property"] = 'damage'
+            cmd = predicate["damage"]
+        else:
+            continue
+
+        entry_model = {"type": "model", "model": override["model"]}
+        
+        # Add tints to dyeable models in overrides
+        if "tint" in rule.options:
+            entry_model["tints"] = [{"type": "minecraft:dye", "default": rule.options["tint"]}]
+            
+        model["entries"].append({
+            "threshold": cmd,
+            "model": entry_model
+        })
+
+def convert_condition_overrides(overrides: List[Dict], model: Dict, base_texture: str, rule: "ConversionRule"):
+    """
+    Items with a boolean predicate, e.g. a blocking shield or a cast fishing rod.
+
+    Overrides with the rule's predicate become the on_true model of a
+    condition on the rule's property; overrides without custom_model_data
+    apply to the fallback.
+    """
+    predicate_name = rule.options["predicate"]
+    groups: Dict[Optional[int], Dict[str, Optional[str]]] = {}
+    for override in overrides:
+        if "predicate" not in override or "model" not in override:
+            continue
+
+        predicate = override["predicate"]
+        cmd = predicate.get("custom_model_data")
+        group = groups.setdefault(None if cmd is None else int(cmd), {"on_false": None, "on_true": None})
+        group["on_true" if predicate.get(predicate_name) else "on_false"] = override["model"]
+
+    def condition(group: Dict[str, Optional[str]], default_model: str) -> Dict:
+        on_false = group["on_false"] or default_model
+        return {
+            "type": "minecraft:condition",
+            "property": rule.options["property"],
+            "on_false": {"type": "minecraft:model", "model": on_false},
+            "on_true": {"type": "minecraft:model", "model": group["on_true"] or on_false},
+        }
+
+    if None in groups:
+        model["fallback"] = condition(groups.pop(None), base_texture)
+    for cmd, group in groups.items():
+        model["entries"].append({"threshold": cmd, "model": condition(group, base_texture)})
+
+# Handlers a conversion rule can name, with the options each one requires
+CONVERSION_HANDLERS = {
+    "default": (convert_threshold_overrides, ()),
+    "damage": (convert_threshold_overrides, ()),
+    "dyeable": (convert_threshold_overrides, ()),
+    "bow": (convert_bow_overrides, ()),
+    "crossbow": (convert_bow_overrides, ()),
+    "condition": (convert_condition_overrides, ("predicate", "property")),
+}
+
+class ConversionRule:
+    """How the overrides of an item are converted: a handler from CONVERSION_HANDLERS and its options."""
+
+    def __init__(self, handler: str, **options):
+        if handler not in CONVERSION_HANDLERS:
+            raise ValueError(f"Unknown conversion handler '{handler}', expected one of {', '.join(CONVERSION_HANDLERS)}")
+        self.convert, required = CONVERSION_HANDLERS[handler]
+        missing = [option for option in required if option not in options]
+        if missing:
+            raise ValueError(f"Conversion handler '{handler}' requires {', '.join(missing)}")
+        if handler == "dyeable":
+            options.setdefault("tint", -6265536)
+        self.handler = handler
+        self.options = options
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"handler": self.handler, **self.options}
+
+DEFAULT_RULE = ConversionRule("default")
+
+def register_conversion_rules(config: Dict[str, Any]):
+    """
+    Add or replace conversion rules.
+
+    Args:
+        config: Item ids like "minecraft:shield" mapped to a handler name or to
+            an object with a "handler" and its options; ids without a namespace
+            are in minecraft
+    """
+    rules = {}
+    for item, rule in config.items():
+        if isinstance(rule, str):
+            rule = {"handler": rule}
+        if not isinstance(rule, dict) or "handler" not in rule:
+            raise ValueError(f"Conversion rule for '{item}' needs a handler")
+        rules[item if ":" in item else f"minecraft:{item}"] = ConversionRule(**rule)
+    CONVERSION_RULES.update(rules)
+
+def load_conversion_rules(path: str):
+    """Register the conversion rules of a JSON config file, see register_conversion_rules."""
+    with open(path, 'rb') as f:
+        config = json_loads(f.read())
+    if not isinstance(config, dict):
+        raise ValueError(f"{path} must hold an object of item ids and conversion rules")
+    register_conversion_rules(config)
+
+def conversion_rules_config() -> Dict[str, Dict[str, Any]]:
+    """The registered rules as a config, used to set up worker processes and fingerprint runs."""
+    return {item: rule.to_dict() for item, rule in sorted(CONVERSION_RULES.items())}
+
+def conversion_rules_hash() -> str:
+    """Fingerprint of the registered rules, part of every key of a stored conversion."""
+    return hashlib.sha1(json_dumps(conversion_rules_config(), "minified")).hexdigest()
+
+def manifest_options(json_style: str) -> Dict[str, Any]:
+    """Options an incremental manifest is only valid for."""
+    return {"json_style": json_style, "conversion_rules": conversion_rules_hash()}
+
+# Conversion rules by item id, looked up once per converted model
+CONVERSION_RULES: Dict[str, ConversionRule] = {}
+register_conversion_rules({
+    "minecraft:bow": "bow",
+    "minecraft:crossbow": "crossbow",
+    "minecraft:leather_boots": "dyeable",
+    "minecraft:leather_leggings": "dyeable",
+    "minecraft:leather_chestplate": "dyeable",
+    "minecraft:leather_helmet": "dyeable",
+})
+
+RANGE_DISPATCH_TYPES = ("range_dispatch", "minecraft:range_dispatch")
+MODEL_LEAF_TYPES = ("model", "minecraft:model")
+
+def compact_range_dispatch(model: Any) -> Tuple[int, int]:
+    """
+    Remove redundant entries from every range_dispatch in an item model tree.
+
+    The client sorts entries by threshold and picks the last one at or below
+    the property value. Entries are therefore sorted (keeping the order of
+    equal thresholds), only the last of several entries with the same
+    threshold is kept, and an entry is dropped when its model equals the one
+    already in effect below its threshold: the previous entry, or the
+    fallback for the first entry.
+
+    Args:
+        model: Item model tree, compacted in place
+
+    Returns:
+        Tuple of (entries before, entries removed)
+    """
+    if not isinstance(model, dict):
+        return 0, 0
+
+    # Range nodes in pre-order; compacting them in reverse handles nested ones first,
+    # so subtrees that only become equal once compacted compare equal
+    nodes = []
+    pending = [model]
+    while pending:
+        node = pending.pop()
+        if node.get("type") in RANGE_DISPATCH_TYPES:
+            nodes.append(node)
+        # Nested item models sit in these fields only; plain models have none
+        for key in ("fallback", "on_true", "on_false"):
+            child = node.get(key)
+            if isinstance(child, dict) and child.get("type") not in MODEL_LEAF_TYPES:
+                pending.append(child)
+        for key in ("entries", "cases"):
+            children = node.get(key)
+            if isinstance(children, list):
+                for child in children:
+                    child = child.get("model") if isinstance(child, dict) else None
+                    if isinstance(child, dict) and child.get("type") not in MODEL_LEAF_TYPES:
+                        pending.append(child)
+
+    total = removed = 0
+    for node in reversed(nodes):
+        entries = node.get("entries")
+        if not isinstance(entries, list) or not entries:
+            continue
+        try:
+            thresholds = [entry["threshold"] for entry in entries]
+        except (TypeError, KeyError):
+            continue
+        if not all(type(threshold) in (int, float) for threshold in thresholds):
+            continue
 
-def convert_json_format(input_json: Dict) -> Dict:
-    """Convert JSON format with improved bow/crossbow handling"""
-    base_texture = input_json.get("textures", {}).get("layer0", "")
-    if not base_texture:
-        return input_json
-    
-    # Normalize base texture path
-    if base_texture == "item/crossbow_standby":
-        base_texture = "item/crossbow"
-    if not base_texture.startswith("minecraft:") and ":" not in base_texture:
-        base_texture = f"minecraft:item/{base_texture.replace('item/', '')}"
+        ordered = entries
+        if any(a >= b for a, b in zip(thresholds, thresholds[1:])):
+            by_threshold: Dict[float, Dict] = {}
+            for entry in entries:
+                # Later entries shadow earlier ones with the same threshold
+                by_threshold.pop(entry["threshold"], None)
+                by_threshold[entry["threshold"]] = entry
+            ordered = sorted(by_threshold.values(), key=lambda entry: entry["threshold"])
 
-    # Create base format
-    fallback_model = {"type": "model", "model": base_texture}
-    
-    # Add dye tint for leather armor items
-    leather_items = ["minecraft:item/leather_boots", "minecraft:item/leather_leggings", 
-                    "minecraft:item/leather_chestplate", "minecraft:item/leather_helmet"]
+        compacted = []
+        in_effect = node.get("fallback")
+        for entry in ordered:
+            entry_model = entry.get("model")
+            if in_effect is not None and entry_model == in_effect:
+                continue
+            compacted.append(entry)
+            in_effect = entry_model
+
+        node["entries"] = compacted
+        total += len(entries)
+        removed += len(entries) - len(compacted)
+    return total, removed
+
+def has_model_overrides(json_data: Dict) -> bool:
+    """Check whether a legacy item model has overrides that need converting."""
+    return "overrides" in json_data and any(
+        "custom_model_data" in o.get("predicate", {}) or 
+        "damage" in o.get("predicate", {})
+        for o in json_data.get("overrides", []))
+
+def convert_files_chunk(chunk: List[Tuple[str, bytes]]) -> List[Tuple[str, Optional[Dict], str]]:
+    """
+    Convert a chunk of legacy item model files. Runs inside worker processes.
     
-    is_leather_item = base_texture in leather_items
+    Args:
+        chunk: List of (path, raw file contents) pairs
+        
+    Returns:
+        List of (path, converted_data or None, error message) in input order
+    """
+    results = []
+    for path, raw in chunk:
+        try:
+            json_data = json_loads(raw)
+            converted_data = convert_json_format(json_data, compact=False) if has_model_overrides(json_data) else None
+            results.append((path, converted_data, ""))
+        except Exception as e:
+            results.append((path, None, str(e)))
+    return results
 
-    if is_leather_item:
-        fallback_model["tints"] = [{"type": "minecraft:dye", "default": -6265536}]
+def convert_files_parallel(json_files: List[str], store: PackStore, jobs: int,
+                           cache: Optional["ConversionCache"] = None) -> List[Tuple[str, Optional[Dict], str]]:
+    """
+    Fan conversion of legacy item model files out over a process pool.
     
-    new_format = {
-        "model": {
-            "type": "range_dispatch",
-            "property": "custom_model_data",
-            "fallback": fallback_model,
-            "entries": []
-        }
-    }
+    Args:
+        json_files: Paths of the files to convert
+        store: Pack store used to read the files
+        jobs: Number of worker processes
+        cache: Conversion cache answering known files up front and storing the new conversions
+        
+    Returns:
+        List of (path, converted_data or None, error message) in the order of json_files
+    """
+    # Forked workers must not inherit unwritten log records
+    log.flush()
+    results = {}
+    files = []
+    for json_file in json_files:
+        try:
+            raw = store.read_bytes(json_file)
+        except OSError as e:
+            results[json_file] = (json_file, None, str(e))
+            continue
+        found, converted_data = cache.lookup(raw) if cache is not None else (False, None)
+        if found:
+            results[json_file] = (json_file, converted_data, "")
+        else:
+            files.append((json_file, raw))
+    if not files:
+        return [results[json_file] for json_file in json_files]
 
-    if "display" in input_json:
-        new_format["display"] = input_json["display"]
+    chunk_size = max(1, min(256, len(files) // (jobs * 4)))
+    chunks = [files[start:start + chunk_size] for start in range(0, len(files), chunk_size)]
 
-    if "overrides" not in input_json:
-        return new_format
+    with ProcessPoolExecutor(max_workers=jobs, initializer=register_conversion_rules,
+                             initargs=(conversion_rules_config(),)) as executor:
+        for chunk, chunk_results in zip(chunks, executor.map(convert_files_chunk, chunks)):
+            for (_, raw), result in zip(chunk, chunk_results):
+                results[result[0]] = result
+                if cache is not None and not result[2]:
+                    cache.add(raw, result[1])
 
-    is_bow = "bow" in base_texture and "crossbow" not in base_texture
-    is_crossbow = "crossbow" in base_texture
+    return [results[json_file] for json_file in json_files]
 
-    if is_bow or is_crossbow:
-        cmd_groups = {}
-        for override in input_json["overrides"]:
-            if "predicate" not in override or "model" not in override:
-                continue
+class ConversionCache:
+    """
+    Converted item models keyed by a hash of the legacy file contents.
 
-            predicate = override["predicate"]
-            cmd = predicate.get("custom_model_data")
-            if cmd is None:
-                continue
+    Shared by the packs of a batch run, so a model shipped by several packs
+    (or several variants of one pack) is parsed and converted once. Entries are
+    kept serialized, every lookup returns a fresh document the caller may modify.
+    At most max_entries are kept, dropping the least recently used.
+    """
 
-            if cmd not in cmd_groups:
-                cmd_groups[cmd] = {"base": None, "pulling_states": [], "arrow": None, "firework": None}
-
-            if is_crossbow:
-                if "pulling" in predicate:
-                    cmd_groups[cmd]["pulling_states"].append({
-                        "pull": predicate.get("pull", 0.0),
-                        "model": override["model"]
-                    })
-                elif "charged" in predicate:
-                    if predicate.get("firework", 0):
-                        cmd_groups[cmd]["firework"] = override["model"]
-                    else:
-                        cmd_groups[cmd]["arrow"] = override["model"]
-                else:
-                    cmd_groups[cmd]["base"] = override["model"]
-            else:  # Bow
-                if "pulling" in predicate:
-                    cmd_groups[cmd]["pulling_states"].append({
-                        "pull": predicate.get("pull", 0.0),
-                        "model": override["model"]
-                    })
-                else:
-                    cmd_groups[cmd]["base"] = override["model"]
+    def __init__(self, max_entries: int = CONVERSION_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
 
-        for cmd, group in cmd_groups.items():
-            pulling_states = sorted(group["pulling_states"], key=lambda x: x["pull"])
-            base_model = group["base"] or (pulling_states[0]["model"] if pulling_states else base_texture)
-            
-            entry = {
-                "threshold": int(cmd),
-                "model": {
-                    "type": "minecraft:condition",
-                    "property": "minecraft:using_item",
-                    "on_false": {
-                        "type": "minecraft:model",
-                        "model": base_model
-                    } if not is_crossbow else {
-                        "type": "minecraft:select",
-                        "property": "minecraft:charge_type",
-                        "fallback": {"type": "minecraft:model", "model": base_model},
-                        "cases": []
-                    },
-                    "on_true": {
-                        "type": "minecraft:range_dispatch",
-                        "property": "minecraft:use_duration" if is_bow else "minecraft:crossbow/pull",
-                        "scale": 0.05 if is_bow else None,
-                        "fallback": {"type": "minecraft:model", "model": base_model},
-                        "entries": []
-                    }
-                }
-            }
+    def _remember(self, key: str, entry: bytes):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
 
-            if is_crossbow and group["arrow"]:
-                entry["model"]["on_false"]["cases"].extend([
-                    {"model": {"type": "minecraft:model", "model": group["arrow"]}, "when": "arrow"},
-                    {"model": {"type": "minecraft:model", "model": group["firework"]}, "when": "rocket"}
-                ] if group["firework"] else [
-                    {"model": {"type": "minecraft:model", "model": group["arrow"]}, "when": "arrow"}
-                ])
-
-            for state in pulling_states:
-                if state["model"] != base_model:
-                    entry["model"]["on_true"]["entries"].append({
-                        "threshold": state["pull"],
-                        "model": {"type": "minecraft:model", "model": state["model"]}
-                    })
-
-            new_format["model"]["entries"].append(entry)
-    else:
-        # Handle normal items and damage-based items
-        for override in input_json["overrides"]:
-            if "predicate" not in override:
-                continue
+    def lookup(self, raw: bytes) -> Tuple[bool, Optional[Dict]]:
+        """
+        Find the conversion of a legacy item model.
+
+        Returns:
+            (found, converted document or None if the model has no overrides to convert)
+        """
+        key = hashlib.sha1(raw).hexdigest()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._fetch(key, raw)
+            if entry is None:
+                self.misses += 1
+                return False, None
+        self._remember(key, entry)
+        self.hits += 1
+        return True, json_loads(entry)
+
+    def add(self, raw: bytes, converted_data: Optional[Dict]):
+        """Remember the conversion of a legacy item model, None if it had nothing to convert."""
+        key = hashlib.sha1(raw).hexdigest()
+        entry = json_dumps(converted_data, "minified")
+        self._remember(key, entry)
+        self._store(key, raw, entry)
+
+    def convert(self, raw: bytes) -> Optional[Dict]:
+        """Convert a legacy item model, or return None if it has no overrides to convert."""
+        found, converted_data = self.lookup(raw)
+        if not found:
+            json_data = json_loads(raw)
+            converted_data = convert_json_format(json_data, compact=False) if has_model_overrides(json_data) else None
+            self.add(raw, converted_data)
+        return converted_data
+
+    def _fetch(self, key: str, raw: bytes) -> Optional[bytes]:
+        """Serialized conversion from a backing store, None when it is not known."""
+        return None
+
+    def _store(self, key: str, raw: bytes, entry: bytes):
+        """Hand a new serialized conversion to a backing store."""
+
+    def flush(self):
+        """Write pending entries to the backing store."""
+
+    def close(self):
+        self.flush()
+
+class PersistentConversionCache(ConversionCache):
+    """
+    Conversion cache backed by a SQLite database that outlives the run.
+
+    Entries are keyed by a hash of the canonical legacy document (keys sorted,
+    whitespace removed), the converter version and the conversion rules, so
+    formatting changes still hit and an upgraded converter or different rules
+    miss. New entries and the last use of hits are written in one transaction
+    by flush(); close() then evicts the least recently used entries until the
+    cache is below max_bytes. Several processes may share the database.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = CONVERSION_CACHE_SIZE * 1024 * 1024,
+                 max_entries: int = CONVERSION_CACHE_ENTRIES):
+        super().__init__(max_entries)
+        self.path = path or os.path.join(CACHE_DIR, "conversions.sqlite")
+        self.max_bytes = max_bytes
+        self._salt = f"{CONVERTER_VERSION}:{conversion_rules_hash()}:".encode('utf-8')
+        self._db: Optional[sqlite3.Connection] = None
+        self._disabled = False
+        # Document keys by content hash, new entries and hits to write on flush
+        self._keys: "OrderedDict[str, str]" = OrderedDict()
+        self._pending: Dict[str, bytes] = {}
+        self._used: Set[str] = set()
 
-            predicate = override["predicate"]
-            if "custom_model_data" in predicate:
-                cmd = int(predicate["custom_model_data"])
-            elif "damage" in predicate:
-                new_format["model"]["property"] = 'damage'
-                cmd = predicate["damage"]
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        # Connected on first use, so a cache created before forking workers is not shared with them
+        if self._db is None and not self._disabled:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._db = sqlite3.connect(self.path, timeout=30)
+                self._db.execute("CREATE TABLE IF NOT EXISTS conversions "
+                                 "(key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)")
+                self._db.execute("CREATE INDEX IF NOT EXISTS conversions_used ON conversions (used)")
+                self._db.commit()
+            except (OSError, sqlite3.Error) as e:
+                log.warning(f"Conversion cache {self.path} is unavailable, converting without it: {e}", path=self.path)
+                self._disable()
+        return self._db
+
+    def _disable(self):
+        self._disabled = True
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _document_key(self, key: str, raw: bytes) -> str:
+        document_key = self._keys.get(key)
+        if document_key is None:
+            document_key = hashlib.sha1(self._salt + json_dumps_canonical(json_loads(raw))).hexdigest()
+            self._keys[key] = document_key
+            if len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+        return document_key
+
+    def _fetch(self, key: str, raw: bytes) -> Optional[bytes]:
+        db = self._connect()
+        if db is None:
+            return None
+        document_key = self._document_key(key, raw)
+        try:
+            row = db.execute("SELECT data FROM conversions WHERE key = ?", (document_key,)).fetchone()
+        except sqlite3.Error as e:
+            log.warning(f"Conversion cache {self.path} is unreadable, converting without it: {e}", path=self.path)
+            self._disable()
+            return None
+        if row is None:
+            return None
+        self._used.add(document_key)
+        return bytes(row[0])
+
+    def _store(self, key: str, raw: bytes, entry: bytes):
+        if not self._disabled:
+            self._pending[self._document_key(key, raw)] = entry
+
+    def flush(self):
+        if not (self._pending or self._used):
+            return
+        db = self._connect()
+        if db is None:
+            return
+        now = time.time()
+        try:
+            with db:
+                db.executemany("INSERT OR REPLACE INTO conversions (key, data, size, used) VALUES (?, ?, ?, ?)",
+                               [(key, entry, len(key) + len(entry), now) for key, entry in self._pending.items()])
+                db.executemany("UPDATE conversions SET used = ? WHERE key = ?",
+                               [(now, key) for key in self._used])
+        except sqlite3.Error as e:
+            log.warning(f"Could not update conversion cache {self.path}: {e}", path=self.path)
+        self._pending.clear()
+        self._used.clear()
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used entries beyond max_bytes.
+
+        Returns:
+            Number of entries removed
+        """
+        db = self._connect()
+        if db is None:
+            return 0
+        try:
+            with db:
+                total = db.execute("SELECT COALESCE(SUM(size), 0) FROM conversions").fetchone()[0]
+                if total <= self.max_bytes:
+                    return 0
+                evicted = []
+                for key, size in db.execute("SELECT key, size FROM conversions ORDER BY used"):
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((key,))
+                    total -= size
+                db.executemany("DELETE FROM conversions WHERE key = ?", evicted)
+        except sqlite3.Error as e:
+            log.warning(f"Could not evict entries from conversion cache {self.path}: {e}", path=self.path)
+            return 0
+        return len(evicted)
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            evicted = self.evict()
+            if evicted:
+                log.debug(f"Evicted {evicted} entries from conversion cache {self.path}", path=self.path)
+            self._db.close()
+            self._db = None
+
+def open_conversion_cache(size: int = CONVERSION_CACHE_SIZE, path: Optional[str] = None) -> ConversionCache:
+    """Conversion cache persisted in path (default cache/conversions.sqlite) up to size megabytes, in memory for 0."""
+    if size > 0:
+        return PersistentConversionCache(path, size * 1024 * 1024)
+    return ConversionCache()
+
+def convert_files(json_files: List[str], store: PackStore,
+                  cache: Optional[ConversionCache] = None) -> List[Tuple[str, Optional[Dict], str]]:
+    """Convert legacy item model files one after another in this process, through cache if given."""
+    results = []
+    for json_file in json_files:
+        try:
+            if cache is not None:
+                converted_data = cache.convert(store.read_bytes(json_file))
             else:
-                continue
+                json_data = store.load(json_file)
+                converted_data = convert_json_format(json_data, compact=False) if has_model_overrides(json_data) else None
+            results.append((json_file, converted_data, ""))
+        except Exception as e:
+            results.append((json_file, None, str(e)))
+    return results
 
-            entry_model = {"type": "model", "model": override["model"]}
-            
-            # Add tints to leather armor models in overrides
-            if is_leather_item:
-                entry_model["tints"] = [{"type": "minecraft:dye", "default": -6265536}]
-                
-            new_format["model"]["entries"].append({
-                "threshold": cmd,
-                "model": entry_model
-            })
+def open_pack_store(input_path: str, output_path: Optional[str] = None, link_mode: str = "copy",
+                    json_style: str = "pretty", io_threads: int = IO_THREADS) -> PackStore:
+    """
+    Open a pack store for a resource pack directory or zip file.
+    
+    Args:
+        input_path: Pack directory, modified in place, or .zip archive
+        output_path: Archive to write when the input is a zip file
+        link_mode: How copied files are materialized in a pack directory
+        json_style: "pretty" or "minified" output of written documents
+        io_threads: Threads writing and copying files into a pack directory
+        
+    Returns:
+        PackStore backed by the matching storage backend
+    """
+    if input_path.lower().endswith('.zip') and os.path.isfile(input_path):
+        return PackStore(ZipBackend(input_path, output_path), json_style)
+    return PackStore(DirectoryBackend(input_path, link_mode, io_threads), json_style)
 
-    return new_format
+def apply_conversion(json_file: str, converted_data: Optional[Dict], out_dir: str, store: PackStore,
+                     savings: Optional[Dict[str, int]] = None) -> bool:
+    """
+    Replace a converted legacy model with its item definition.
 
-def process_directory(input_dir: str) -> bool:
-    """Process directory and convert JSON files"""
-    try:
-        json_files = []
-        models_item_dir = os.path.join(input_dir, "assets", "minecraft", "models", "item")
-        out_dir = os.path.join(input_dir, "assets", "minecraft", "items")
-        os.makedirs(out_dir, exist_ok=True)
+    The definition is compacted here (see compact_range_dispatch); the entries
+    and bytes this saves are added to savings.
+    """
+    store.depend(json_file)
+    if converted_data is None:
+        return False
+
+    out_file = os.path.join(out_dir, os.path.basename(json_file))
+
+    before = json_dumps(converted_data, store.json_style) if savings is not None else b""
+    total, removed = compact_range_dispatch(converted_data.get("model"))
+    if savings is not None:
+        savings["entries"] = savings.get("entries", 0) + total
+        savings["removed"] = savings.get("removed", 0) + removed
+        if removed:
+            savings["bytes"] = savings.get("bytes", 0) + len(before) - len(json_dumps(converted_data, store.json_style))
+
+    store.save(out_file, converted_data)
+    store.remove(json_file)
+    
+    log.verbose(f"Converted: {json_file}", event="converted", path=json_file)
+    return True
+
+def report_plan(store: PackStore, plan_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Show the pending changes of a dry run without applying them.
+
+    Every operation is logged, with a unified diff for updated text files,
+    followed by the totals and the estimated change in disk usage.
+
+    Args:
+        store: Pack store holding the pending changes
+        plan_path: File to write the operations to as JSON
         
-        for root, _, files in os.walk(models_item_dir):
-            json_files.extend(os.path.join(root, f) for f in files if f.lower().endswith('.json'))
+    Returns:
+        The operation plan, see PackStore.plan
+    """
+    operations = store.plan()
+    files = store.pending_files()
+    # Linked copies share their data with the source
+    copies_use_space = getattr(store.backend, "link_mode", "copy") == "copy"
 
-        for json_file in json_files:
+    log.verbose("\nPlanned changes:")
+    totals: Dict[str, int] = {}
+    disk_delta = 0
+    for operation in operations:
+        kind = operation["op"]
+        totals[kind] = totals.get(kind, 0) + 1
+        if kind == "remove":
+            disk_delta -= operation["size"]
+            log.verbose(f"  remove  {operation['path']}", event="plan", **operation)
+            continue
+        if kind == "update":
+            disk_delta += operation["size"] - operation["previous_size"]
+        elif kind != "copy" or copies_use_space:
+            disk_delta += operation["size"]
+
+        source = f" <- {operation['source']}" if "source" in operation else ""
+        log.verbose(f"  {kind:<7} {operation['path']}{source} ({operation['size']} bytes)", event="plan", **operation)
+
+        if kind == "update" and operation["path"].lower().endswith(('.json', '.mcmeta')):
+            path = store.abspath(operation["path"])
             try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    json_data = json.load(f)
+                before = store.backend.read_bytes(path).decode('utf-8').splitlines(keepends=True)
+                after = files[path].decode('utf-8').splitlines(keepends=True)
+            except UnicodeDecodeError:
+                continue
+            diff = "".join(difflib.unified_diff(before, after, f"a/{operation['path']}", f"b/{operation['path']}"))
+            if diff:
+                log.verbose(diff.rstrip("\n"))
 
-                if "overrides" in json_data and any(
-                    "custom_model_data" in o.get("predicate", {}) or 
-                    "damage" in o.get("predicate", {})
-                    for o in json_data.get("overrides", [])):
-                    
-                    converted_data = convert_json_format(json_data)
-                    
-                    out_file = os.path.join(out_dir, os.path.basename(json_file))
+    counts = ", ".join(f"{totals.get(kind, 0)} {kind}" for kind in ("write", "update", "copy", "extract", "remove"))
+    log.summary(f"\nDry run, no files were changed. Planned: {counts}; "
+                f"estimated disk usage change: {disk_delta:+d} bytes",
+                event="plan_complete", operations=len(operations), disk_delta=disk_delta)
 
+    if plan_path:
+        os.makedirs(os.path.dirname(plan_path) or ".", exist_ok=True)
+        with open(plan_path, 'wb') as f:
+            f.write(json_dumps({"operations": operations, "disk_delta": disk_delta}))
+        log.summary(f"Plan written to {plan_path}")
+    return operations
 
-                    with open(out_file, 'w', encoding='utf-8') as f:
-                        json.dump(converted_data, f, indent=2)
-                    
-                    os.remove(json_file)
-                    
-                    print(f"Converted: {json_file}")
+def process_directory(input_dir: str, jobs: int = 1, output_path: Optional[str] = None, manifest_path: Optional[str] = None,
+                      link_mode: str = "copy", dedupe: bool = False, profile_path: Optional[str] = None,
+                      profile_stats_dir: Optional[str] = None, json_style: str = "pretty",
+                      dry_run: bool = False, plan_path: Optional[str] = None, io_threads: int = IO_THREADS,
+                      jar_source: Optional["JarAssetSource"] = None,
+                      conversion_cache: Optional[ConversionCache] = None,
+                      manifest: Optional[UpgradeManifest] = None, backend: Optional[Any] = None) -> bool:
+    """
+    Process directory or zipped pack and convert JSON files.
+
+    With dry_run, the stages only plan their changes: the plan is reported
+    (and written to plan_path) instead of being applied. A jar_source and
+    conversion_cache passed in are shared with other packs and left open. A
+    manifest passed in replaces manifest_path, and a storage backend the one
+    opened for input_dir: a WatchSession keeps both between its passes, an
+    Upgrader runs on a MemoryBackend.
+    """
+    store = None
+    own_jar_source = jar_source is None
+    jar_source = jar_source or JarAssetSource()
+    if profile_path:
+        profiler.start(profile_stats_dir)
+    try:
+        with profiler.stage("convert"):
+            if backend is not None:
+                store = PackStore(backend, json_style)
+            else:
+                store = open_pack_store(input_dir, output_path, link_mode, json_style, io_threads)
+            if manifest is not None:
+                store.manifest = manifest
+            elif manifest_path:
+                store.manifest = UpgradeManifest(manifest_path, manifest_options(json_style))
+            models_item_dir = os.path.join(input_dir, "assets", "minecraft", "models", "item")
+            out_dir = os.path.join(input_dir, "assets", "minecraft", "items")
+
+            json_files = store.list_json(models_item_dir, recursive=True)
+            if store.manifest is not None:
+                # Reuse unchanged conversions before fanning out the rest
+                json_files = [json_file for json_file in json_files
+                              if not store.manifest.reuse(store, f"convert:{store.relpath(json_file)}")[0]]
+
+            cache_hits = conversion_cache.hits if conversion_cache is not None else 0
+            if jobs > 1 and len(json_files) > 1:
+                results = convert_files_parallel(json_files, store, jobs, conversion_cache)
+            else:
+                results = convert_files(json_files, store, conversion_cache)
+            if conversion_cache is not None:
+                conversion_cache.flush()
+                if conversion_cache.hits > cache_hits:
+                    log.summary(f"Reused {conversion_cache.hits - cache_hits} of {len(json_files)} item model "
+                                f"conversions from the conversion cache",
+                                event="conversion_cache", hits=conversion_cache.hits - cache_hits, files=len(json_files))
+
+            savings: Dict[str, int] = {}
+            for json_file, converted_data, error in results:
+                if error:
+                    log.error(f"Error processing {json_file}: {error}", path=json_file)
+                    continue
+
+                if store.manifest is not None:
+                    store.manifest.execute(store, f"convert:{store.relpath(json_file)}",
+                                           lambda: apply_conversion(json_file, converted_data, out_dir, store, savings))
+                else:
+                    apply_conversion(json_file, converted_data, out_dir, store, savings)
+
+            if savings.get("removed"):
+                log.summary(f"Compacted range_dispatch entries: removed {savings['removed']} of {savings['entries']}, "
+                            f"saving {savings['bytes']} bytes",
+                            event="range_dispatch_compacted", entries=savings["entries"],
+                            removed=savings["removed"], bytes_saved=savings["bytes"])
 
-            except Exception as e:
-                print(f"Error processing {json_file}: {e}")
-                continue
         # Process oversized_in_gui property
-        add_oversized_in_gui(input_dir)
+        with profiler.stage("oversized_in_gui"):
+            # One index of every namespace, including the items written by the conversion
+            assets = PackAssets(store, input_dir)
+            add_oversized_in_gui(input_dir, store, assets)
         
         # Migrate blockstate textures to blocks/ folder
-        modified_blocks = migrate_blockstate_textures(input_dir)
+        with profiler.stage("block_textures"):
+            modified_blocks = migrate_blockstate_textures(input_dir, store, assets)
 
         # Migrate item textures to item/ folder
-        modified_items = migrate_item_textures(input_dir)
+        with profiler.stage("item_textures"):
+            modified_items = migrate_item_textures(input_dir, store, jar_source, assets)
+
+        # Point models at one copy of each distinct texture
+        if dedupe:
+            with profiler.stage("dedupe_textures"):
+                dedupe_textures(input_dir, store, jar_source)
+
+        if dry_run:
+            report_plan(store, plan_path)
+            return True
+
+        # Write every modified document once
+        with profiler.stage("write"):
+            if plan_path:
+                report_plan(store, plan_path)
+            store.flush()
+        if isinstance(store.backend, ZipBackend):
+            log.summary(f"Wrote upgraded pack: {store.backend.output_path}")
 
         # Print list of modified files
         if modified_blocks:
-            print("\nModified Block Model Files:")
+            log.verbose("\nModified Block Model Files:")
             for mod_file in modified_blocks:
-                print(f"  - {mod_file}")
+                log.verbose(f"  - {mod_file}")
         if modified_items:
-            print("\nModified Item Model Files:")
+            log.verbose("\nModified Item Model Files:")
             for mod_file in modified_items:
-                print(f"  - {mod_file}")
+                log.verbose(f"  - {mod_file}")
         
         return True
 
-    except Exception as e:
-        print(f"Error processing directory: {e}")
-        return False
+    except Exception as e:
+        log.error(f"Error processing directory: {e}")
+        return False
+
+    finally:
+        if own_jar_source:
+            jar_source.close()
+        if store is not None:
+            store.close()
+        if profile_path:
+            profiler.stop()
+            profiler.write_report(profile_path)
+        log.flush()
+
+def pack_name(input_path: str) -> str:
+    """Name of a pack, the last component of its directory or zip path."""
+    return os.path.basename(os.path.normpath(os.path.abspath(input_path)))
+
+def pack_names(input_paths: List[str]) -> Dict[str, str]:
+    """
+    Names of the packs of a batch, unique within it.
+
+    Packs sharing a directory name, like servers/a/pack and servers/b/pack,
+    get a short hash of their absolute path appended so their per-pack files
+    stay apart.
+
+    Returns:
+        Dictionary mapping each input path to its name
+    """
+    counts = Counter(pack_name(input_path) for input_path in input_paths)
+    names = {}
+    for input_path in input_paths:
+        name = pack_name(input_path)
+        if counts[name] > 1:
+            digest = hashlib.sha1(os.path.abspath(input_path).encode('utf-8')).hexdigest()[:8]
+            name = f"{name}-{digest}"
+        names[input_path] = name
+    return names
+
+def pack_option_path(path: Optional[str], name: str, batch_size: int) -> Optional[str]:
+    """
+    Per-pack variant of a file or directory option when upgrading several packs.
+
+    A single pack uses path unchanged; in a batch the pack name is inserted
+    before the extension, so "profile.json" becomes "profile.<pack>.json".
+    """
+    if not path or batch_size <= 1:
+        return path
+    stem, extension = os.path.splitext(os.path.normpath(path))
+    return f"{stem}.{name}{extension}"
+
+def read_pack_list(path: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    Read the packs of a batch run from a file.
+
+    A .json file holds a list of input paths or of {"input": ..., "output": ...}
+    objects; any other file lists one input path per line, with # comments.
+    Relative paths are resolved against the directory of the file.
+
+    Returns:
+        List of (input path, output path or None)
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    def resolve(entry: Optional[str]) -> Optional[str]:
+        return os.path.join(base_dir, entry) if entry else None
+
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(".json"):
+            packs = []
+            for entry in json.load(f):
+                if isinstance(entry, str):
+                    entry = {"input": entry}
+                packs.append((resolve(entry["input"]), resolve(entry.get("output"))))
+            return packs
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [(resolve(line), None) for line in lines if line]
+
+def run_pack(args: argparse.Namespace, input_path: str, output_path: Optional[str] = None, batch_size: int = 1,
+             jobs: int = 1, jar_source: Optional["JarAssetSource"] = None,
+             conversion_cache: Optional[ConversionCache] = None, name: Optional[str] = None) -> bool:
+    """Upgrade one pack with the command line options, in a run of batch_size packs."""
+    log.summary(f"Input directory: {input_path}")
+    if not os.path.exists(input_path):
+        log.error(f"Input directory '{input_path}' not found", path=input_path)
+        return False
+
+    name = name or pack_name(input_path)
+    manifest_path = pack_option_path(args.manifest, name, batch_size)
+    if args.incremental and not manifest_path:
+        manifest_path = os.path.join(CACHE_DIR, "manifests", f"{name}.json")
+
+    return process_directory(input_path, jobs=jobs, output_path=output_path, manifest_path=manifest_path,
+                             link_mode=args.link_mode, dedupe=args.dedupe_textures,
+                             profile_path=pack_option_path(args.profile, name, batch_size),
+                             profile_stats_dir=pack_option_path(args.profile_stats, name, batch_size),
+                             json_style=args.json_style, dry_run=args.dry_run,
+                             plan_path=pack_option_path(args.plan, name, batch_size),
+                             io_threads=args.io_threads, jar_source=jar_source, conversion_cache=conversion_cache)
+
+# Shared by the packs a batch worker process upgrades, set up by init_pack_worker
+_worker_jar_source: Optional["JarAssetSource"] = None
+_worker_conversion_cache: Optional[ConversionCache] = None
+
+def init_pack_worker(jar_path: Optional[str], conversion_rules: Dict[str, Any], conversion_cache_size: int):
+    """Open the vanilla JAR source and conversion cache of a batch worker process."""
+    global _worker_jar_source, _worker_conversion_cache
+    register_conversion_rules(conversion_rules)
+    _worker_jar_source = JarAssetSource(jar_path or None)
+    # Workers only add to a persistent cache, the parent evicts when the batch is done
+    _worker_conversion_cache = open_conversion_cache(conversion_cache_size)
+
+def upgrade_pack_worker(args: argparse.Namespace, input_path: str, output_path: Optional[str],
+                        batch_size: int, name: str) -> Tuple[bool, str, str]:
+    """
+    Upgrade one pack of a batch inside a worker process.
+
+    The log is captured rather than printed, so the output of packs upgraded
+    at the same time is not interleaved.
+
+    Returns:
+        (success, log output, JSON-lines records)
+    """
+    output = io.StringIO()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        json_path = os.path.join(temp_dir, "log.jsonl") if args.log_json else None
+        with contextlib.redirect_stdout(output):
+            log.configure(args.log_level, json_path)
+            success = run_pack(args, input_path, output_path, batch_size, jar_source=_worker_jar_source,
+                               conversion_cache=_worker_conversion_cache, name=name)
+            log.close()
+        records = ""
+        if json_path:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                records = f.read()
+    return success, output.getvalue(), records
+
+def process_packs(args: argparse.Namespace, packs: List[Tuple[str, Optional[str]]], jobs: int = 1) -> bool:
+    """
+    Upgrade several packs in one run and report the result of each.
+
+    All packs share one vanilla JAR source and conversion cache. With more
+    than one job the packs are upgraded concurrently on worker processes, each
+    converting its models serially; every worker keeps its own JAR handle and
+    cache for the packs it upgrades, loading the index persisted here. The log
+    of each pack is shown as one block, in the order the packs were given.
+
+    Returns:
+        Whether every pack was upgraded
+    """
+    jar_path = get_minecraft_jar_path(download=False)
+    jar_source = JarAssetSource(jar_path or None)
+    # Index the JAR once, before any worker needs it
+    if jar_path and not jar_source.available:
+        log.warning(f"Could not index Minecraft JAR {jar_path}")
+    conversion_cache = open_conversion_cache(args.conversion_cache_size)
+    names = pack_names([input_path for input_path, _ in packs])
+    results: List[Tuple[str, bool]] = []
+    try:
+        if jobs > 1:
+            # Forked workers must not inherit unwritten log records
+            log.flush()
+            with ProcessPoolExecutor(max_workers=min(jobs, len(packs)), initializer=init_pack_worker,
+                                     initargs=(jar_path, conversion_rules_config(),
+                                               args.conversion_cache_size)) as executor:
+                futures = [executor.submit(upgrade_pack_worker, args, input_path, output_path, len(packs),
+                                           names[input_path])
+                           for input_path, output_path in packs]
+                for (input_path, _), future in zip(packs, futures):
+                    try:
+                        success, output, records = future.result()
+                    except Exception as e:
+                        success, output, records = False, "", ""
+                        log.error(f"Error upgrading {input_path}: {e}", path=input_path)
+                    log.replay(output, records)
+                    results.append((input_path, success))
+                    log.summary()
+        else:
+            for input_path, output_path in packs:
+                success = run_pack(args, input_path, output_path, len(packs), jar_source=jar_source,
+                                   conversion_cache=conversion_cache, name=names[input_path])
+                results.append((input_path, success))
+                log.summary()
+    finally:
+        jar_source.close()
+        conversion_cache.close()
+
+    upgraded = sum(success for _, success in results)
+    log.summary(f"Upgraded {upgraded} of {len(results)} packs:")
+    for input_path, success in results:
+        log.summary(f"  - {input_path}: {'upgraded' if success else 'failed'}", path=input_path, success=success)
+
+    if os.environ.get('GITHUB_OUTPUT'):
+        with open(os.environ['GITHUB_OUTPUT'], 'a') as f:
+            f.write(f"results={json.dumps(dict(results))}\n")
+    return upgraded == len(results)
+
+class PollingWatcher:
+    """
+    Reports changed files below a directory by comparing snapshots of their size and mtime.
+
+    The portable fallback of InotifyWatcher; every poll lists the whole tree.
+    """
+
+    kind = "polling"
+
+    def __init__(self, root: str, interval: float = WATCH_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for directory, _, files in os.walk(self.root):
+            snapshot[directory] = (-1, -1)
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout: Optional[float] = None) -> Set[str]:
+        """Wait up to timeout seconds (forever for None) for changes and return the changed paths."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(self.interval if deadline is None else max(0.0, min(self.interval, deadline - time.monotonic())))
+            snapshot = self._scan()
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """
+    Reports changed files below a directory through Linux inotify.
+
+    Every directory of the tree is watched, new directories as they appear.
+    When the kernel queue overflows the root itself is reported as changed.
+    """
+
+    kind = "inotify"
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, root: str):
+        self.root = root
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, str] = {}
+        try:
+            self._watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch_tree(self, root: str):
+        for directory, _, _ in os.walk(root):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+            if wd < 0:
+                # ENOSPC: fs.inotify.max_user_watches is too low for the pack
+                raise OSError(ctypes.get_errno(), f"Could not watch {directory}")
+            self._dirs[wd] = directory
+
+    def read(self, timeout: Optional[float] = None) -> Set[str]:
+        """Wait up to timeout seconds (forever for None) for changes and return the changed paths."""
+        changed: Set[str] = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+                name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b"\0")
+                offset += self.EVENT.size + length
+                if mask & self.IN_Q_OVERFLOW:
+                    changed.add(self.root)
+                    continue
+                if mask & self.IN_IGNORED:
+                    self._dirs.pop(wd, None)
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name)) if name else directory
+                if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    try:
+                        self._watch_tree(path)
+                    except OSError:
+                        changed.add(self.root)
+                changed.add(path)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def open_watcher(root: str):
+    """Watch root with inotify where the platform has it, by polling otherwise."""
+    try:
+        return InotifyWatcher(root)
+    except (OSError, AttributeError) as e:
+        log.debug(f"Watching by polling, inotify is unavailable: {e}")
+        return PollingWatcher(root)
+
+def wait_for_changes(watcher: Any, debounce: float = WATCH_DEBOUNCE) -> Set[str]:
+    """Block until files change, then collect changes until none arrived for debounce seconds."""
+    changed: Set[str] = set()
+    while not changed:
+        changed = watcher.read()
+    while True:
+        more = watcher.read(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+class WatchSession:
+    """
+    Keeps an extracted pack upgraded while it is being edited, see --watch.
+
+    The first pass upgrades the whole pack like --incremental. The storage
+    backend with its index, the manifest, the vanilla JAR and the conversion
+    cache then stay in memory. Every later pass is told which files changed:
+    the fingerprints of all other files are taken from the manifest without
+    touching the disk, so only the conversions and migrations that read or
+    wrote a changed file run again. The manifest file is written when the
+    session is closed.
+    """
+
+    def __init__(self, input_dir: str, manifest_path: str, jobs: int = 1, link_mode: str = "copy",
+                 dedupe: bool = False, json_style: str = "pretty", io_threads: int = IO_THREADS,
+                 jar_source: Optional["JarAssetSource"] = None, conversion_cache: Optional[ConversionCache] = None):
+        self.input_dir = input_dir
+        self.manifest_path = manifest_path
+        self.jobs = jobs
+        self.dedupe = dedupe
+        self.json_style = json_style
+        self.backend = DirectoryBackend(input_dir, link_mode, io_threads)
+        self.manifest = self._open_manifest()
+        self.jar_source = jar_source or JarAssetSource()
+        self.conversion_cache = conversion_cache or ConversionCache()
+        self.passes = 0
+
+    def _open_manifest(self) -> UpgradeManifest:
+        manifest = UpgradeManifest(self.manifest_path, manifest_options(self.json_style))
+        # Written once when the session is closed rather than after every pass
+        manifest.persist = False
+        return manifest
+
+    def own_changes(self, paths: Iterable[str]) -> Set[str]:
+        """
+        Drop the changes the last pass made itself.
+
+        Files are recognized by the size and mtime the manifest recorded
+        after writing them, removed files by their missing fingerprint, and
+        directories by being in the index already.
+        """
+        changed = set()
+        for path in paths:
+            if os.path.isdir(path) and self.backend.is_dir(path):
+                continue
+            stat = self.backend.stat(path)
+            rel = index_relpath(self.input_dir, path)
+            if stat is None and rel in self.manifest.final and self.manifest.final[rel] is None:
+                continue
+            recorded = self.manifest.stats.get(rel)
+            if stat is not None and recorded and tuple(recorded) == stat:
+                continue
+            changed.add(path)
+        return changed
+
+    def upgrade(self, changed: Optional[Iterable[str]] = None) -> bool:
+        """
+        Run one pass.
+
+        Args:
+            changed: Paths changed since the last pass, None to check every file
+
+        Returns:
+            Whether the pass succeeded; after a failure the next pass checks every file
+        """
+        if self.passes:
+            relpaths = None
+            if changed is not None:
+                changed = list(changed)
+                if not any(os.path.isdir(path) or self.backend.is_dir(path) for path in changed):
+                    relpaths = {index_relpath(self.input_dir, path) for path in changed}
+                self.backend.refresh(changed)
+            if relpaths is None:
+                self.backend.refresh([self.backend.assets_dir])
+            self.manifest.advance(relpaths)
+        self.passes += 1
+        success = process_directory(self.input_dir, jobs=self.jobs, dedupe=self.dedupe, json_style=self.json_style,
+                                    io_threads=self.backend.io_threads, jar_source=self.jar_source,
+                                    conversion_cache=self.conversion_cache, manifest=self.manifest,
+                                    backend=self.backend)
+        if not success:
+            # Start over from the last consistent state on disk
+            self.manifest = self._open_manifest()
+            self.backend.refresh([self.backend.assets_dir])
+            self.passes = 0
+        return success
+
+    def close(self):
+        if self.passes:
+            self.manifest.write()
+        self.jar_source.close()
+
+def watch_pack(args: argparse.Namespace, input_path: str, jobs: int = 1,
+               conversion_cache: Optional[ConversionCache] = None) -> bool:
+    """Upgrade a pack directory, then upgrade it again on every change until interrupted."""
+    if not os.path.isdir(input_path):
+        log.error(f"--watch needs an extracted pack directory, not '{input_path}'", path=input_path)
+        return False
+
+    manifest_path = args.manifest or os.path.join(CACHE_DIR, "manifests", f"{pack_name(input_path)}.json")
+    session = WatchSession(input_path, manifest_path, jobs=jobs, link_mode=args.link_mode,
+                           dedupe=args.dedupe_textures, json_style=args.json_style, io_threads=args.io_threads,
+                           conversion_cache=conversion_cache)
+    # Watching starts before the first pass, edits made during it are not missed
+    watcher = open_watcher(session.backend.assets_dir)
+    try:
+        session.upgrade()
+        log.summary(f"\nWatching {session.backend.assets_dir} for changes ({watcher.kind}), press Ctrl+C to stop")
+        log.flush()
+        while True:
+            changed = session.own_changes(wait_for_changes(watcher))
+            if not changed:
+                continue
+            start = time.perf_counter()
+            success = session.upgrade(changed)
+            log.summary(f"{'Upgraded' if success else 'Failed to upgrade'} after {len(changed)} changed files "
+                        f"in {time.perf_counter() - start:.2f}s",
+                        event="watch_pass", changed=len(changed), success=success,
+                        seconds=round(time.perf_counter() - start, 3))
+            log.flush()
+    except KeyboardInterrupt:
+        log.summary("\nStopped watching")
+        return True
+    finally:
+        watcher.close()
+        session.close()
+
+def pack_from_zip(source: Union[bytes, BinaryIO]) -> Dict[str, bytes]:
+    """Read a zipped pack, given as bytes or a binary file object, into {entry name: bytes}."""
+    with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source) as archive:
+        return {info.filename: archive.read(info) for info in archive.infolist() if not info.is_dir()}
+
+def pack_to_zip(files: Mapping[str, bytes]) -> bytes:
+    """Zip a pack held as {entry name: bytes}."""
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in sorted(files.items()):
+            archive.writestr(name, data)
+    return output.getvalue()
+
+class Upgrader:
+    """
+    Upgrades packs held in memory, for services keeping a warm instance.
+
+    A pack is given as a mapping of entry names to bytes, or as a zip archive
+    (bytes or a binary file object). Every stage runs on a MemoryBackend, so
+    the pack is neither extracted nor written to disk. The vanilla asset
+    source and the conversion cache are shared by all packs an instance
+    upgrades: pass a JarAssetSource for a client JAR, a MemoryAssetSource, or
+    nothing to locate the JAR like the command line does. Unless one is
+    given, the conversion cache keeps the CONVERSION_CACHE_ENTRIES most
+    recently used conversions.
+
+    The API is single-threaded per process: upgrades log through the module
+    level log and profiler, so calls to upgrade() from several threads, on
+    one instance or several, run one after the other. Upgrade packs in
+    parallel with one instance per worker process.
+    """
+
+    # Held while an upgrade uses the process-wide log and profiler
+    _lock = threading.Lock()
+
+    def __init__(self, jar_source: Optional[Any] = None, conversion_cache: Optional[ConversionCache] = None,
+                 json_style: str = "pretty", dedupe: bool = False, log_level: str = "summary"):
+        self.jar_source = jar_source if jar_source is not None else JarAssetSource()
+        self.conversion_cache = conversion_cache if conversion_cache is not None else ConversionCache()
+        self.json_style = json_style
+        self.dedupe = dedupe
+        self.log_level = log_level
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def upgrade(self, pack: Union[Mapping[str, bytes], bytes, BinaryIO]) -> Tuple[Dict[str, bytes], Dict[str, Any]]:
+        """
+        Upgrade one pack.
+
+        Returns:
+            Tuple of (upgraded {entry name: bytes}, report). The report holds
+            success, the applied changes (copy, write, update and remove, like
+            the operations of --plan) and the log records down to log_level,
+            as the objects of --log-json
+        """
+        files = pack if isinstance(pack, Mapping) else pack_from_zip(pack)
+        backend = MemoryBackend(files)
+        with Upgrader._lock, log.capture(self.log_level) as records:
+            success = process_directory(backend.root, json_style=self.json_style, dedupe=self.dedupe, io_threads=1,
+                                        jar_source=self.jar_source, conversion_cache=self.conversion_cache,
+                                        backend=backend)
+        return backend.files, {"success": success, "changes": backend.changes, "records": records}
+
+    def close(self):
+        self.jar_source.close()
+        self.conversion_cache.close()
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments, falling back to GitHub Actions inputs."""
+    parser = argparse.ArgumentParser(description="Upgrade Minecraft resource packs to the 1.21.4+ item format.")
+    parser.add_argument("input_paths", nargs="*", metavar="input_path",
+                        default=[os.environ['INPUT_INPUT_PATH']] if os.environ.get('INPUT_INPUT_PATH') else [],
+                        help="Paths of the resource pack directories or .zip files")
+    parser.add_argument("--packs", default=os.environ.get('INPUT_PACKS') or None, metavar="FILE",
+                        help="File listing more packs to upgrade, one path per line or a JSON list "
+                             "of paths or {\"input\": ..., \"output\": ...} objects")
+    parser.add_argument("--output", "-o", default=os.environ.get('INPUT_OUTPUT_PATH') or None,
+                        help="Output archive when the input is a .zip (default: <input>_upgraded.zip)")
+    parser.add_argument("--incremental", action="store_true",
+                        default=(os.environ.get('INPUT_INCREMENTAL') or "").lower() == "true",
+                        help="Only re-process files whose content or dependencies changed since the last run")
+    parser.add_argument("--manifest", default=os.environ.get('INPUT_MANIFEST_PATH') or None,
+                        help="Manifest file for --incremental (default: cache/manifests/<pack name>.json)")
+    parser.add_argument("--jobs", "-j", type=int, default=int(os.environ.get('INPUT_JOBS') or 1),
+                        help="Number of worker processes for model conversion, or for upgrading "
+                             "several packs at once (0 uses every core)")
+    parser.add_argument("--io-threads", type=int, default=int(os.environ.get('INPUT_IO_THREADS') or IO_THREADS),
+                        help=f"Threads copying and writing files into a pack directory (default: {IO_THREADS})")
+    parser.add_argument("--rules", default=os.environ.get('INPUT_CONVERSION_RULES') or None, metavar="FILE",
+                        help="JSON file of extra conversion rules, mapping item ids to a handler "
+                             "(default, damage, dyeable, bow, crossbow or condition) and its options")
+    parser.add_argument("--conversion-cache-size", type=int, metavar="MB",
+                        default=int(os.environ.get('INPUT_CONVERSION_CACHE_SIZE') or CONVERSION_CACHE_SIZE),
+                        help="Size cap of the conversion cache kept in cache/conversions.sqlite across runs, "
+                             f"least recently used entries are evicted beyond it; 0 disables it "
+                             f"(default: {CONVERSION_CACHE_SIZE})")
+    parser.add_argument("--link-mode", choices=LINK_MODES, default=os.environ.get('INPUT_LINK_MODE') or "copy",
+                        help="How textures and models copied within a pack directory are created; "
+                             "unsupported modes fall back to copy (default: copy)")
+    parser.add_argument("--dedupe-textures", action="store_true",
+                        default=(os.environ.get('INPUT_DEDUPE_TEXTURES') or "").lower() == "true",
+                        help="Keep one file per distinct block/item texture and point models at it")
+    parser.add_argument("--json-style", choices=JSON_STYLES, default=os.environ.get('INPUT_JSON_STYLE') or "pretty",
+                        help="Formatting of written JSON: pretty (two-space indent, default) "
+                             "or minified (smallest files, for release packs)")
+    parser.add_argument("--dry-run", action="store_true",
+                        default=(os.environ.get('INPUT_DRY_RUN') or "").lower() == "true",
+                        help="Only show the planned changes, with diffs and the disk usage estimate")
+    parser.add_argument("--plan", default=os.environ.get('INPUT_PLAN_PATH') or None, metavar="PATH",
+                        help="Write the planned operations to PATH as JSON")
+    parser.add_argument("--profile", default=os.environ.get('INPUT_PROFILE') or None, metavar="PATH",
+                        help="Write wall/CPU time, peak memory and I/O counters per stage to PATH as JSON "
+                             "(and to the GitHub step summary); tracing memory slows the run down")
+    parser.add_argument("--profile-stats", default=os.environ.get('INPUT_PROFILE_STATS') or None, metavar="DIR",
+                        help="With --profile, also write cProfile stats per stage to DIR/<stage>.prof")
+    parser.add_argument("--watch", action="store_true",
+                        help="After upgrading, keep watching the pack directory and re-upgrade the files "
+                             "affected by every change until interrupted")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default=os.environ.get('INPUT_LOG_LEVEL') or "verbose",
+                        help="Output detail: quiet (warnings and errors), summary (stage results), "
+                             "verbose (every file, default) or debug")
+    parser.add_argument("--log-json", default=os.environ.get('INPUT_LOG_JSON') or None,
+                        help="Also write the log to this file as JSON lines")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    # Get inputs from GitHub Actions environment variables
+    args = parse_args(argv)
+    packs = [(input_path, args.output) for input_path in args.input_paths if input_path]
+
+    log.configure(args.log_level, args.log_json)
+    if args.packs:
+        packs.extend(read_pack_list(args.packs))
+
+    if not packs:
+        log.error("Input paths are required")
+        log.close()
+        sys.exit(1)
+
+    listed = Counter(os.path.abspath(input_path) for input_path, _ in packs)
+    duplicates = sorted(path for path, count in listed.items() if count > 1)
+    if duplicates:
+        log.error(f"Packs listed more than once: {', '.join(duplicates)}")
+        return False
+
+    if args.rules:
+        try:
+            load_conversion_rules(args.rules)
+        except (OSError, ValueError) as e:
+            log.error(f"Invalid conversion rules in {args.rules}: {e}", path=args.rules)
+            return False
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    if args.watch and (len(packs) > 1 or args.dry_run):
+        log.error("--watch takes a single pack directory and cannot be combined with --dry-run")
+        return False
+
+    if len(packs) == 1:
+        input_path, output_path = packs[0]
+        conversion_cache = open_conversion_cache(args.conversion_cache_size)
+        try:
+            if args.watch:
+                return watch_pack(args, input_path, jobs, conversion_cache)
+            return run_pack(args, input_path, output_path, jobs=jobs, conversion_cache=conversion_cache)
+        finally:
+            conversion_cache.close()
+
+    if args.output:
+        log.error("--output only applies to a single pack, list the outputs of several packs in a --packs file")
+        return False
+    return process_packs(args, packs, jobs)
+
+def split_resource(ref: str) -> Tuple[str, str]:
+    """Split a resource location like "custom:item/foo" into namespace and path; minecraft is the default."""
+    if ":" in ref:
+        namespace, path = ref.split(":", 1)
+        return namespace, path
+    return "minecraft", ref
+
+class PackAssets:
+    """
+    Per-namespace index of a pack's item definitions and block models.
+
+    Built in one pass over assets/*/ from the listings of the pack store, which
+    the backends answer from their own index rather than the disk, so every
+    stage runs over all namespaces instead of only assets/minecraft. The
+    minecraft namespace comes first, the others follow by name.
+    """
 
-def main():
-    # Get inputs from GitHub Actions environment variables
-    input_dir = os.environ.get('INPUT_INPUT_PATH') or sys.argv[1]
+    def __init__(self, store: PackStore, input_dir: str):
+        self.assets_dir = os.path.join(input_dir, "assets")
+        namespaces = store.list_dirs(self.assets_dir)
+        self.namespaces = sorted(namespaces, key=lambda namespace: (namespace != "minecraft", namespace))
+        self.items: Dict[str, List[str]] = {}
+        self.block_models: Dict[str, List[str]] = {}
+        for namespace in self.namespaces:
+            self.items[namespace] = store.list_json(self.path(namespace, "items"))
+            self.block_models[namespace] = store.list_json(self.path(namespace, "models", "block"), recursive=True)
 
-    print(f"Input directory: {input_dir}")
-    
-    if not input_dir:
-        print("::error::Input paths are required")
-        sys.exit(1)
+    def path(self, namespace: str, *parts: str) -> str:
+        """Path of a file or directory inside assets/<namespace>/."""
+        return os.path.join(self.assets_dir, namespace, *parts)
 
-    if not os.path.exists(input_dir):
-        print(f"Error: Input directory '{input_dir}' not found")
-        return False
+    def textures_dir(self, namespace: str) -> str:
+        return self.path(namespace, "textures")
 
-    return process_directory(input_dir)
+    def all_items(self) -> List[str]:
+        """Item definitions of every namespace."""
+        return [item for namespace in self.namespaces for item in self.items[namespace]]
 
-def add_oversized_in_gui(input_dir):
-    """Process all .json files in assets\minecraft\items and add oversized_in_gui property where needed."""
-    items_dir = os.path.join(input_dir, "assets", "minecraft", "items")
+    def all_block_models(self) -> List[str]:
+        """Block models of every namespace."""
+        return [model for namespace in self.namespaces for model in self.block_models[namespace]]
+
+def add_oversized_in_gui(input_dir, store: Optional[PackStore] = None, assets: Optional[PackAssets] = None):
+    """Process the item definitions of every namespace (assets/*/items) and add oversized_in_gui where needed."""
+    own_store = store is None
+    store = store or PackStore()
+    assets = assets or PackAssets(store, input_dir)
     
-    if not os.path.exists(items_dir):
-        print(f"Items directory not found: {items_dir}")
+    json_files = assets.all_items()
+    if not json_files:
+        log.summary(f"Items directory not found: {assets.path('*', 'items')}")
         return
     
-    json_files = glob.glob(os.path.join(items_dir, "*.json"))
-    
     modified_count = 0
     
+    def add_property(file_path):
+        data = store.load(file_path)
+        
+        # Add oversized_in_gui property if it doesn't already exist
+        if 'oversized_in_gui' not in data:
+            data['oversized_in_gui'] = True
+            store.mark_dirty(file_path)
+            
+            log.verbose(f"Modified: {file_path}", event="oversized_in_gui", path=file_path)
+            return True
+        return False
+
     for file_path in json_files:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-                # Add oversized_in_gui property if it doesn't already exist
-                if 'oversized_in_gui' not in data:
-                    data['oversized_in_gui'] = True
-                    
-                    # Write back to file with proper formatting
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        json.dump(data, f, indent='\t', ensure_ascii=False)
-                    
-                    modified_count += 1
-                    print(f"Modified: {file_path}")
+            if store.run_task("oversized", file_path, lambda: add_property(file_path), noop=False):
+                modified_count += 1
     
         except (json.JSONDecodeError, IOError) as e:
-            print(f"Error processing {file_path}: {e}")
+            log.error(f"Error processing {file_path}: {e}", path=file_path)
     
-    print(f"\nProcessed {len(json_files)} files in items directory, modified {modified_count} files.")
+    log.summary(f"\nProcessed {len(json_files)} files in items directory, modified {modified_count} files.",
+                event="oversized_in_gui_complete", processed=len(json_files), modified=modified_count)
 
-def migrate_blockstate_textures(input_dir: str) -> list:
+    if own_store:
+        store.flush()
+
+def migrate_blockstate_textures(input_dir: str, store: Optional[PackStore] = None,
+                                assets: Optional[PackAssets] = None) -> list:
     """
     Migrate block model textures from outside blocks/ folder to blocks/ folder.
     
-    Scans all block model files, checks their textures, and copies textures
+    Scans the block model files of every namespace, checks their textures, and copies textures
     to blocks/ folder while preserving directory structure and updating model references.
     
     Args:
         input_dir: Root directory of the resource pack
+        store: Shared pack store; changes are flushed here when omitted
+        assets: Namespace index of the pack; built from the store when omitted
         
     Returns:
         list: List of modified model file paths
     """
     modified_models = []
+    own_store = store is None
+    store = store or PackStore()
     
     try:
-        models_block_dir = os.path.join(input_dir, "assets", "minecraft", "models", "block")
-        textures_dir = os.path.join(input_dir, "assets", "minecraft", "textures")
-        blocks_texture_dir = os.path.join(textures_dir, "block")
-        
-        # Create blocks texture directory if it doesn't exist
-        os.makedirs(blocks_texture_dir, exist_ok=True)
+        assets = assets or PackAssets(store, input_dir)
         
-        if not os.path.exists(models_block_dir):
-            print(f"Block models directory not found: {models_block_dir}")
-            return modified_models  # Return empty list if directory doesn't exist
+        # Get all block model files of every namespace
+        block_model_files = assets.all_block_models()
+        if not block_model_files:
+            log.summary(f"Block models directory not found: {assets.path('*', 'models', 'block')}")
+            return modified_models  # Return empty list if no namespace has block models
         
         models_modified = 0
         textures_copied = 0
         
-        # Get all block model files recursively
-        block_model_files = []
-        for root, _, files in os.walk(models_block_dir):
-            for file in files:
-                if file.lower().endswith('.json'):
-                    block_model_files.append(os.path.join(root, file))
-        
         for model_path in block_model_files:
             try:
                 # Process the model file
-                modified, copied = process_block_model(model_path, textures_dir, blocks_texture_dir)
+                modified, copied = store.run_task(
+                    "block", model_path,
+                    lambda: process_block_model(model_path, assets.assets_dir, store),
+                    noop=(False, 0))
                 if modified:
                     models_modified += 1
                     modified_models.append(model_path)
                 textures_copied += copied
                     
             except Exception as e:
-                print(f"Error processing block model {model_path}: {e}")
+                log.error(f"Error processing block model {model_path}: {e}", path=model_path)
                 continue
         
-        print(f"\nBlock model texture migration complete:")
-        print(f"  - Processed {len(block_model_files)} block model files")
-        print(f"  - Modified {models_modified} model files")
-        print(f"  - Copied {textures_copied} textures to blocks/ folder")
+        log.summary(f"\nBlock model texture migration complete:\n"
+                    f"  - Processed {len(block_model_files)} block model files\n"
+                    f"  - Modified {models_modified} model files\n"
+                    f"  - Copied {textures_copied} textures to blocks/ folder",
+                    event="block_migration_complete", processed=len(block_model_files),
+                    modified=models_modified, textures_copied=textures_copied)
         
         return modified_models
         
     except Exception as e:
-        print(f"Error in migrate_blockstate_textures: {e}")
+        log.error(f"Error in migrate_blockstate_textures: {e}")
         return modified_models
 
+    finally:
+        if own_store:
+            store.flush()
+
 def extract_model_references(blockstate_data: Dict) -> Set[str]:
     """
     Extract all model references from a blockstate definition.
@@ -400,22 +3061,21 @@ def resolve_model_path(models_dir: str, model_ref: str) -> str:
     
     return model_path
 
-def process_block_model(model_path: str, textures_dir: str, blocks_texture_dir: str) -> tuple[bool, int]:
+def process_block_model(model_path: str, assets_dir: str, store: PackStore) -> tuple[bool, int]:
     """
     Process a block model file, copying textures to blocks/ and updating references.
-    Preserves directory structure when copying textures.
+    Preserves directory structure when copying textures, within the namespace of each texture.
     
     Args:
         model_path: Path to the model JSON file
-        textures_dir: Base textures directory
-        blocks_texture_dir: Target blocks texture directory
+        assets_dir: The pack's assets directory
+        store: Pack store holding the parsed documents
         
     Returns:
         Tuple of (was_modified, textures_copied_count)
     """
     try:
-        with open(model_path, 'r', encoding='utf-8') as f:
-            model_data = json.load(f)
+        model_data = store.load(model_path)
         
         if "textures" not in model_data:
             return False, 0
@@ -429,21 +3089,18 @@ def process_block_model(model_path: str, textures_dir: str, blocks_texture_dir:
                 continue
             
             # Check if texture is outside blocks/ folder
-            # Remove namespace if present
-            texture_path = texture_value
-            if ":" in texture_path:
-                namespace, texture_path = texture_path.split(":", 1)
-            else:
-                namespace = "minecraft"
+            namespace, texture_path = split_resource(texture_value)
             
             # Skip if already in blocks/ or block/ folder
             if texture_path.startswith("block/") or texture_path.startswith("blocks/"):
                 continue
             
+            textures_dir = os.path.join(assets_dir, namespace, "textures")
+            blocks_texture_dir = os.path.join(textures_dir, "block")
             # Try to find the texture file
-            source_texture_path = find_texture_file(textures_dir, texture_path)
+            source_texture_path = find_texture_file(textures_dir, texture_path, store)
             
-            if source_texture_path and os.path.exists(source_texture_path):
+            if source_texture_path:
                 # Preserve directory structure relative to textures_dir
                 # Get the relative path from textures_dir to the source texture
                 rel_texture_path = os.path.relpath(source_texture_path, textures_dir)
@@ -455,21 +3112,18 @@ def process_block_model(model_path: str, textures_dir: str, blocks_texture_dir:
                 # Construct target path preserving subdirectories
                 target_texture_path = os.path.join(blocks_texture_dir, rel_texture_path)
                 
-                # Create subdirectories if needed
-                target_dir = os.path.dirname(target_texture_path)
-                os.makedirs(target_dir, exist_ok=True)
-                
                 # Copy texture if it doesn't already exist
-                if not os.path.exists(target_texture_path):
-                    shutil.copy2(source_texture_path, target_texture_path)
+                if not store.exists(target_texture_path):
+                    store.copy(source_texture_path, target_texture_path)
                     
                     # Copy mcmeta if exists
                     source_mcmeta = source_texture_path + ".mcmeta"
-                    if os.path.exists(source_mcmeta):
-                        shutil.copy2(source_mcmeta, target_texture_path + ".mcmeta")
+                    if store.exists(source_mcmeta):
+                        store.copy(source_mcmeta, target_texture_path + ".mcmeta")
                         
                     textures_copied += 1
-                    print(f"  Copied texture: {texture_path} -> block/{rel_texture_path}")
+                    log.verbose(f"  Copied texture: {texture_path} -> block/{rel_texture_path}", event="copied_texture",
+                                path=target_texture_path, source=source_texture_path)
                 
                 # Update model reference - preserve subdirectories in the new path
                 # Remove .png extension from rel_texture_path
@@ -482,40 +3136,66 @@ def process_block_model(model_path: str, textures_dir: str, blocks_texture_dir:
         
         # Write back modified model
         if modified:
-            with open(model_path, 'w', encoding='utf-8') as f:
-                json.dump(model_data, f, indent=2)
-            print(f"  Updated model: {model_path}")
+            store.mark_dirty(model_path)
+            log.verbose(f"  Updated model: {model_path}", event="updated_model", path=model_path)
         
         return modified, textures_copied
         
     except Exception as e:
-        print(f"Error processing model {model_path}: {e}")
+        log.error(f"Error processing model {model_path}: {e}", path=model_path)
         return False, 0
     
-def migrate_item_textures(input_dir: str) -> list:
-    # Migrate item model textures where it starts with "block/"
+def migrate_item_textures(input_dir: str, store: Optional[PackStore] = None, jar_source: Optional["JarAssetSource"] = None,
+                          assets: Optional[PackAssets] = None) -> list:
+    # Migrate item model textures where it starts with "block/", for the items of every namespace
     modified_models = []
+    own_store = store is None
+    store = store or PackStore()
+    own_jar_source = jar_source is None
+    jar_source = jar_source or JarAssetSource()
     try:
-        item_dir = os.path.join(input_dir, "assets", "minecraft", "items")
-        textures_dir = os.path.join(input_dir, "assets", "minecraft", "textures")
-        items_texture_dir = os.path.join(textures_dir, "item")
-
-        os.makedirs(items_texture_dir, exist_ok=True)
-        items_path = glob.glob(os.path.join(item_dir, "*.json"))
+        assets = assets or PackAssets(store, input_dir)
+        items_path = assets.all_items()
 
         if not items_path:
-            print(f"No item model files found in: {item_dir}")
+            log.summary(f"No item model files found in: {assets.path('*', 'items')}")
             return modified_models
         
         models_modified = 0
         textures_copied = 0
         processed_models = set()  # Track already processed models
+        graph = ModelGraph(store, assets.assets_dir)
+
+        if store.manifest is None:
+            # Extract every vanilla texture the items will need in one pass over the JAR.
+            # Incremental runs replay most items, they keep extracting on demand.
+            try:
+                entries = collect_jar_textures(items_path, store, graph, jar_source)
+                if entries:
+                    log.debug(f"Prefetched {jar_source.prefetch(entries)} vanilla texture entries")
+            except Exception as e:
+                log.warning(f"Could not prefetch vanilla textures, extracting them one by one: {e}")
 
-        items_path = glob.glob(os.path.join(item_dir, "*.json"))
         for item_path in items_path:
-            print(f"Processing item model: {item_path}")
+            log.verbose(f"Processing item model: {item_path}", event="processing_item", path=item_path)
             try:
-                modified_count, copied, modified_model_files = process_item(item_path, textures_dir, items_texture_dir, processed_models)
+                def run_item():
+                    already_processed = set(processed_models)
+                    modified_count, copied, modified_model_files = process_item(item_path, assets.assets_dir, processed_models, store, jar_source, graph)
+                    newly_processed = sorted(processed_models - already_processed)
+                    if store.manifest is not None:
+                        # Results are kept in the manifest, relative to the pack root
+                        modified_model_files = [store.relpath(path) for path in modified_model_files]
+                        newly_processed = [store.relpath(path) for path in newly_processed]
+                    return modified_count, copied, modified_model_files, newly_processed
+
+                modified_count, copied, modified_model_files, newly_processed = store.run_task(
+                    "item", item_path, run_item, noop=(0, 0, [], []))
+                if store.manifest is not None:
+                    modified_model_files = [store.abspath(rel) for rel in modified_model_files]
+                    newly_processed = [store.abspath(rel) for rel in newly_processed]
+                # Models handled by reused items must not be processed again by later items
+                processed_models.update(newly_processed)
                 models_modified += modified_count
                 textures_copied += copied
                 
@@ -523,18 +3203,25 @@ def migrate_item_textures(input_dir: str) -> list:
                 modified_models.extend(modified_model_files)
 
             except Exception as e:
-                print(f"Error processing item model {item_path}: {e}")
+                log.error(f"Error processing item model {item_path}: {e}", path=item_path)
                 continue
 
-        print(f"\nItem model texture migration complete:")
-        print(f"  - Processed {len(items_path)} item files")
-        print(f"  - Modified {len(modified_models)} model files")
-        print(f"  - Copied {textures_copied} item textures")
+        log.summary(f"\nItem model texture migration complete:\n"
+                    f"  - Processed {len(items_path)} item files\n"
+                    f"  - Modified {len(modified_models)} model files\n"
+                    f"  - Copied {textures_copied} item textures",
+                    event="item_migration_complete", processed=len(items_path),
+                    modified=len(modified_models), textures_copied=textures_copied)
 
         return modified_models
     except Exception as e:
-        print(f"Error in migrate_item_textures: {e}")
+        log.error(f"Error in migrate_item_textures: {e}")
         return modified_models
+    finally:
+        if own_jar_source:
+            jar_source.close()
+        if own_store:
+            store.flush()
     
 def extract_model_refs_from_item(item_data: Dict) -> list:
     """
@@ -564,7 +3251,7 @@ def extract_model_refs_from_item(item_data: Dict) -> list:
     
     return model_refs
 
-def copy_block_model_to_item(model_path_rel: str, namespace: str, base_assets_dir: str) -> tuple[str, str, str]:
+def copy_block_model_to_item(model_path_rel: str, namespace: str, base_assets_dir: str, store: PackStore) -> tuple[str, str, str]:
     """
     Copy a block model to the item models directory.
     
@@ -572,6 +3259,7 @@ def copy_block_model_to_item(model_path_rel: str, namespace: str, base_assets_di
         model_path_rel: Relative model path (e.g., "block/stone")
         namespace: Namespace for the model
         base_assets_dir: Base assets directory
+        store: Pack store holding the parsed documents
         
     Returns:
         Tuple of (item_model_path, original_ref, new_ref)
@@ -580,13 +3268,10 @@ def copy_block_model_to_item(model_path_rel: str, namespace: str, base_assets_di
     item_model_path = os.path.join(base_assets_dir, namespace, "models", f"{item_model_rel}.json")
     block_model_path = os.path.join(base_assets_dir, namespace, "models", f"{model_path_rel}.json")
     
-    item_model_dir = os.path.dirname(item_model_path)
-    os.makedirs(item_model_dir, exist_ok=True)
-    
     # Copy the block model to item model if it doesn't exist
-    if not os.path.exists(item_model_path):
-        shutil.copy2(block_model_path, item_model_path)
-        print(f"  Copied block model to item model: {model_path_rel} -> {item_model_rel}")
+    if not store.exists(item_model_path):
+        store.copy(block_model_path, item_model_path)
+        log.verbose(f"  Copied block model to item model: {model_path_rel} -> {item_model_rel}")
     
     # Create reference mappings
     original_ref = f"{namespace}:{model_path_rel}" if namespace != "minecraft" else model_path_rel
@@ -594,61 +3279,50 @@ def copy_block_model_to_item(model_path_rel: str, namespace: str, base_assets_di
     
     return item_model_path, original_ref, new_ref
 
-def collect_model_parent_chain(model_path: str, base_assets_dir: str, processed_models: Set[str], block_to_item_mappings: Dict[str, str]) -> list:
+class ModelGraph:
     """
-    Collect all models in the parent chain of a given model.
-    
-    Args:
-        model_path: Path to the starting model file
-        base_assets_dir: Base assets directory
-        processed_models: Set of already processed model paths
-        block_to_item_mappings: Dictionary to track block->item model mappings
-        
-    Returns:
-        List of model paths to process
+    Parent-link graph of the pack's models, built lazily and memoized for a run.
+
+    Nodes are model paths whose parsed documents live in the pack store, edges
+    are "parent" links. Block parents are redirected to item copies the first
+    time an edge is followed, after which each node caches its resolved chain,
+    so repeated lookups of shared parents are dictionary hits.
     """
-    models_to_process = []
-    current_model_path = model_path
-    visited = set()
-    
-    while current_model_path and current_model_path not in visited:
-        if not os.path.exists(current_model_path):
-            break
-        
-        visited.add(current_model_path)
-        # Only add to process list if not already processed
-        if current_model_path not in processed_models:
-            models_to_process.append(current_model_path)
-        
-        # Check for parent
-        with open(current_model_path, 'r', encoding='utf-8') as f:
-            current_data = json.load(f)
-        
+
+    def __init__(self, store: PackStore, base_assets_dir: str):
+        self.store = store
+        self.base_assets_dir = base_assets_dir
+        self._chains: Dict[str, List[str]] = {}
+        self._paths: Dict[str, str] = {}
+
+    def model_path(self, model_ref: str) -> str:
+        """Resolve a model reference like "custom:item/foo" to its file path."""
+        path = self._paths.get(model_ref)
+        if path is None:
+            namespace, model_path_rel = split_resource(model_ref)
+            path = self._paths[model_ref] = os.path.join(self.base_assets_dir, namespace, "models", f"{model_path_rel}.json")
+        return path
+
+    def _follow_parent(self, model_path: str, block_to_item_mappings: Dict[str, str]) -> str:
+        """Return the path of a model's parent, redirecting block parents to item copies."""
+        current_data = self.store.load(model_path)
         if "parent" not in current_data:
-            break
+            return ""
         
-        parent_ref = current_data["parent"]
         # Parse namespace and path from parent reference
-        if ":" in parent_ref:
-            parent_namespace, parent_path_rel = parent_ref.split(":", 1)
-        else:
-            parent_namespace = "minecraft"
-            parent_path_rel = parent_ref
+        parent_namespace, parent_path_rel = split_resource(current_data["parent"])
         
         # Check if parent is a block model that needs to be copied
         if parent_path_rel.startswith("block/"):
             parent_item_rel = parent_path_rel.replace("block/", "item/", 1)
-            parent_item_path = os.path.join(base_assets_dir, parent_namespace, "models", f"{parent_item_rel}.json")
-            parent_block_path = os.path.join(base_assets_dir, parent_namespace, "models", f"{parent_path_rel}.json")
+            parent_item_path = os.path.join(self.base_assets_dir, parent_namespace, "models", f"{parent_item_rel}.json")
+            parent_block_path = os.path.join(self.base_assets_dir, parent_namespace, "models", f"{parent_path_rel}.json")
             
             # Copy parent block model to item if it doesn't exist
-            if os.path.exists(parent_block_path):
-                parent_item_dir = os.path.dirname(parent_item_path)
-                os.makedirs(parent_item_dir, exist_ok=True)
-                
-                if not os.path.exists(parent_item_path):
-                    shutil.copy2(parent_block_path, parent_item_path)
-                    print(f"  Copied parent block model to item model: {parent_path_rel} -> {parent_item_rel}")
+            if self.store.exists(parent_block_path):
+                if not self.store.exists(parent_item_path):
+                    self.store.copy(parent_block_path, parent_item_path)
+                    log.verbose(f"  Copied parent block model to item model: {parent_path_rel} -> {parent_item_rel}")
                 
                 # Track the mapping
                 original_parent_ref = f"{parent_namespace}:{parent_path_rel}" if parent_namespace != "minecraft" else parent_path_rel
@@ -657,62 +3331,276 @@ def collect_model_parent_chain(model_path: str, base_assets_dir: str, processed_
                 
                 # Update current model's parent reference
                 current_data["parent"] = new_parent_ref
-                with open(current_model_path, 'w', encoding='utf-8') as f:
-                    json.dump(current_data, f, indent=2)
-                print(f"    Updated parent reference in {current_model_path}")
+                self.store.mark_dirty(model_path)
+                log.verbose(f"    Updated parent reference in {model_path}", event="updated_parent", path=model_path)
                 
-                current_model_path = parent_item_path
-            else:
-                current_model_path = os.path.join(base_assets_dir, parent_namespace, "models", f"{parent_path_rel}.json")
-        else:
-            current_model_path = os.path.join(base_assets_dir, parent_namespace, "models", f"{parent_path_rel}.json")
-    
-    return models_to_process
+                return parent_item_path
 
-def download_client_jar(version: str, output_dir: str) -> str:
-    """Download the Minecraft client JAR for a specific version."""
-    print(f"Downloading Minecraft {version} client JAR...")
-    
-    manifest_url = "https://piston-meta.mojang.com/mc/game/version_manifest.json"
-    
-    try:
-        # Fetch version manifest
-        with urllib.request.urlopen(manifest_url) as response:
-            manifest = json.loads(response.read().decode('utf-8'))
-        
-        # Find version url
-        version_url = None
-        for v in manifest["versions"]:
-            if v["id"] == version:
-                version_url = v["url"]
-                break
+        return os.path.join(self.base_assets_dir, parent_namespace, "models", f"{parent_path_rel}.json")
+
+    def parent_chain(self, model_path: str, block_to_item_mappings: Dict[str, str]) -> List[str]:
+        """
+        Resolve a model and all of its existing ancestors.
         
-        if not version_url:
-            print(f"Version {version} not found in manifest")
-            return ""
+        Args:
+            model_path: Path to the starting model file
+            block_to_item_mappings: Dictionary to track block->item model mappings
             
-        # Fetch version details
-        with urllib.request.urlopen(version_url) as response:
-            version_data = json.loads(response.read().decode('utf-8'))
-            
-        client_jar_url = version_data["downloads"]["client"]["url"]
+        Returns:
+            List of model paths, starting with model_path
+        """
+        if model_path in self._chains:
+            return self._chains[model_path]
+
+        walked = []
+        visited = set()
+        tail = []
+        current_model_path = model_path
         
-        # Download jar
-        output_path = os.path.join(output_dir, f"{version}.jar")
-        os.makedirs(output_dir, exist_ok=True)
+        while current_model_path and current_model_path not in visited:
+            if current_model_path in self._chains:
+                # Reuse the memoized chain, stopping where it would loop back
+                for cached_path in self._chains[current_model_path]:
+                    if cached_path in visited:
+                        break
+                    tail.append(cached_path)
+                break
+            if not self.store.exists(current_model_path):
+                break
+            
+            visited.add(current_model_path)
+            walked.append(current_model_path)
+            current_model_path = self._follow_parent(current_model_path, block_to_item_mappings)
+
+        chain = walked + tail
+        if current_model_path in visited:
+            # Parent cycle: suffixes depend on the entry point, only cache the start
+            self._chains[model_path] = chain
+        else:
+            for i, walked_path in enumerate(walked):
+                self._chains[walked_path] = chain[i:]
+        return chain
+
+def collect_model_parent_chain(model_path: str, processed_models: Set[str], block_to_item_mappings: Dict[str, str], graph: ModelGraph) -> list:
+    """
+    Collect all models in the parent chain of a given model.
+    
+    Args:
+        model_path: Path to the starting model file
+        processed_models: Set of already processed model paths
+        block_to_item_mappings: Dictionary to track block->item model mappings
+        graph: Memoized model graph of the pack
         
-        print(f"Downloading from {client_jar_url} to {output_path}")
-        with urllib.request.urlopen(client_jar_url) as response, open(output_path, 'wb') as out_file:
-            shutil.copyfileobj(response, out_file)
+    Returns:
+        List of model paths to process
+    """
+    # Only add to process list if not already processed
+    return [path for path in graph.parent_chain(model_path, block_to_item_mappings) if path not in processed_models]
+
+VERSION_MANIFEST_URL = "https://piston-meta.mojang.com/mc/game/version_manifest.json"
+DOWNLOAD_CHUNK = 1 << 20
+
+def mirror_url(mirror: str, name: str) -> str:
+    """URL of a file in a mirror given as a local directory or a base URL (file://, http://, ...)."""
+    if "://" not in mirror:
+        return "file:" + urllib.request.pathname2url(os.path.join(os.path.abspath(mirror), name))
+    return f"{mirror.rstrip('/')}/{name}"
+
+def fetch_cached(url: str, cache_path: str) -> bytes:
+    """
+    Fetch a document, revalidating a cached copy with ETag/If-Modified-Since.
+
+    The copy is stored at cache_path with its validators next to it. When the
+    server is unreachable the cached copy is used as it is.
+    """
+    meta_path = cache_path + ".meta"
+    request = urllib.request.Request(url)
+    cached = None
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            cached = f.read()
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        if meta.get("etag"):
+            request.add_header("If-None-Match", meta["etag"])
+        if meta.get("last_modified"):
+            request.add_header("If-Modified-Since", meta["last_modified"])
+
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            data = response.read()
+            meta = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+    except OSError as e:
+        # 304 Not Modified arrives as an HTTPError
+        if cached is None:
+            raise
+        if getattr(e, "code", None) != 304:
+            log.warning(f"Could not fetch {url} ({e}), using the cached copy")
+        return cached
+
+    write_atomic(cache_path, data)
+    write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+    return data
+
+def write_atomic(path: str, data: bytes):
+    """Write a file through a temporary file and a rename, so readers never see it half written."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def fetch_version_data(version: str, output_dir: str, mirror: Optional[str] = None) -> Optional[Dict]:
+    """
+    Version JSON of a Minecraft version, holding the client JAR's URL, sha1 and size.
+
+    Version JSONs never change, so a copy kept in output_dir is used without
+    any request. Otherwise it is read from the mirror, or looked up in the
+    (revalidated) version manifest.
+    """
+    version_path = os.path.join(output_dir, f"{version}.json")
+    if os.path.exists(version_path):
+        with open(version_path, 'rb') as f:
+            return json_loads(f.read())
+
+    if mirror:
+        try:
+            with urllib.request.urlopen(mirror_url(mirror, f"{version}.json"), timeout=60) as response:
+                data = response.read()
+        except OSError:
+            # Mirrors may only hold the JAR, which is then used unverified
+            return None
+    else:
+        manifest = json_loads(fetch_cached(VERSION_MANIFEST_URL, os.path.join(output_dir, "version_manifest.json")))
+        version_url = next((v["url"] for v in manifest["versions"] if v["id"] == version), None)
+        if not version_url:
+            raise ValueError(f"Version {version} not found in manifest")
+        with urllib.request.urlopen(version_url, timeout=60) as response:
+            data = response.read()
+
+    write_atomic(version_path, data)
+    return json_loads(data)
+
+def download_file(url: str, output_path: str, sha1: Optional[str] = None, size: Optional[int] = None):
+    """
+    Download url to output_path, resuming an interrupted download.
+
+    Data is written to output_path + ".part", continued with an HTTP Range
+    request when a partial file is left, and only renamed into place once
+    its size and sha1 match. A part that fails verification is deleted.
+    """
+    part_path = output_path + ".part"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if size is not None and offset > size:
+        offset = 0
+
+    request = urllib.request.Request(url)
+    if offset and (size is None or offset < size):
+        request.add_header("Range", f"bytes={offset}-")
+    if size is None or offset < size:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            # Servers ignoring the range send the whole file again
+            resumed = offset and getattr(response, "status", None) == 206
+            if offset and not resumed:
+                offset = 0
+            if resumed:
+                log.summary(f"Resuming download at {offset} bytes")
+            with open(part_path, 'ab' if resumed else 'wb') as out_file:
+                shutil.copyfileobj(response, out_file, DOWNLOAD_CHUNK)
+
+    digest = hashlib.sha1()
+    with open(part_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK), b""):
+            digest.update(chunk)
+    actual_size = os.path.getsize(part_path)
+    if (size is not None and actual_size != size) or (sha1 and digest.hexdigest() != sha1):
+        os.remove(part_path)
+        raise ValueError(f"Downloaded file does not match its checksum "
+                         f"(size {actual_size}, expected {size}; sha1 {digest.hexdigest()}, expected {sha1})")
+    os.replace(part_path, output_path)
+
+@contextlib.contextmanager
+def download_lock(path: str):
+    """Hold an exclusive lock while downloading to path, so concurrent runs wait for one download."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def download_client_jar(version: str, output_dir: str, mirror: Optional[str] = None) -> str:
+    """
+    Download and verify the Minecraft client JAR for a specific version.
+
+    Args:
+        version: Minecraft version
+        output_dir: Cache directory for the JAR, its version JSON and the version manifest
+        mirror: Local directory or base URL holding <version>.jar (and <version>.json
+            for verification); defaults to MINECRAFT_JAR_MIRROR. Mojang is not
+            contacted when a mirror is used
+
+    Returns:
+        Path of the JAR, or "" if it could not be downloaded
+    """
+    mirror = mirror or os.environ.get('MINECRAFT_JAR_MIRROR') or None
+    output_path = os.path.join(output_dir, f"{version}.jar")
+    log.summary(f"Downloading Minecraft {version} client JAR...")
+    
+    try:
+        with download_lock(output_path):
+            # Another run may have finished the download while we waited
+            if cached_jar_valid(version, output_dir):
+                return output_path
+
+            version_data = fetch_version_data(version, output_dir, mirror)
+            client = version_data["downloads"]["client"] if version_data else {}
+            client_jar_url = mirror_url(mirror, f"{version}.jar") if mirror else client["url"]
+            if not client.get("sha1"):
+                log.warning(f"No checksum for the Minecraft {version} JAR, it is used unverified")
+
+            log.summary(f"Downloading from {client_jar_url} to {output_path}")
+            download_file(client_jar_url, output_path, client.get("sha1"), client.get("size"))
             
-        print("Download complete")
+        log.summary("Download complete")
         return output_path
         
     except Exception as e:
-        print(f"Error downloading Minecraft JAR: {e}")
+        log.error(f"Error downloading Minecraft JAR: {e}")
         return ""
 
-def get_minecraft_jar_path() -> str:
+def cached_jar_valid(version: str, output_dir: str) -> bool:
+    """
+    Check a cached client JAR against the size in its cached version JSON.
+
+    JARs are only renamed into the cache once verified; this catches files
+    truncated by older versions of the upgrader, which are removed. Without
+    a usable version JSON the JAR must at least be a readable ZIP file.
+    """
+    jar_path = os.path.join(output_dir, f"{version}.jar")
+    if not os.path.exists(jar_path):
+        return False
+    try:
+        with open(os.path.join(output_dir, f"{version}.json"), 'rb') as f:
+            size = json_loads(f.read())["downloads"]["client"].get("size")
+    except (OSError, ValueError, KeyError, TypeError):
+        complete = zipfile.is_zipfile(jar_path)
+    else:
+        complete = size is None or os.path.getsize(jar_path) == size
+    if not complete:
+        log.warning(f"Cached Minecraft JAR {jar_path} is incomplete, downloading it again")
+        os.remove(jar_path)
+        return False
+    return True
+
+def get_minecraft_jar_path(download: bool = True) -> str:
     """Try to locate the Minecraft client JAR file."""
     # Check environment variable first
     env_path = os.environ.get('MINECRAFT_JAR_PATH')
@@ -720,59 +3608,371 @@ def get_minecraft_jar_path() -> str:
         return env_path
         
     # Check local cache
-    cache_dir = "cache"
-    cached_jar = os.path.join(cache_dir, f"{MINECRAFT_VERSION}.jar")
-    if os.path.exists(cached_jar):
+    cached_jar = os.path.join(CACHE_DIR, f"{MINECRAFT_VERSION}.jar")
+    if cached_jar_valid(MINECRAFT_VERSION, CACHE_DIR):
         return cached_jar
         
     # Download if not found
-    return download_client_jar(MINECRAFT_VERSION, cache_dir)
+    if not download:
+        return ""
+    return download_client_jar(MINECRAFT_VERSION, CACHE_DIR)
 
-def extract_texture_from_jar(jar_path: str, texture_path: str, output_path: str, is_mcmeta: bool = False) -> bool:
-    """Extract a texture file from the Minecraft JAR."""
-    try:
-        # Texture path in jar is typically assets/minecraft/textures/...
-        # texture_path input is like "block/stone"
-        
+class MappedFile(mmap.mmap):
+    """Read-only memory map usable as a zipfile file object."""
+
+    def seekable(self) -> bool:
+        return True
+
+class VanillaAssetIndex:
+    """
+    Persisted listing of the vanilla textures, mcmeta files and models in a client JAR.
+
+    Each entry records where its data lives in the JAR (local header offset,
+    compressed size, size, compression method and CRC), so lookups never touch
+    the JAR and reads can seek straight to the entry. The index is stored per
+    Minecraft version and rebuilt when the JAR it describes changes.
+    """
+
+    FORMAT = 1
+
+    def __init__(self, version: str, entries: Dict[str, list], jar_size: int = 0, jar_mtime: float = 0):
+        self.version = version
+        self.entries = entries
+        self.jar_size = jar_size
+        self.jar_mtime = jar_mtime
+
+    @staticmethod
+    def path_for(version: str) -> str:
+        return os.path.join(CACHE_DIR, f"{version}.index.json")
+
+    @staticmethod
+    def is_indexed(name: str) -> bool:
+        """Whether a JAR entry belongs in the index."""
+        parts = name.split("/", 3)
+        if len(parts) != 4 or parts[0] != "assets":
+            return False
+        if parts[2] == "textures":
+            return name.endswith(".png") or name.endswith(".png.mcmeta")
+        return parts[2] == "models" and name.endswith(".json")
+
+    @classmethod
+    def build(cls, archive: zipfile.ZipFile, jar_path: str, version: str) -> "VanillaAssetIndex":
+        """Index the assets of an open client JAR."""
+        entries = {
+            info.filename: [info.header_offset, info.compress_size, info.file_size, info.compress_type, info.CRC]
+            for info in archive.infolist() if cls.is_indexed(info.filename)
+        }
+        stat = os.stat(jar_path)
+        return cls(version, entries, stat.st_size, stat.st_mtime)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["VanillaAssetIndex"]:
+        """Load a persisted index, or None if it is missing or unreadable."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("format") != cls.FORMAT:
+                return None
+            return cls(data["version"], data["entries"], data["jar_size"], data["jar_mtime"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "format": self.FORMAT,
+                "version": self.version,
+                "jar_size": self.jar_size,
+                "jar_mtime": self.jar_mtime,
+                "entries": self.entries
+            }, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    def matches(self, jar_path: str) -> bool:
+        """Check that the index describes the JAR at jar_path."""
+        try:
+            stat = os.stat(jar_path)
+        except OSError:
+            return False
+        return stat.st_size == self.jar_size and stat.st_mtime == self.jar_mtime
+
+class JarAssetSource:
+    """
+    Read-only view of the vanilla assets in the Minecraft client JAR.
+
+    Existence checks are answered from the persisted VanillaAssetIndex. The JAR
+    itself is only located, downloaded and memory-mapped once an entry actually
+    has to be read, and then stays open for the rest of the run; reads seek
+    straight to the indexed entry instead of re-parsing the central directory.
+    """
+
+    def __init__(self, jar_path: Optional[str] = None, version: str = MINECRAFT_VERSION):
+        self.jar_path = jar_path
+        self.version = version
+        self.index: Optional[VanillaAssetIndex] = None
+        self._opened = False
+        self._file = None
+        self._mmap: Optional[MappedFile] = None
+        self._prefetched: Dict[str, bytes] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open_jar(self) -> bool:
+        if self._opened:
+            return self._mmap is not None
+        self._opened = True
+
+        jar_path = self.jar_path or get_minecraft_jar_path()
+        if not jar_path:
+            return False
+
+        try:
+            self._file = open(jar_path, 'rb')
+            self._mmap = MappedFile(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception as e:
+            log.error(f"Error opening Minecraft JAR {jar_path}: {e}")
+            self.close()
+            return False
+
+        self.jar_path = jar_path
+        if self.index is None or not self.index.matches(jar_path):
+            self._build_index()
+        return True
+
+    def _build_index(self):
+        with zipfile.ZipFile(self._mmap) as archive:
+            self.index = VanillaAssetIndex.build(archive, self.jar_path, self.version)
+        try:
+            self.index.save(VanillaAssetIndex.path_for(self.version))
+        except OSError as e:
+            log.warning(f"Could not save vanilla asset index: {e}")
+
+    def _load_index(self) -> bool:
+        if self.index is not None:
+            return True
+
+        jar_path = self.jar_path or get_minecraft_jar_path(download=False)
+        index = VanillaAssetIndex.load(VanillaAssetIndex.path_for(self.version))
+        # A stored index is trusted on its own while the JAR is not available locally
+        if index is not None and (not jar_path or index.matches(jar_path)):
+            self.index = index
+            return True
+
+        return self._open_jar() and self.index is not None
+
+    @property
+    def available(self) -> bool:
+        """Whether vanilla assets could be indexed."""
+        return self._load_index()
+
+    @staticmethod
+    def texture_entry(texture_path: str, is_mcmeta: bool = False) -> str:
+        """Map a texture reference like "block/stone" to its JAR entry name."""
         if ":" in texture_path:
             namespace, path = texture_path.split(":", 1)
-            if namespace != "minecraft":
-                return False
         else:
-            path = texture_path
-            
+            namespace, path = "minecraft", texture_path
         extension = ".png.mcmeta" if is_mcmeta else ".png"
-        jar_entry = f"assets/minecraft/textures/{path}{extension}"
+        return f"assets/{namespace}/textures/{path}{extension}"
+
+    def has_entry(self, name: str) -> bool:
+        """Check whether the JAR contains an indexed entry."""
+        return self._load_index() and name in self.index.entries
+
+    def has_texture(self, texture_path: str, is_mcmeta: bool = False) -> bool:
+        """Check whether vanilla ships a texture."""
+        return self.has_entry(self.texture_entry(texture_path, is_mcmeta))
+
+    def _raw_entry(self, name: str) -> Tuple[bytes, Tuple]:
+        """Slice the stored (possibly compressed) data of an indexed entry out of the mapped JAR."""
+        entry = self.index.entries[name]
+        offset, compress_size = entry[0], entry[1]
+        header = struct.unpack(zipfile.structFileHeader, self._mmap[offset:offset + zipfile.sizeFileHeader])
+        start = (offset + zipfile.sizeFileHeader
+                 + header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH])
+        return self._mmap[start:start + compress_size], entry
+
+    def _inflate(self, name: str, data: bytes, entry: Tuple) -> bytes:
+        """Decompress and check the raw data of an entry."""
+        _, _, file_size, compress_type, crc = entry
+        if compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -15)
+        elif compress_type != zipfile.ZIP_STORED:
+            with zipfile.ZipFile(self._mmap) as archive:
+                data = archive.read(name)
+
+        if len(data) != file_size or zlib.crc32(data) != crc:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for {name} in {self.jar_path}")
+        return data
+
+    def read_entry(self, name: str) -> Optional[bytes]:
+        """Read an indexed JAR entry, or None if the JAR does not contain it."""
+        if name in self._prefetched:
+            return self._prefetched.pop(name)
+        if not self.has_entry(name) or not self._open_jar():
+            return None
+        if name not in self.index.entries:
+            return None
+
+        data = self._inflate(name, *self._raw_entry(name))
+        profiler.count("jar_extractions")
+        return data
+
+    def prefetch(self, names: Iterable[str], threads: int = IO_THREADS) -> int:
+        """
+        Extract many entries in one pass, ahead of the read_entry calls for them.
+
+        The entries are sliced from the mapped JAR in archive offset order, so
+        the file is read sequentially, and inflated on a thread pool (zlib
+        releases the GIL). Each prefetched entry is handed out once by
+        read_entry and then dropped. Unknown names are ignored.
+
+        Returns:
+            Number of entries extracted
+        """
+        names = {name for name in names if name not in self._prefetched and self.has_entry(name)}
+        if not names or not self._open_jar():
+            return 0
+        ordered = sorted((name for name in names if name in self.index.entries),
+                         key=lambda name: self.index.entries[name][0])
+        raw = [(name, *self._raw_entry(name)) for name in ordered]
+
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+            for name, data in zip(ordered, executor.map(lambda item: self._inflate(*item), raw)):
+                self._prefetched[name] = data
+        profiler.count("jar_extractions", len(ordered))
+        return len(ordered)
+
+    def read_texture(self, texture_path: str, is_mcmeta: bool = False) -> Optional[bytes]:
+        """Read a vanilla texture, or None if the JAR does not contain it."""
+        return self.read_entry(self.texture_entry(texture_path, is_mcmeta))
+
+    def close(self):
+        """Release the memory map and file handle."""
+        self._prefetched.clear()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class MemoryAssetSource:
+    """
+    Vanilla assets held in memory, a stand-in for JarAssetSource.
+
+    entries maps JAR entry names ("assets/minecraft/textures/...") to their
+    contents, e.g. loaded once by a service from its own storage, so an
+    Upgrader needs no client JAR on disk.
+    """
+
+    texture_entry = staticmethod(JarAssetSource.texture_entry)
+
+    def __init__(self, entries: Mapping[str, bytes]):
+        self.entries = dict(entries)
+
+    @classmethod
+    def from_zip(cls, source: Union[bytes, BinaryIO]) -> "MemoryAssetSource":
+        """Load the entries a JarAssetSource would index from a client JAR given as bytes or a file object."""
+        with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source) as archive:
+            return cls({info.filename: archive.read(info) for info in archive.infolist()
+                        if VanillaAssetIndex.is_indexed(info.filename)})
+
+    @property
+    def available(self) -> bool:
+        return bool(self.entries)
+
+    def has_entry(self, name: str) -> bool:
+        return name in self.entries
+
+    def has_texture(self, texture_path: str, is_mcmeta: bool = False) -> bool:
+        return self.has_entry(self.texture_entry(texture_path, is_mcmeta))
+
+    def read_entry(self, name: str) -> Optional[bytes]:
+        return self.entries.get(name)
+
+    def prefetch(self, names: Iterable[str], threads: int = IO_THREADS) -> int:
+        # Everything is in memory already
+        return 0
+
+    def read_texture(self, texture_path: str, is_mcmeta: bool = False) -> Optional[bytes]:
+        return self.read_entry(self.texture_entry(texture_path, is_mcmeta))
+
+    def close(self):
+        pass
+
+def collect_jar_textures(items_path: List[str], store: PackStore, graph: ModelGraph, jar_source: JarAssetSource) -> Set[str]:
+    """
+    Find the JAR entries process_model_textures will extract for a set of items.
+
+    Walks the models of every item and their parents without changing them,
+    collecting the block/ textures the pack does not ship, with their .mcmeta.
+    Block models stand in for the item copies made of them later, which share
+    their textures.
+    
+    Args:
+        items_path: Paths of the item definitions
+        store: Pack store holding the parsed documents
+        graph: Model graph resolving model references
+        jar_source: Vanilla assets the entries are named for
         
-        with zipfile.ZipFile(jar_path, 'r') as jar:
+    Returns:
+        Set of JAR entry names that exist in the vanilla index
+    """
+    entries = set()
+    visited = set()
+    for item_path in items_path:
+        try:
+            pending = extract_model_refs_from_item(store.load(item_path))
+        except (ValueError, OSError):
+            continue
+        while pending:
+            model_ref = pending.pop()
+            if model_ref in visited:
+                continue
+            visited.add(model_ref)
             try:
-                # Check if file exists in jar
-                jar.getinfo(jar_entry)
-                
-                # Create output directory
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                
-                # Extract
-                with jar.open(jar_entry) as source, open(output_path, 'wb') as target:
-                    shutil.copyfileobj(source, target)
-                return True
-            except KeyError:
-                return False
-                
-    except Exception as e:
-        if not is_mcmeta:
-            print(f"Error extracting from JAR: {e}")
-        return False
+                model_data = store.load(graph.model_path(model_ref))
+            except (ValueError, OSError):
+                continue
+            if not isinstance(model_data, dict):
+                continue
+            if isinstance(model_data.get("parent"), str):
+                pending.append(model_data["parent"])
+            textures = model_data.get("textures")
+            if not isinstance(textures, dict):
+                continue
+            for texture_value in textures.values():
+                if not isinstance(texture_value, str):
+                    continue
+                namespace, texture_path = split_resource(texture_value)
+                if not texture_path.startswith("block/"):
+                    continue
+                if find_texture_file(os.path.join(graph.base_assets_dir, namespace, "textures"), texture_path, store):
+                    continue
+                jar_texture = texture_path if namespace == "minecraft" else texture_value
+                for is_mcmeta in (False, True):
+                    entry = jar_source.texture_entry(jar_texture, is_mcmeta)
+                    if jar_source.has_entry(entry):
+                        entries.add(entry)
+    return entries
 
-def process_model_textures(model_data: Dict, textures_dir: str, items_texture_dir: str, block_to_item_mappings: Dict[str, str]) -> tuple[bool, int]:
+def process_model_textures(model_data: Dict, assets_dir: str, block_to_item_mappings: Dict[str, str], store: PackStore, jar_source: JarAssetSource) -> tuple[bool, int]:
     """
-    Process textures in a model, migrating block/ textures to item/ folder.
+    Process textures in a model, migrating block/ textures to the item/ folder of their namespace.
     
     Args:
         model_data: Parsed model JSON data
-        textures_dir: Base textures directory
-        items_texture_dir: Target items texture directory
+        assets_dir: The pack's assets directory
         block_to_item_mappings: Dictionary of block->item model mappings
+        store: Pack store holding the parsed documents
+        jar_source: Vanilla textures used when the pack lacks a texture
         
     Returns:
         Tuple of (was_modified, textures_copied_count)
@@ -790,7 +3990,7 @@ def process_model_textures(model_data: Dict, textures_dir: str, items_texture_di
         if normalized_parent in block_to_item_mappings:
             model_data["parent"] = block_to_item_mappings[normalized_parent]
             model_modified = True
-            print(f"    Updated parent reference: {parent_ref} -> {model_data['parent']}")
+            log.verbose(f"    Updated parent reference: {parent_ref} -> {model_data['parent']}")
     
     # Check each texture in the model
     if "textures" in model_data:
@@ -799,11 +3999,7 @@ def process_model_textures(model_data: Dict, textures_dir: str, items_texture_di
                 continue
             
             # Parse texture reference
-            texture_path = texture_value
-            if ":" in texture_path:
-                tex_namespace, texture_path = texture_path.split(":", 1)
-            else:
-                tex_namespace = "minecraft"
+            tex_namespace, texture_path = split_resource(texture_value)
             
             # Check if texture starts with "block/"
             if not texture_path.startswith("block/"):
@@ -811,44 +4007,51 @@ def process_model_textures(model_data: Dict, textures_dir: str, items_texture_di
             
             # Remove "block/" prefix to get the relative path
             rel_path = texture_path[6:]  # Remove "block/"
+            textures_dir = os.path.join(assets_dir, tex_namespace, "textures")
+            items_texture_dir = os.path.join(textures_dir, "item")
+            # Vanilla lookups name the namespace, so custom textures never resolve to minecraft ones
+            jar_texture = texture_path if tex_namespace == "minecraft" else f"{tex_namespace}:{texture_path}"
             
             # Find the source texture file
-            source_texture_path = find_texture_file(textures_dir, texture_path)
+            source_texture_path = find_texture_file(textures_dir, texture_path, store)
             
             # Copy texture file if it exists in the resource pack
-            if source_texture_path and os.path.exists(source_texture_path):
+            if source_texture_path:
                 # Construct target path in items folder, preserving structure
                 target_texture_path = os.path.join(items_texture_dir, rel_path + ".png")
                 
-                # Create subdirectories if needed
-                target_dir = os.path.dirname(target_texture_path)
-                os.makedirs(target_dir, exist_ok=True)
-                
                 # Copy texture if it doesn't already exist
-                if not os.path.exists(target_texture_path):
-                    shutil.copy2(source_texture_path, target_texture_path)
+                if not store.exists(target_texture_path):
+                    store.copy(source_texture_path, target_texture_path)
                     
                     # Copy mcmeta if exists
                     source_mcmeta = source_texture_path + ".mcmeta"
-                    if os.path.exists(source_mcmeta):
-                        shutil.copy2(source_mcmeta, target_texture_path + ".mcmeta")
+                    if store.exists(source_mcmeta):
+                        store.copy(source_mcmeta, target_texture_path + ".mcmeta")
                         
                     textures_copied += 1
-                    print(f"    Copied texture: {texture_path} -> item/{rel_path}")
+                    log.verbose(f"    Copied texture: {texture_path} -> item/{rel_path}", event="copied_texture",
+                                path=target_texture_path, source=source_texture_path)
             else:
                 # Try to extract from JAR if it's a block texture
-                jar_path = get_minecraft_jar_path()
-                if jar_path:
-                    # Construct target path in items folder
-                    target_texture_path = os.path.join(items_texture_dir, rel_path + ".png")
-                    
-                    if not os.path.exists(target_texture_path):
-                        if extract_texture_from_jar(jar_path, texture_path, target_texture_path):
-                            # Try to extract mcmeta as well
-                            extract_texture_from_jar(jar_path, texture_path, target_texture_path + ".mcmeta", is_mcmeta=True)
-                            
-                            textures_copied += 1
-                            print(f"    Extracted texture from JAR: {texture_path} -> item/{rel_path}")
+                # Construct target path in items folder
+                target_texture_path = os.path.join(items_texture_dir, rel_path + ".png")
+                
+                if not store.exists(target_texture_path):
+                    texture_data = jar_source.read_texture(jar_texture)
+                    if texture_data is not None:
+                        store.write_bytes(target_texture_path, texture_data,
+                                          origin=f"jar:{jar_source.texture_entry(jar_texture)}")
+
+                        # Try to extract mcmeta as well
+                        mcmeta_data = jar_source.read_texture(jar_texture, is_mcmeta=True)
+                        if mcmeta_data is not None:
+                            store.write_bytes(target_texture_path + ".mcmeta", mcmeta_data,
+                                              origin=f"jar:{jar_source.texture_entry(jar_texture, is_mcmeta=True)}")
+                        
+                        textures_copied += 1
+                        log.verbose(f"    Extracted texture from JAR: {texture_path} -> item/{rel_path}", event="extracted_texture",
+                                    path=target_texture_path)
             
             # Update model reference to point to item/ folder (even if texture wasn't copied)
             # This handles vanilla textures and textures from other resource pack layers
@@ -880,7 +4083,7 @@ def update_item_references(item_data: Dict, block_to_item_mappings: Dict[str, st
             if normalized_model in block_to_item_mappings:
                 fallback["model"] = block_to_item_mappings[normalized_model]
                 item_data_modified = True
-                print(f"  Updated item fallback reference: {original_model} -> {fallback['model']}")
+                log.verbose(f"  Updated item fallback reference: {original_model} -> {fallback['model']}")
         
         # Update models in entries
         entries = item_data["model"].get("entries", [])
@@ -893,26 +4096,27 @@ def update_item_references(item_data: Dict, block_to_item_mappings: Dict[str, st
                     if normalized_model in block_to_item_mappings:
                         entry_model["model"] = block_to_item_mappings[normalized_model]
                         item_data_modified = True
-                        print(f"  Updated item entry reference: {original_model} -> {entry_model['model']}")
+                        log.verbose(f"  Updated item entry reference: {original_model} -> {entry_model['model']}")
     
     return item_data_modified
 
-def process_item(item_path: str, textures_dir: str, items_texture_dir: str, processed_models: Set[str]) -> tuple[int, int, list]:
+def process_item(item_path: str, assets_dir: str, processed_models: Set[str], store: PackStore, jar_source: JarAssetSource, graph: Optional[ModelGraph] = None) -> tuple[int, int, list]:
     """
     Process an item file and migrate any block/ textures referenced in its models.
     
     Args:
         item_path: Path to the item JSON file
-        textures_dir: Base textures directory
-        items_texture_dir: Target items texture directory
+        assets_dir: The pack's assets directory, holding every namespace
         processed_models: Set of already processed model paths to avoid duplicate processing
+        store: Pack store holding the parsed documents
+        jar_source: Vanilla textures used when the pack lacks a texture
+        graph: Model graph shared between items; a private one is used when omitted
         
     Returns:
         Tuple of (models_modified_count, textures_copied, list_of_modified_model_files)
     """
     try:
-        with open(item_path, 'r', encoding='utf-8') as f:
-            item_data = json.load(f)
+        item_data = store.load(item_path)
         
         if "model" not in item_data:
             return 0, 0, []
@@ -927,41 +4131,34 @@ def process_item(item_path: str, textures_dir: str, items_texture_dir: str, proc
         if not model_refs:
             return 0, 0, []
         
-        print(f"  Found {len(model_refs)} model references to process")
+        log.verbose(f"  Found {len(model_refs)} model references to process")
         
-        # Base directory for models - supports both minecraft and custom namespaces
-        # textures_dir is typically: .../assets/minecraft/textures
-        # We need to go up to the assets directory
-        base_assets_dir = os.path.dirname(os.path.dirname(textures_dir))
+        graph = graph or ModelGraph(store, assets_dir)
         
         # Track block->item model mappings for updating references
         block_to_item_mappings = {}
         
         for model_ref in model_refs:
             # Parse namespace and path from model reference
-            if ":" in model_ref:
-                namespace, model_path_rel = model_ref.split(":", 1)
-            else:
-                namespace = "minecraft"
-                model_path_rel = model_ref
+            namespace, model_path_rel = split_resource(model_ref)
             
             # Model references are paths like "item/diamond" which map to models/item/diamond.json
             # Construct the full model path: assets/{namespace}/models/{path}.json
-            model_path = os.path.join(base_assets_dir, namespace, "models", f"{model_path_rel}.json")
+            model_path = graph.model_path(model_ref)
             
-            if not os.path.exists(model_path):
-                print(f"  Model not found: {model_path}")
+            if not store.exists(model_path):
+                log.verbose(f"  Model not found: {model_path}", event="model_not_found", path=model_path)
                 continue
             
             # Check if this is a block model - if so, create a copy in item/models instead
             is_block_model = model_path_rel.startswith("block/")
             if is_block_model:
-                model_path, original_ref, new_ref = copy_block_model_to_item(model_path_rel, namespace, base_assets_dir)
+                model_path, original_ref, new_ref = copy_block_model_to_item(model_path_rel, namespace, assets_dir, store)
                 block_to_item_mappings[original_ref] = new_ref
             
             # Process the model file and its parent chain
             try:
-                models_to_process = collect_model_parent_chain(model_path, base_assets_dir, processed_models, block_to_item_mappings)
+                models_to_process = collect_model_parent_chain(model_path, processed_models, block_to_item_mappings, graph)
                 
                 if not models_to_process:
                     continue
@@ -970,23 +4167,21 @@ def process_item(item_path: str, textures_dir: str, items_texture_dir: str, proc
                 for process_model_path in models_to_process:
                     # Mark as processed
                     processed_models.add(process_model_path)
-                    with open(process_model_path, 'r', encoding='utf-8') as f:
-                        model_data = json.load(f)
+                    model_data = store.load(process_model_path)
                     
                     # Process textures and parent references
-                    model_modified, copied = process_model_textures(model_data, textures_dir, items_texture_dir, block_to_item_mappings)
+                    model_modified, copied = process_model_textures(model_data, assets_dir, block_to_item_mappings, store, jar_source)
                     textures_copied += copied
                     
                     # Write back modified model file
                     if model_modified:
-                        with open(process_model_path, 'w', encoding='utf-8') as f:
-                            json.dump(model_data, f, indent=2)
+                        store.mark_dirty(process_model_path)
                         models_modified += 1
                         modified_model_files.append(process_model_path)
-                        print(f"    Updated model: {process_model_path}")
+                        log.verbose(f"    Updated model: {process_model_path}", event="updated_model", path=process_model_path)
                         
             except Exception as e:
-                print(f"  Error processing model chain for {model_path}: {e}")
+                log.error(f"Error processing model chain for {model_path}: {e}", path=model_path)
                 continue
         
         # Update item file references if any block models were remapped
@@ -995,42 +4190,145 @@ def process_item(item_path: str, textures_dir: str, items_texture_dir: str, proc
             
             # Write back modified item file if needed
             if item_data_modified:
-                with open(item_path, 'w', encoding='utf-8') as f:
-                    json.dump(item_data, f, indent=2)
-                print(f"  Updated item file: {item_path}")
+                store.mark_dirty(item_path)
+                log.verbose(f"  Updated item file: {item_path}", event="updated_item", path=item_path)
         
         return models_modified, textures_copied, modified_model_files
         
     except Exception as e:
-        print(f"Error processing item {item_path}: {e}")
+        log.error(f"Error processing item {item_path}: {e}", path=item_path)
         return 0, 0, []
 
-def find_texture_file(textures_dir: str, texture_path: str) -> str:
+def dedupe_textures(input_dir: str, store: Optional[PackStore] = None, jar_source: Optional[JarAssetSource] = None) -> tuple[int, int, int]:
+    """
+    Keep one file per distinct texture in the block/ and item/ texture folders.
+
+    Textures are grouped per namespace and folder by the hash of their PNG and
+    .mcmeta bytes. The textures maps of every model are pointed at the first
+    file of each group and the other files are removed. Textures overriding a
+    vanilla texture are never removed, vanilla models reference them by name.
+    
+    Args:
+        input_dir: Root directory of the resource pack
+        store: Shared pack store; changes are flushed here when omitted
+        jar_source: Vanilla assets, used to recognise overridden textures
+        
+    Returns:
+        Tuple of (textures_removed, models_modified, bytes_saved)
+    """
+    own_store = store is None
+    store = store or PackStore()
+    own_jar_source = jar_source is None
+    jar_source = jar_source or JarAssetSource()
+    assets_dir = os.path.join(input_dir, "assets")
+
+    def is_vanilla(namespace: str, texture_path: str) -> bool:
+        # Without the vanilla index every minecraft texture may be an override
+        return namespace == "minecraft" and (not jar_source.available or jar_source.has_texture(texture_path))
+
+    def dedupe():
+        groups: Dict[Tuple[str, str, str, str], List[str]] = {}
+        sizes: Dict[str, int] = {}
+        for namespace in store.list_dirs(assets_dir):
+            textures_dir = os.path.join(assets_dir, namespace, "textures")
+            for folder in ("block", "item"):
+                for path in store.list_files(os.path.join(textures_dir, folder), recursive=True, extension=".png"):
+                    texture_path = os.path.relpath(path, textures_dir)[:-4].replace(os.sep, "/")
+                    data = store.read_bytes(path)
+                    mcmeta = store.read_bytes(path + ".mcmeta") if store.exists(path + ".mcmeta") else b""
+                    key = (namespace, folder, hashlib.sha1(data).hexdigest(), hashlib.sha1(mcmeta).hexdigest())
+                    groups.setdefault(key, []).append(texture_path)
+                    sizes[texture_path] = len(data) + len(mcmeta)
+
+        # (namespace, duplicate texture path) -> canonical texture path
+        canonical: Dict[Tuple[str, str], str] = {}
+        bytes_saved = 0
+        for (namespace, _, _, _), texture_paths in groups.items():
+            if len(texture_paths) < 2:
+                continue
+            kept = [path for path in texture_paths if is_vanilla(namespace, path)] or texture_paths[:1]
+            for texture_path in texture_paths:
+                if texture_path in kept:
+                    continue
+                canonical[(namespace, texture_path)] = kept[0]
+                path = os.path.join(assets_dir, namespace, "textures", f"{texture_path}.png")
+                store.remove(path)
+                if store.exists(path + ".mcmeta"):
+                    store.remove(path + ".mcmeta")
+                bytes_saved += sizes[texture_path]
+                log.verbose(f"  Deduplicated texture: {namespace}:{texture_path} -> {namespace}:{kept[0]}")
+
+        models_modified = 0
+        if canonical:
+            for namespace in store.list_dirs(assets_dir):
+                for model_path in store.list_json(os.path.join(assets_dir, namespace, "models"), recursive=True):
+                    try:
+                        textures = store.load(model_path).get("textures")
+                    except (ValueError, OSError, AttributeError):
+                        continue
+                    if not isinstance(textures, dict):
+                        continue
+
+                    modified = False
+                    for texture_key, texture_value in list(textures.items()):
+                        if not isinstance(texture_value, str) or texture_value.startswith("#"):
+                            continue
+                        if ":" in texture_value:
+                            tex_namespace, texture_path = texture_value.split(":", 1)
+                        else:
+                            tex_namespace, texture_path = "minecraft", texture_value
+                        if (tex_namespace, texture_path) in canonical:
+                            prefix = texture_value[:-len(texture_path)]
+                            textures[texture_key] = prefix + canonical[(tex_namespace, texture_path)]
+                            modified = True
+
+                    if modified:
+                        store.mark_dirty(model_path)
+                        models_modified += 1
+
+        return len(canonical), models_modified, bytes_saved
+
+    try:
+        textures_removed, models_modified, bytes_saved = store.run_task("dedupe", assets_dir, dedupe, noop=(0, 0, 0))
+
+        log.summary(f"\nTexture deduplication complete:\n"
+                    f"  - Removed {textures_removed} duplicate textures\n"
+                    f"  - Modified {models_modified} model files\n"
+                    f"  - Saved {bytes_saved} bytes",
+                    event="dedupe_complete", removed=textures_removed, modified=models_modified, bytes_saved=bytes_saved)
+
+        return textures_removed, models_modified, bytes_saved
+    finally:
+        if own_jar_source:
+            jar_source.close()
+        if own_store:
+            store.flush()
+
+def find_texture_file(textures_dir: str, texture_path: str, store: Optional[PackStore] = None) -> str:
     """
     Find a texture file given a relative texture path.
     
     Args:
         textures_dir: Base textures directory
         texture_path: Relative texture path (e.g., "item/diamond" or "entity/creeper")
+        store: Pack store, so textures copied earlier in the run are found
         
     Returns:
         Absolute path to texture file if found, empty string otherwise
     """
+    exists = store.exists if store else os.path.exists
+
     # Try with .png extension
     possible_path = os.path.join(textures_dir, f"{texture_path}.png")
-    if os.path.exists(possible_path):
+    if exists(possible_path):
         return possible_path
     
     # Try without extension (in case it's already there)
     possible_path = os.path.join(textures_dir, texture_path)
-    if os.path.exists(possible_path):
+    if exists(possible_path):
         return possible_path
     
-    # Try with .png.mcmeta (animated texture)
-    possible_path = os.path.join(textures_dir, f"{texture_path}.png.mcmeta")
-    if os.path.exists(possible_path.replace(".png.mcmeta", ".png")):
-        return possible_path.replace(".png.mcmeta", ".png")
-    
+    # Animated textures (.png.mcmeta) resolve to the .png checked above
     return ""
 
 if __name__ == '__main__':
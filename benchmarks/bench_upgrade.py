@@ -0,0 +1,342 @@
+"""
+Benchmarks for the resource pack upgrader.
+
+Generates a synthetic pack, times every stage of an upgrade and compares the
+median timings against a stored baseline, failing when a stage got
+significantly slower. Timings are divided by a fixed calibration workload
+first, so a baseline recorded on one machine can gate runs on another: a
+pure-Python one for the conversion, and one writing, listing and reading
+small JSON files for the stages working on the pack directory.
+
+    python benchmarks/bench_upgrade.py                    # print timings
+    python benchmarks/bench_upgrade.py --check            # fail on regressions
+    python benchmarks/bench_upgrade.py --update-baseline  # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import upgrade
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+DEFAULT_SIZES = {
+    "items": 1000,
+    "overrides": 10,
+    "bows": 10,
+    "chain_depth": 8,
+    "block_models": 200,
+    "textures": 5000,
+}
+
+STAGES = ("convert_json_format", "process_directory", "add_oversized_in_gui",
+          "migrate_blockstate_textures", "migrate_item_textures")
+# Calibration workload each stage is scaled by
+STAGE_WORKLOADS = {"convert_json_format": "cpu"}
+# Times the item models are converted, so the stage runs long enough to be measured reliably
+CONVERT_ROUNDS = 20
+
+def write_file(root: str, rel: str, data):
+    path = os.path.join(root, *rel.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if isinstance(data, bytes):
+        with open(path, 'wb') as f:
+            f.write(data)
+    else:
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+def generate_pack(root: str, items: int = 1000, overrides: int = 10, bows: int = 10, chain_depth: int = 8,
+                  block_models: int = 200, textures: int = 5000) -> str:
+    """
+    Write a synthetic legacy pack and a matching fake client JAR.
+
+    Args:
+        root: Directory to create the pack in
+        items: Legacy item models with custom_model_data overrides
+        overrides: Overrides per item
+        bows: Bow and crossbow models, each with pulling states
+        chain_depth: Length of the parent chain below every override model
+        block_models: Block models with textures outside block/
+        textures: Number of textures shipped by the pack
+
+    Returns:
+        Path of the fake client JAR holding the vanilla textures
+    """
+    assets = "assets/minecraft"
+    textures = max(textures, 1)
+
+    def texture(i: int) -> str:
+        return f"custom/tex_{i % textures}"
+
+    for i in range(textures):
+        write_file(root, f"{assets}/textures/custom/tex_{i}.png", b"\x89PNG" + i.to_bytes(4, "big"))
+        if i % 10 == 0:
+            write_file(root, f"{assets}/textures/custom/tex_{i}.png.mcmeta", {"animation": {"frametime": 2}})
+
+    # Shared parent chains, ending in block models with block/ textures
+    for depth in range(chain_depth):
+        for k in range(overrides):
+            parent = f"item/chain/c{depth + 1}_{k}" if depth + 1 < chain_depth else f"block/base_{k}"
+            write_file(root, f"{assets}/models/item/chain/c{depth}_{k}.json",
+                       {"parent": parent, "textures": {"layer0": texture(depth * overrides + k)}})
+    for k in range(overrides):
+        write_file(root, f"{assets}/models/block/base_{k}.json",
+                   {"textures": {"0": f"block/vanilla_{k}", "1": texture(k)}, "elements": []})
+
+    for i in range(items):
+        write_file(root, f"{assets}/models/item/item_{i}.json", {
+            "parent": "item/generated",
+            "textures": {"layer0": f"item/item_{i}"},
+            "overrides": [{"predicate": {"custom_model_data": k + 1}, "model": f"item/custom/item_{i}_{k}"}
+                          for k in range(overrides)],
+        })
+        for k in range(overrides):
+            parent = f"item/chain/c0_{k}" if chain_depth else f"block/base_{k}"
+            write_file(root, f"{assets}/models/item/custom/item_{i}_{k}.json",
+                       {"parent": parent, "textures": {"layer0": texture(i * overrides + k)}})
+
+    for i in range(bows):
+        kind = "crossbow" if i % 2 else "bow"
+        base = f"item/{kind}_{i}"
+        group = []
+        for k in range(overrides):
+            group.append({"predicate": {"custom_model_data": k + 1}, "model": f"{base}_{k}"})
+            for pull in (0.0, 0.65, 0.9):
+                group.append({"predicate": {"custom_model_data": k + 1, "pulling": 1, "pull": pull},
+                              "model": f"{base}_{k}_pulling"})
+            if kind == "crossbow":
+                group.append({"predicate": {"custom_model_data": k + 1, "charged": 1}, "model": f"{base}_{k}_arrow"})
+        write_file(root, f"{assets}/models/item/{kind}_{i}.json",
+                   {"textures": {"layer0": f"item/{kind}"}, "overrides": group})
+
+    for i in range(block_models):
+        write_file(root, f"{assets}/models/block/model_{i}.json", {
+            "parent": "block/cube_all",
+            "textures": {"all": texture(i), "side": f"block/vanilla_{i % max(overrides, 1)}"},
+        })
+
+    jar_path = os.path.join(root, os.pardir, "client.jar")
+    with zipfile.ZipFile(jar_path, 'w') as jar:
+        for k in range(max(overrides, 1)):
+            jar.writestr(f"assets/minecraft/textures/block/vanilla_{k}.png", b"\x89PNG vanilla")
+    return os.path.abspath(jar_path)
+
+def calibrate_cpu() -> float:
+    """Time a fixed pure-Python workload."""
+    document = {"textures": {f"layer{i}": f"item/texture_{i}" for i in range(20)},
+                "overrides": [{"predicate": {"custom_model_data": i}, "model": f"item/m_{i}"} for i in range(50)]}
+
+    def walk(value):
+        # Rebuild the document in Python, the way the conversion walks item models
+        if isinstance(value, dict):
+            return {str(key): walk(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [walk(item) for item in value]
+        return value.replace("item/", "minecraft:item/") if isinstance(value, str) else value
+
+    start = time.perf_counter()
+    for _ in range(1500):
+        walk(document)
+    return time.perf_counter() - start
+
+def calibrate_io(work_dir: str) -> float:
+    """Time rewriting, listing, reading and parsing a fixed set of small JSON files."""
+    root = tempfile.mkdtemp(prefix="calibrate-", dir=work_dir)
+    document = {"parent": "item/generated", "textures": {"layer0": "item/texture"}}
+
+    def write_files():
+        for i in range(2000):
+            with open(os.path.join(root, f"{i}.json"), 'w') as f:
+                json.dump(document, f, indent=2)
+
+    try:
+        # Creating files is far noisier than rewriting them, so that is left out
+        write_files()
+        start = time.perf_counter()
+        write_files()
+        for _ in range(3):
+            for entry in os.scandir(root):
+                os.stat(entry.path)
+                with open(entry.path) as f:
+                    json.load(f)
+        return time.perf_counter() - start
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def calibrate(work_dir: str) -> Dict[str, float]:
+    """Time the calibration workloads, the units benchmark timings are expressed in."""
+    return {"cpu": calibrate_cpu(), "io": calibrate_io(work_dir)}
+
+def time_stages(pack_dir: str, jar_path: str) -> Dict[str, float]:
+    """Upgrade pack_dir once, timing each stage of process_directory."""
+    timings = {}
+    originals = {name: getattr(upgrade, name) for name in STAGES[2:]}
+
+    def timed(name, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+        return wrapper
+
+    documents = []
+    models_dir = os.path.join(pack_dir, "assets", "minecraft", "models", "item")
+    for name in sorted(os.listdir(models_dir)):
+        if name.endswith(".json"):
+            with open(os.path.join(models_dir, name)) as f:
+                documents.append(json.load(f))
+    start = time.perf_counter()
+    for _ in range(CONVERT_ROUNDS):
+        for document in documents:
+            upgrade.convert_json_format(document)
+    timings["convert_json_format"] = time.perf_counter() - start
+
+    previous_jar = os.environ.get("MINECRAFT_JAR_PATH")
+    os.environ["MINECRAFT_JAR_PATH"] = jar_path
+    try:
+        for name, func in originals.items():
+            setattr(upgrade, name, timed(name, func))
+        start = time.perf_counter()
+        if not upgrade.process_directory(pack_dir):
+            raise RuntimeError(f"Upgrading {pack_dir} failed")
+        timings["process_directory"] = time.perf_counter() - start
+    finally:
+        for name, func in originals.items():
+            setattr(upgrade, name, func)
+        if previous_jar is None:
+            os.environ.pop("MINECRAFT_JAR_PATH", None)
+        else:
+            os.environ["MINECRAFT_JAR_PATH"] = previous_jar
+    return timings
+
+def run_benchmark(sizes: Dict[str, int], repeat: int = 5, log_level: str = "quiet") -> Dict:
+    """
+    Generate a pack and time its upgrade, keeping the median of several runs.
+
+    Returns:
+        Dictionary with the sizes, the calibration times and per-stage seconds
+    """
+    work_dir = tempfile.mkdtemp(prefix="upgrade-bench-")
+    cache_dir = upgrade.CACHE_DIR
+    upgrade.CACHE_DIR = os.path.join(work_dir, "cache")
+    upgrade.log.configure(log_level)
+    try:
+        source = os.path.join(work_dir, "source")
+        jar_path = generate_pack(source, **sizes)
+        # Calibrate before and after every run and keep the median, like the stages
+        runs: Dict[str, List[float]] = {}
+        calibrations: Dict[str, List[float]] = {}
+
+        def sample_calibration():
+            for workload, seconds in calibrate(work_dir).items():
+                calibrations.setdefault(workload, []).append(seconds)
+
+        for run in range(repeat):
+            sample_calibration()
+            pack_dir = os.path.join(work_dir, f"pack_{run}")
+            shutil.copytree(source, pack_dir)
+            for stage, seconds in time_stages(pack_dir, jar_path).items():
+                runs.setdefault(stage, []).append(seconds)
+            shutil.rmtree(pack_dir)
+            sample_calibration()
+        return {"sizes": sizes,
+                "calibration": {workload: statistics.median(seconds) for workload, seconds in calibrations.items()},
+                "stages": {stage: statistics.median(seconds) for stage, seconds in runs.items()}}
+    finally:
+        upgrade.log.configure()
+        upgrade.CACHE_DIR = cache_dir
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def stage_scale(results: Dict, baseline: Dict, stage: str) -> float:
+    """Factor from baseline to result timings of a stage, by the calibration workload it is scaled with."""
+    workload = STAGE_WORKLOADS.get(stage, "io")
+    return results["calibration"][workload] / baseline["calibration"][workload]
+
+def compare(results: Dict, baseline: Dict, tolerance: float = 0.5, noise: float = 0.005) -> List[str]:
+    """
+    Find stages that got slower than the baseline allows.
+
+    Timings are compared in calibration units. A stage regresses when it is
+    more than tolerance slower and the difference exceeds the noise floor:
+    noise seconds, or a tenth of the expected time for longer stages.
+
+    Returns:
+        Description of every regression, empty when there are none
+    """
+    regressions = []
+    for stage, baseline_seconds in baseline["stages"].items():
+        if stage not in results["stages"]:
+            continue
+        seconds = results["stages"][stage]
+        expected = baseline_seconds * stage_scale(results, baseline, stage)
+        if seconds > expected * (1 + tolerance) and seconds - expected > max(noise, 0.1 * expected):
+            regressions.append(f"{stage}: {seconds:.3f}s, expected at most {expected * (1 + tolerance):.3f}s "
+                               f"({seconds / expected - 1:+.0%})")
+    return regressions
+
+def load_baseline(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the resource pack upgrader on a synthetic pack.")
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per stage, the median is kept")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline timings file")
+    parser.add_argument("--check", action="store_true", help="Exit with an error when a stage regressed")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these timings as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown (0.5 = 50%%)")
+    parser.add_argument("--log-level", choices=upgrade.LOG_LEVELS, default="quiet",
+                        help="Output of the upgrader while benchmarking")
+    args = parser.parse_args(argv)
+
+    sizes = {name: getattr(args, name) for name in DEFAULT_SIZES}
+    results = run_benchmark(sizes, args.repeat, args.log_level)
+
+    baseline = load_baseline(args.baseline)
+    comparable = (baseline is not None and baseline.get("sizes") == sizes
+                  and isinstance(baseline.get("calibration"), dict))
+    print(f"Calibration: {results['calibration']['cpu']:.3f}s cpu, {results['calibration']['io']:.3f}s io")
+    for stage in STAGES:
+        line = f"{stage:30} {results['stages'][stage]:8.3f}s"
+        if comparable and stage in baseline["stages"]:
+            line += f"  (baseline {baseline['stages'][stage] * stage_scale(results, baseline, stage):.3f}s)"
+        print(line)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not comparable:
+        print("No baseline for these sizes, nothing to compare against")
+        return 1 if args.check else 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"::error::Benchmark regression in {regression}")
+    if not regressions:
+        print("No regressions against the baseline")
+    return 1 if regressions and args.check else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
 import pytest
 import json
-from app.upgrade import convert_json_format, process_directory
+import os
+from app.upgrade import (convert_json_format, process_directory, PackStore, JarAssetSource, ModelGraph, DirectoryBackend,
+                         dedupe_textures)
 
 @pytest.fixture
 def damage_item_json():
@@ -96,6 +98,28 @@ def test_damage_based_conversion(damage_item_json):
     assert result["model"]["entries"][1]["threshold"] == 0.50
     assert result["model"]["entries"][1]["model"]["model"] == "item/diamond_sword_damaged_2"
 
+def test_conversion_compacts_range_dispatch_entries():
+    from app import upgrade
+
+    overrides = [(5, "item/b"), (1, "item/a"), (2, "item/a"), (3, "item/a"), (5, "item/c"), (9, "item/stick"),
+                 (4, "item/b")]
+    result = convert_json_format({
+        "textures": {"layer0": "item/stick"},
+        "overrides": [{"predicate": {"custom_model_data": cmd}, "model": model} for cmd, model in overrides]
+    })
+    # Sorted, the later duplicate threshold wins and runs of one model collapse to their first threshold
+    assert [(entry["threshold"], entry["model"]["model"]) for entry in result["model"]["entries"]] == [
+        (1, "item/a"), (4, "item/b"), (5, "item/c"), (9, "item/stick")]
+
+    uncompacted = convert_json_format({
+        "textures": {"layer0": "item/stick"},
+        "overrides": [{"predicate": {"custom_model_data": 1}, "model": "minecraft:item/stick"},
+                      {"predicate": {"custom_model_data": 2}, "model": "item/a"}]
+    }, compact=False)
+    assert upgrade.compact_range_dispatch(uncompacted["model"]) == (2, 1)
+    # An entry equal to the fallback changes nothing below the next threshold
+    assert [entry["threshold"] for entry in uncompacted["model"]["entries"]] == [2]
+
 def test_process_directory(tmp_path):
     # Create test directory structure
     assets_dir = tmp_path / "assets" / "minecraft" / "models" / "item"
@@ -142,4 +166,724 @@ def test_invalid_json_handling(tmp_path):
 
 def test_empty_directory(tmp_path):
     result = process_directory(str(tmp_path))
-    assert result == True
\ No newline at end of file
+    assert result == True
+
+def test_pack_store_defers_writes_until_flush(tmp_path):
+    source = tmp_path / "source.json"
+    source.write_text(json.dumps({"parent": "block/a"}))
+
+    store = PackStore()
+    store.copy(str(source), str(tmp_path / "copy" / "target.json"))
+    data = store.load(str(source))
+    data["parent"] = "item/a"
+    store.mark_dirty(str(source))
+
+    # Nothing touches the disk before the flush
+    assert json.loads(source.read_text()) == {"parent": "block/a"}
+    assert store.exists(str(tmp_path / "copy" / "target.json"))
+    assert str(source) in store.list_json(str(tmp_path))
+
+    assert store.flush() == 2
+    assert json.loads(source.read_text()) == {"parent": "item/a"}
+    # Copies see the file as it was when the copy was requested
+    assert json.loads((tmp_path / "copy" / "target.json").read_text()) == {"parent": "block/a"}
+
+
+def test_process_directory_parallel_matches_serial(tmp_path):
+    outputs = []
+    for name, jobs in (("serial", 1), ("parallel", 2)):
+        assets_dir = tmp_path / name / "assets" / "minecraft" / "models" / "item"
+        assets_dir.mkdir(parents=True)
+        for i in range(6):
+            with open(assets_dir / f"sword_{i}.json", "w") as f:
+                json.dump({
+                    "textures": {"layer0": f"item/sword_{i}"},
+                    "overrides": [{"predicate": {"custom_model_data": i}, "model": f"item/custom_{i}"}]
+                }, f)
+        (assets_dir / "broken.json").write_text("invalid json content")
+
+        assert process_directory(str(tmp_path / name), jobs=jobs) == True
+        items_dir = tmp_path / name / "assets" / "minecraft" / "items"
+        outputs.append({p.name: p.read_text() for p in sorted(items_dir.iterdir())})
+        assert (assets_dir / "broken.json").exists()
+
+    assert outputs[0] == outputs[1]
+    assert len(outputs[0]) == 6
+
+
+def test_process_zipped_pack(tmp_path):
+    import zipfile
+
+    pack_zip = tmp_path / "pack.zip"
+    with zipfile.ZipFile(pack_zip, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("pack.mcmeta", json.dumps({"pack": {"pack_format": 46}}))
+        archive.writestr("assets/minecraft/models/item/diamond_sword.json", json.dumps({
+            "textures": {"layer0": "item/diamond_sword"},
+            "overrides": [{"predicate": {"custom_model_data": 1}, "model": "item/custom_sword"}]
+        }))
+        archive.writestr("assets/minecraft/textures/item/custom.png", b"\x89PNG" + b"\0" * 64)
+
+    output_zip = tmp_path / "out.zip"
+    assert process_directory(str(pack_zip), output_path=str(output_zip)) == True
+
+    with zipfile.ZipFile(output_zip) as archive:
+        assert archive.testzip() is None
+        names = set(archive.namelist())
+        assert "assets/minecraft/items/diamond_sword.json" in names
+        assert "assets/minecraft/models/item/diamond_sword.json" not in names
+        assert archive.read("assets/minecraft/textures/item/custom.png") == b"\x89PNG" + b"\0" * 64
+        assert archive.getinfo("pack.mcmeta").compress_type == zipfile.ZIP_DEFLATED
+
+    # The input archive is left untouched
+    with zipfile.ZipFile(pack_zip) as archive:
+        assert "assets/minecraft/models/item/diamond_sword.json" in archive.namelist()
+
+
+def test_jar_asset_source_indexes_textures(tmp_path, monkeypatch):
+    import zipfile
+    from app import upgrade
+
+    monkeypatch.setattr(upgrade, "CACHE_DIR", str(tmp_path / "cache"))
+    jar_path = tmp_path / "client.jar"
+    with zipfile.ZipFile(jar_path, "w", zipfile.ZIP_DEFLATED) as jar:
+        jar.writestr("assets/minecraft/textures/block/stone.png", b"stone" * 20)
+        jar.writestr("assets/minecraft/textures/block/water_still.png.mcmeta", b"{}")
+        jar.writestr("assets/minecraft/models/block/stone.json", b"{}")
+        jar.writestr("net/minecraft/Main.class", b"")
+
+    with JarAssetSource(str(jar_path), version="test") as source:
+        assert source.available
+        assert source.has_texture("block/stone")
+        assert source.has_texture("minecraft:block/water_still", is_mcmeta=True)
+        assert not source.has_texture("block/missing")
+        assert source.read_texture("block/stone") == b"stone" * 20
+        assert source.read_texture("custom:block/stone") is None
+        assert set(source.index.entries) == {
+            "assets/minecraft/textures/block/stone.png",
+            "assets/minecraft/textures/block/water_still.png.mcmeta",
+            "assets/minecraft/models/block/stone.json",
+        }
+
+    # Later runs answer lookups from the persisted index without opening the JAR
+    assert (tmp_path / "cache" / "test.index.json").exists()
+    monkeypatch.setattr(JarAssetSource, "_open_jar", lambda self: pytest.fail("JAR opened"))
+    source = JarAssetSource(str(jar_path), version="test")
+    assert source.has_texture("block/stone")
+    assert not source.has_texture("block/missing")
+
+
+def test_model_graph_memoizes_parent_chains(tmp_path):
+    models_dir = tmp_path / "assets" / "minecraft" / "models"
+    (models_dir / "item").mkdir(parents=True)
+    (models_dir / "block").mkdir(parents=True)
+    (models_dir / "item" / "a.json").write_text(json.dumps({"parent": "item/shared"}))
+    (models_dir / "item" / "b.json").write_text(json.dumps({"parent": "item/shared"}))
+    (models_dir / "item" / "shared.json").write_text(json.dumps({"parent": "block/base"}))
+    (models_dir / "block" / "base.json").write_text(json.dumps({"textures": {}}))
+
+    store = PackStore()
+    graph = ModelGraph(store, str(tmp_path / "assets"))
+    mappings = {}
+
+    chain_a = graph.parent_chain(graph.model_path("item/a"), mappings)
+    assert chain_a == [
+        graph.model_path("item/a"), graph.model_path("item/shared"), graph.model_path("item/base")
+    ]
+    assert mappings == {"block/base": "item/base"}
+    assert store.load(graph.model_path("item/shared"))["parent"] == "item/base"
+
+    # The shared tail is reused without walking the parents again
+    loads = []
+    original_load = store.load
+    store.load = lambda path: loads.append(path) or original_load(path)
+    chain_b = graph.parent_chain(graph.model_path("item/b"), {})
+    assert chain_b == [graph.model_path("item/b")] + chain_a[1:]
+    assert loads == [graph.model_path("item/b")]
+
+
+def test_incremental_upgrade_reuses_manifest(tmp_path, capsys):
+    def make_pack(root):
+        models_dir = root / "assets" / "minecraft" / "models"
+        (models_dir / "item").mkdir(parents=True)
+        (models_dir / "block").mkdir(parents=True)
+        (models_dir / "item" / "diamond_sword.json").write_text(json.dumps({
+            "textures": {"layer0": "item/diamond_sword"},
+            "overrides": [{"predicate": {"custom_model_data": 1}, "model": "item/custom_sword"}]
+        }))
+        (models_dir / "item" / "custom_sword.json").write_text(json.dumps({"parent": "block/sword_base"}))
+        (models_dir / "block" / "sword_base.json").write_text(json.dumps({"textures": {"0": "item/blade"}}))
+        textures_dir = root / "assets" / "minecraft" / "textures" / "item"
+        textures_dir.mkdir(parents=True)
+        (textures_dir / "blade.png").write_bytes(b"png")
+
+    def snapshot(root):
+        return {str(p.relative_to(root)): p.read_bytes() for p in sorted(root.rglob("*")) if p.is_file()}
+
+    manifest = str(tmp_path / "manifest.json")
+    make_pack(tmp_path / "reference")
+    assert process_directory(str(tmp_path / "reference")) == True
+
+    make_pack(tmp_path / "pack")
+    assert process_directory(str(tmp_path / "pack"), manifest_path=manifest) == True
+    assert snapshot(tmp_path / "pack") == snapshot(tmp_path / "reference")
+    capsys.readouterr()
+
+    # Re-running on the upgraded pack only looks at the item model copied by the first run
+    assert process_directory(str(tmp_path / "pack"), manifest_path=manifest) == True
+    assert "1 units processed" in capsys.readouterr().out
+    assert process_directory(str(tmp_path / "pack"), manifest_path=manifest) == True
+    assert "0 units processed" in capsys.readouterr().out
+    assert snapshot(tmp_path / "pack") == snapshot(tmp_path / "reference")
+
+    # A fresh copy of the same sources is rebuilt from the manifest
+    make_pack(tmp_path / "fresh")
+    assert process_directory(str(tmp_path / "fresh"), manifest_path=manifest) == True
+    assert "0 units processed" in capsys.readouterr().out
+    assert snapshot(tmp_path / "fresh") == snapshot(tmp_path / "reference")
+
+
+def test_directory_backend_answers_lookups_from_index(tmp_path):
+    textures = tmp_path / "assets" / "minecraft" / "textures"
+    (textures / "block").mkdir(parents=True)
+    (textures / "block" / "stone.png").write_bytes(b"png")
+    (textures / "block" / "stone.png.mcmeta").write_text("{}")
+
+    store = PackStore(DirectoryBackend(str(tmp_path)))
+    assert store.exists(str(textures / "block" / "stone.png.mcmeta"))
+    assert store.is_dir(str(textures / "block"))
+    assert not store.exists(str(textures / "item" / "stone.png"))
+
+    # The tree is scanned once, later changes on disk are not probed
+    (textures / "late.png").write_bytes(b"png")
+    assert not store.exists(str(textures / "late.png"))
+
+    # Files written through the store are added to the index
+    store.copy(str(textures / "block" / "stone.png"), str(textures / "item" / "stone.png"))
+    store.remove(str(textures / "block" / "stone.png.mcmeta"))
+    store.flush()
+    assert store.exists(str(textures / "item" / "stone.png"))
+    assert store.is_dir(str(textures / "item"))
+    assert not store.exists(str(textures / "block" / "stone.png.mcmeta"))
+    assert (textures / "item" / "stone.png").read_bytes() == b"png"
+
+
+def test_directory_backend_links_copied_files(tmp_path):
+    source = tmp_path / "assets" / "minecraft" / "textures" / "custom" / "rock.png"
+    source.parent.mkdir(parents=True)
+    source.write_bytes(b"png")
+    linked = tmp_path / "assets" / "minecraft" / "textures" / "block" / "rock.png"
+
+    store = PackStore(DirectoryBackend(str(tmp_path), link_mode="hardlink"))
+    store.copy(str(source), str(linked))
+    store.flush()
+    assert linked.read_bytes() == b"png"
+    assert os.path.samefile(source, linked)
+
+    # Writing one side of a link replaces it instead of changing both files
+    store.write_bytes(str(linked), b"new")
+    store.flush()
+    assert source.read_bytes() == b"png"
+    assert linked.read_bytes() == b"new"
+
+
+def test_dedupe_textures_rewrites_models(tmp_path, monkeypatch):
+    import zipfile
+    from app import upgrade
+
+    monkeypatch.setattr(upgrade, "CACHE_DIR", str(tmp_path / "cache"))
+    jar_path = tmp_path / "client.jar"
+    with zipfile.ZipFile(jar_path, "w") as jar:
+        jar.writestr("assets/minecraft/textures/item/stick.png", b"vanilla")
+
+    pack = tmp_path / "pack"
+    textures = pack / "assets" / "minecraft" / "textures" / "item"
+    textures.mkdir(parents=True)
+    for name in ("stick", "wand", "rod"):
+        (textures / f"{name}.png").write_bytes(b"same")
+    (textures / "rod.png.mcmeta").write_text("{}")
+    models = pack / "assets" / "custom" / "models" / "item"
+    models.mkdir(parents=True)
+    (models / "wand.json").write_text(json.dumps({"textures": {"0": "minecraft:item/wand", "1": "item/rod"}}))
+
+    store = PackStore(DirectoryBackend(str(pack)))
+    with JarAssetSource(str(jar_path), version="test") as source:
+        assert dedupe_textures(str(pack), store, source) == (1, 1, 4)
+    store.flush()
+
+    # The vanilla override is kept and becomes the canonical texture,
+    # textures with different .mcmeta stay separate
+    assert not (textures / "wand.png").exists()
+    assert (textures / "stick.png").exists() and (textures / "rod.png").exists()
+    model = json.loads((models / "wand.json").read_text())
+    assert model["textures"] == {"0": "minecraft:item/stick", "1": "item/rod"}
+
+
+def test_log_levels_and_json_lines(tmp_path, capsys):
+    from app.upgrade import UpgradeLog
+
+    log_path = tmp_path / "log.jsonl"
+    log = UpgradeLog("summary", str(log_path))
+    log.verbose("Converted: a.json", path="a.json")
+    log.summary("\nDone:\n  - 1 file", processed=1)
+    log.warning("Could not save index:\nread-only")
+    log.close()
+
+    assert capsys.readouterr().out == "\nDone:\n  - 1 file\n::warning::Could not save index:%0Aread-only\n"
+    records = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert records == [
+        {"level": "summary", "message": "Done:\n  - 1 file", "processed": 1},
+        {"level": "warning", "message": "Could not save index:\nread-only"},
+    ]
+
+
+def test_benchmark_times_stages_and_flags_regressions():
+    from benchmarks.bench_upgrade import STAGES, compare, run_benchmark
+
+    sizes = {"items": 3, "overrides": 2, "bows": 2, "chain_depth": 2, "block_models": 2, "textures": 5}
+    results = run_benchmark(sizes, repeat=1)
+    assert set(results["stages"]) == set(STAGES)
+
+    assert set(results["calibration"]) == {"cpu", "io"}
+
+    # Only the I/O calibration got slower, so the conversion is held to its own baseline
+    baseline = {"calibration": {"cpu": 1.0, "io": 1.0},
+                "stages": {"convert_json_format": 0.007, "process_directory": 1.0, "migrate_item_textures": 1.0}}
+    slower = {"calibration": {"cpu": 1.0, "io": 2.0},
+              "stages": {"convert_json_format": 0.02, "process_directory": 2.2, "migrate_item_textures": 4.0}}
+    regressions = compare(slower, baseline)
+    assert [regression.split(":")[0] for regression in regressions] == [
+        "convert_json_format", "migrate_item_textures"]
+
+
+def test_process_directory_profile_report(tmp_path, monkeypatch):
+    models_dir = tmp_path / "pack" / "assets" / "minecraft" / "models" / "item"
+    models_dir.mkdir(parents=True)
+    (models_dir / "stick.json").write_text(json.dumps({
+        "textures": {"layer0": "item/stick"},
+        "overrides": [{"predicate": {"custom_model_data": 1}, "model": "item/custom_stick"}]
+    }))
+    summary_path = tmp_path / "summary.md"
+    monkeypatch.setenv("GITHUB_STEP_SUMMARY", str(summary_path))
+
+    profile_path = tmp_path / "profile.json"
+    assert process_directory(str(tmp_path / "pack"), profile_path=str(profile_path),
+                             profile_stats_dir=str(tmp_path / "stats"))
+
+    report = json.loads(profile_path.read_text())
+    assert [record["stage"] for record in report["stages"]] == [
+        "convert", "oversized_in_gui", "block_textures", "item_textures", "write"]
+    convert, write = report["stages"][0], report["stages"][-1]
+    assert convert["files_read"] == 1 and convert["files_written"] == 0
+    assert write["files_written"] == 1 and write["bytes_written"] > 0
+    assert report["total"]["files_read"] >= 1
+    assert (tmp_path / "stats" / "item_textures.prof").exists()
+    assert "| convert |" in summary_path.read_text()
+
+
+def test_json_codec_styles(tmp_path, monkeypatch):
+    from app import upgrade
+
+    document = {"parent": "item/généré", "textures": {"layer0": "item/a"}, "elements": []}
+    assert upgrade.json_dumps(document, "minified") == \
+        '{"parent":"item/généré","textures":{"layer0":"item/a"},"elements":[]}'.encode("utf-8")
+    pretty = upgrade.json_dumps(document)
+    # The stdlib fallback writes the same bytes as orjson
+    monkeypatch.setattr(upgrade, "orjson", None)
+    assert upgrade.json_dumps(document) == pretty
+    assert upgrade.json_loads(pretty) == document
+
+    models_dir = tmp_path / "assets" / "minecraft" / "models" / "item"
+    models_dir.mkdir(parents=True)
+    (models_dir / "stick.json").write_text(json.dumps({
+        "textures": {"layer0": "item/stick"},
+        "overrides": [{"predicate": {"custom_model_data": 1}, "model": "item/custom_stick"}]
+    }))
+    assert process_directory(str(tmp_path), json_style="minified")
+    written = (tmp_path / "assets" / "minecraft" / "items" / "stick.json").read_text()
+    assert "\n" not in written and json.loads(written)["oversized_in_gui"] is True
+
+
+def test_dry_run_reports_plan_without_writing(tmp_path, capsys):
+    legacy = tmp_path / "assets" / "minecraft" / "models" / "item" / "stick.json"
+    legacy.parent.mkdir(parents=True)
+    legacy.write_text(json.dumps({
+        "textures": {"layer0": "item/stick"},
+        "overrides": [{"predicate": {"custom_model_data": 1}, "model": "item/custom_stick"}]
+    }))
+    block_model = tmp_path / "assets" / "minecraft" / "models" / "block" / "fancy.json"
+    block_model.parent.mkdir(parents=True)
+    block_model.write_text(json.dumps({"textures": {"all": "custom/rock"}}))
+    (tmp_path / "assets" / "minecraft" / "textures" / "custom").mkdir(parents=True)
+    (tmp_path / "assets" / "minecraft" / "textures" / "custom" / "rock.png").write_bytes(b"png")
+    before = sorted(str(path) for path in tmp_path.rglob("*"))
+
+    plan_path = tmp_path.parent / "plan.json"
+    assert process_directory(str(tmp_path), dry_run=True, plan_path=str(plan_path))
+    assert sorted(str(path) for path in tmp_path.rglob("*")) == before
+    assert json.loads(block_model.read_text()) == {"textures": {"all": "custom/rock"}}
+
+    plan = json.loads(plan_path.read_text())
+    operations = {(operation["op"], operation["path"]) for operation in plan["operations"]}
+    assert operations == {
+        ("copy", "assets/minecraft/textures/block/custom/rock.png"),
+        ("write", "assets/minecraft/items/stick.json"),
+        ("update", "assets/minecraft/models/block/fancy.json"),
+        ("remove", "assets/minecraft/models/item/stick.json"),
+    }
+    out = capsys.readouterr().out
+    assert '+    "all": "minecraft:block/custom/rock"' in out
+    assert "Dry run, no files were changed" in out
+
+
+def test_directory_backend_commits_on_thread_pool(tmp_path):
+    textures = tmp_path / "assets" / "minecraft" / "textures"
+    (textures / "custom").mkdir(parents=True)
+    for i in range(20):
+        (textures / "custom" / f"t{i}.png").write_bytes(b"png%d" % i)
+
+    store = PackStore(DirectoryBackend(str(tmp_path), io_threads=4))
+    for i in range(20):
+        source = str(textures / "custom" / f"t{i}.png")
+        store.copy(source, str(textures / "block" / "custom" / f"t{i}.png"))
+        # Rewriting a source after copying it must not leak into the copy
+        store.write_bytes(source, b"new%d" % i)
+        store.write_bytes(str(textures / "item" / f"x{i}" / "t.png"), b"x%d" % i)
+    assert store.flush() == 60
+
+    for i in range(20):
+        assert (textures / "block" / "custom" / f"t{i}.png").read_bytes() == b"png%d" % i
+        assert (textures / "custom" / f"t{i}.png").read_bytes() == b"new%d" % i
+        assert (textures / "item" / f"x{i}" / "t.png").read_bytes() == b"x%d" % i
+
+
+def test_batch_upgrades_packs_concurrently(tmp_path, monkeypatch, capsys):
+    from app import upgrade
+
+    monkeypatch.setattr(upgrade, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("GITHUB_OUTPUT", str(tmp_path / "github_output"))
+    for name in ("one", "two"):
+        legacy = tmp_path / name / "assets" / "minecraft" / "models" / "item" / "stick.json"
+        legacy.parent.mkdir(parents=True)
+        legacy.write_text(json.dumps({
+            "textures": {"layer0": "item/stick"},
+            "overrides": [{"predicate": {"custom_model_data": 1}, "model": f"item/{name}_stick"}]
+        }))
+    packs_file = tmp_path / "packs.json"
+    packs_file.write_text(json.dumps(["two", {"input": "missing"}]))
+
+    try:
+        assert not upgrade.main([str(tmp_path / "one"), "--packs", str(packs_file), "--jobs", "2",
+                                 "--log-level", "summary", "--log-json", str(tmp_path / "log.jsonl")])
+    finally:
+        upgrade.log.configure()
+
+    for name in ("one", "two"):
+        item = json.loads((tmp_path / name / "assets" / "minecraft" / "items" / "stick.json").read_text())
+        assert item["model"]["entries"][0]["model"]["model"] == f"item/{name}_stick"
+
+    out = capsys.readouterr().out
+    assert "Upgraded 2 of 3 packs:" in out
+    # The log of each pack is shown as one block, in the order given
+    assert out.index(str(tmp_path / "one")) < out.index(str(tmp_path / "two")) < out.index("missing' not found")
+    records = [json.loads(line) for line in (tmp_path / "log.jsonl").read_text().splitlines()]
+    assert {"level": "summary", "message": f"Input directory: {tmp_path / 'two'}"} in records
+
+    results = (tmp_path / "github_output").read_text().split("results=", 1)[1]
+    assert json.loads(results) == {str(tmp_path / "one"): True, str(tmp_path / "two"): True,
+                                   str(tmp_path / "missing"): False}
+
+
+def test_batch_packs_sharing_a_name_keep_their_own_files(tmp_path, monkeypatch):
+    from app import upgrade
+
+    monkeypatch.setattr(upgrade, "CACHE_DIR", str(tmp_path / "cache"))
+    packs = [str(tmp_path / "servers" / server / "pack") for server in ("a", "b")]
+    for pack in packs:
+        legacy = tmp_path / pack / "assets" / "minecraft" / "models" / "item" / "stick.json"
+        legacy.parent.mkdir(parents=True)
+        legacy.write_text(json.dumps({"textures": {"layer0": "item/stick"},
+                                      "overrides": [{"predicate": {"custom_model_data": 1}, "model": "item/a"}]}))
+
+    names = upgrade.pack_names(packs)
+    assert len(set(names.values())) == 2 and all(name.startswith("pack-") for name in names.values())
+    assert upgrade.pack_names([packs[0], str(tmp_path / "other")])[packs[0]] == "pack"
+
+    try:
+        assert upgrade.main(packs + ["--incremental", "--jobs", "2", "--log-level", "quiet"])
+        assert not upgrade.main([packs[0], packs[0] + "/", "--log-level", "quiet"])
+    finally:
+        upgrade.log.configure()
+    manifests = sorted(os.listdir(tmp_path / "cache" / "manifests"))
+    assert manifests == sorted(f"{name}.json" for name in names.values())
+
+
+def test_stages_cover_custom_namespaces(tmp_path):
+    custom = tmp_path / "assets" / "custom"
+    (custom / "items").mkdir(parents=True)
+    gem_item = {"model": {"type": "range_dispatch", "property": "custom_model_data", "entries": [],
+                          "fallback": {"type": "model", "model": "custom:block/gem"}}}
+    (custom / "items" / "gem.json").write_text(json.dumps(gem_item))
+    (custom / "models" / "block").mkdir(parents=True)
+    (custom / "models" / "block" / "gem.json").write_text(json.dumps({
+        "textures": {"0": "custom:block/gem_tex", "1": "custom:gems/ruby"}}))
+    (custom / "textures" / "block").mkdir(parents=True)
+    (custom / "textures" / "block" / "gem_tex.png").write_bytes(b"gem")
+    (custom / "textures" / "gems").mkdir(parents=True)
+    (custom / "textures" / "gems" / "ruby.png").write_bytes(b"ruby")
+
+    assert process_directory(str(tmp_path))
+
+    item = json.loads((custom / "items" / "gem.json").read_text())
+    assert item["model"]["fallback"]["model"] == "custom:item/gem"
+    assert item["oversized_in_gui"] is True
+    # Textures are resolved and copied within their own namespace
+    assert (custom / "textures" / "block" / "gems" / "ruby.png").read_bytes() == b"ruby"
+    assert (custom / "textures" / "item" / "gem_tex.png").read_bytes() == b"gem"
+    assert json.loads((custom / "models" / "item" / "gem.json").read_text())["textures"] == {
+        "0": "custom:item/gem_tex", "1": "custom:item/gems/ruby"}
+    assert not (tmp_path / "assets" / "minecraft").exists()
+
+
+def test_conversion_rules_from_config(tmp_path, monkeypatch):
+    from app import upgrade
+
+    monkeypatch.setattr(upgrade, "CONVERSION_RULES", dict(upgrade.CONVERSION_RULES))
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({
+        "shield": {"handler": "condition", "predicate": "blocking", "property": "minecraft:using_item"},
+        "minecraft:rainbow_sword": "damage",
+    }))
+    upgrade.load_conversion_rules(str(rules_path))
+
+    shield = convert_json_format({
+        "textures": {"layer0": "item/shield"},
+        "overrides": [{"predicate": {"blocking": 1}, "model": "item/shield_blocking"},
+                      {"predicate": {"custom_model_data": 1}, "model": "item/knight_shield"},
+                      {"predicate": {"custom_model_data": 1, "blocking": 1}, "model": "item/knight_shield_blocking"}]
+    })
+    assert shield["model"]["fallback"]["on_true"] == {"type": "minecraft:model", "model": "item/shield_blocking"}
+    entry = shield["model"]["entries"][0]
+    assert entry["threshold"] == 1 and entry["model"]["property"] == "minecraft:using_item"
+    assert entry["model"]["on_false"]["model"] == "item/knight_shield"
+    assert entry["model"]["on_true"]["model"] == "item/knight_shield_blocking"
+
+    # Rules match item ids exactly, a "bow" inside another name is no longer a bow
+    sword = convert_json_format({
+        "textures": {"layer0": "item/rainbow_sword"},
+        "overrides": [{"predicate": {"custom_model_data": 1}, "model": "item/ignored"},
+                      {"predicate": {"damage": 0.5}, "model": "item/rainbow_sword_worn"}]
+    })
+    assert sword["model"]["property"] == "damage"
+    assert sword["model"]["entries"] == [{"threshold": 0.5, "model": {"type": "model", "model": "item/rainbow_sword_worn"}}]
+
+    with pytest.raises(ValueError):
+        upgrade.register_conversion_rules({"trident": {"handler": "condition"}})
+
+
+def test_client_jar_download_from_mirror_is_verified(tmp_path):
+    import hashlib
+    from app import upgrade
+
+    jar = b"PK fake client jar" * 100
+    mirror = tmp_path / "mirror"
+    mirror.mkdir()
+    (mirror / "test.jar").write_bytes(jar)
+    client = {"url": "https://example.invalid/client.jar", "sha1": hashlib.sha1(jar).hexdigest(), "size": len(jar)}
+    (mirror / "test.json").write_text(json.dumps({"downloads": {"client": client}}))
+
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    # An interrupted earlier download is continued or replaced, never trusted
+    (cache / "test.jar.part").write_bytes(jar[:10])
+    path = upgrade.download_client_jar("test", str(cache), mirror=str(mirror))
+    assert path == str(cache / "test.jar")
+    assert (cache / "test.jar").read_bytes() == jar
+    assert not (cache / "test.jar.part").exists()
+    assert upgrade.cached_jar_valid("test", str(cache))
+
+    # A JAR that does not match its checksum is rejected and not cached
+    (cache / "test.jar").unlink()
+    (mirror / "test.jar").write_bytes(jar[:-1] + b"!")
+    assert upgrade.download_client_jar("test", str(cache), mirror=mirror.as_uri()) == ""
+    assert not (cache / "test.jar").exists() and not (cache / "test.jar.part").exists()
+
+
+def test_cached_jar_without_version_json_is_checked(tmp_path):
+    import io
+    import zipfile
+    from app import upgrade
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as jar:
+        jar.writestr("assets/minecraft/textures/item/stick.png", b"\x89PNG" * 1000)
+    (tmp_path / "test.jar").write_bytes(buffer.getvalue())
+    assert upgrade.cached_jar_valid("test", str(tmp_path))
+
+    # Truncated with no version JSON next to it, the JAR cannot be trusted
+    (tmp_path / "test.jar").write_bytes(buffer.getvalue()[:-30])
+    assert not upgrade.cached_jar_valid("test", str(tmp_path))
+    assert not (tmp_path / "test.jar").exists()
+
+
+def test_item_textures_are_prefetched_from_jar(tmp_path, monkeypatch):
+    import zipfile
+    from app import upgrade
+
+    monkeypatch.setattr(upgrade, "CACHE_DIR", str(tmp_path / "cache"))
+    jar_path = tmp_path / "client.jar"
+    with zipfile.ZipFile(jar_path, "w", zipfile.ZIP_DEFLATED) as jar:
+        for name in ("stone", "dirt", "unused"):
+            jar.writestr(f"assets/minecraft/textures/block/{name}.png", name.encode() * 50)
+        jar.writestr("assets/minecraft/textures/block/dirt.png.mcmeta", b"{}")
+    monkeypatch.setenv("MINECRAFT_JAR_PATH", str(jar_path))
+
+    pack = tmp_path / "pack"
+    item = pack / "assets" / "minecraft" / "items" / "stick.json"
+    item.parent.mkdir(parents=True)
+    item.write_text(json.dumps({"model": {"type": "range_dispatch", "property": "custom_model_data", "entries": [],
+                                          "fallback": {"type": "model", "model": "item/rock"}}}))
+    models = pack / "assets" / "minecraft" / "models" / "item"
+    models.mkdir(parents=True)
+    (models / "rock.json").write_text(json.dumps({"parent": "item/rock_base", "textures": {"0": "block/stone"}}))
+    (models / "rock_base.json").write_text(json.dumps({"textures": {"1": "block/dirt"}}))
+
+    prefetched = []
+    prefetch = JarAssetSource.prefetch
+    monkeypatch.setattr(JarAssetSource, "prefetch",
+                        lambda self, names, *args: prefetched.append(sorted(names)) or prefetch(self, names, *args))
+    # Every extraction is served by the single prefetch pass
+    def read_entry(self, name):
+        if name in self._prefetched:
+            return self._prefetched.pop(name)
+        assert not self.has_entry(name), f"{name} extracted on demand"
+        return None
+    monkeypatch.setattr(JarAssetSource, "read_entry", read_entry)
+    assert process_directory(str(pack))
+
+    assert prefetched == [["assets/minecraft/textures/block/dirt.png", "assets/minecraft/textures/block/dirt.png.mcmeta",
+                           "assets/minecraft/textures/block/stone.png"]]
+    textures = pack / "assets" / "minecraft" / "textures" / "item"
+    assert (textures / "stone.png").read_bytes() == b"stone" * 50
+    assert (textures / "dirt.png.mcmeta").read_bytes() == b"{}"
+    assert not (textures / "unused.png").exists()
+
+
+def test_conversion_cache_persists_across_runs(tmp_path, monkeypatch):
+    from app import upgrade
+
+    def legacy(index, indent=None):
+        return json.dumps({
+            "textures": {"layer0": "item/stick"},
+            "overrides": [{"predicate": {"custom_model_data": 1}, "model": f"item/stick_{index}"}]
+        }, indent=indent).encode()
+
+    path = str(tmp_path / "conversions.sqlite")
+    cache = upgrade.PersistentConversionCache(path)
+    converted = cache.convert(legacy(0))
+    assert cache.misses == 1
+    cache.close()
+
+    # A later run reads the conversion back, even from a differently formatted file
+    monkeypatch.setattr(upgrade, "convert_json_format", lambda *args, **kwargs: pytest.fail("converted again"))
+    cache = upgrade.PersistentConversionCache(path)
+    assert cache.convert(legacy(0, indent=4)) == converted
+    assert (cache.hits, cache.misses) == (1, 0)
+    cache.close()
+    monkeypatch.undo()
+
+    # Beyond the size cap the least recently used entries are evicted
+    cache = upgrade.PersistentConversionCache(path)
+    cache.convert(legacy(1))
+    cache.close()
+    entry_size = 40 + len(upgrade.json_dumps(converted, "minified"))
+    cache = upgrade.PersistentConversionCache(path, max_bytes=entry_size * 5 // 2)
+    assert cache.lookup(legacy(0))[0]
+    cache.convert(legacy(2))
+    cache.close()
+    cache = upgrade.PersistentConversionCache(path)
+    assert [cache.lookup(legacy(index))[0] for index in range(3)] == [True, False, True]
+    cache.close()
+
+    # In memory only the most recently used conversions are kept
+    cache = upgrade.ConversionCache(max_entries=2)
+    for index in (0, 1, 0, 2):
+        cache.convert(legacy(index))
+    assert [cache.lookup(legacy(index))[0] for index in (1, 0, 2)] == [False, True, True]
+
+
+def test_watch_session_upgrades_changed_files(tmp_path):
+    from app import upgrade
+
+    def legacy(name):
+        path = tmp_path / "pack" / "assets" / "minecraft" / "models" / "item" / f"{name}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({
+            "textures": {"layer0": f"item/{name}"},
+            "overrides": [{"predicate": {"custom_model_data": 1}, "model": f"item/custom_{name}"}]
+        }))
+        return str(path)
+
+    legacy("stick")
+    items_dir = tmp_path / "pack" / "assets" / "minecraft" / "items"
+    watcher = upgrade.PollingWatcher(str(tmp_path / "pack" / "assets"), interval=0.01)
+    session = upgrade.WatchSession(str(tmp_path / "pack"), str(tmp_path / "manifest.json"))
+    try:
+        assert session.upgrade()
+        assert (items_dir / "stick.json").exists()
+        # Files written and removed by the pass itself are not changes
+        assert session.own_changes(watcher.read(0)) == set()
+
+        added = legacy("blaze_rod")
+        changed = session.own_changes(watcher.read(0))
+        assert changed == {added}
+        assert session.upgrade(changed)
+        item = json.loads((items_dir / "blaze_rod.json").read_text())
+        assert item["model"]["entries"][0]["model"]["model"] == "item/custom_blaze_rod"
+        # Only the work reading or writing the new model ran again
+        assert 0 < session.manifest.executed <= 3
+        assert session.manifest.skipped
+    finally:
+        session.close()
+    assert (tmp_path / "manifest.json").exists()
+
+
+def test_upgrader_runs_in_memory(tmp_path, monkeypatch):
+    from app import upgrade
+
+    files = {
+        "pack.mcmeta": b'{"pack": {"pack_format": 46}}',
+        "assets/minecraft/models/item/stick.json": json.dumps({
+            "textures": {"layer0": "item/stick"},
+            "overrides": [{"predicate": {"custom_model_data": 1}, "model": "item/custom_stick"}]
+        }).encode(),
+        "assets/minecraft/models/item/custom_stick.json": json.dumps({"parent": "block/stick_base"}).encode(),
+        "assets/minecraft/models/block/stick_base.json": json.dumps({"textures": {"0": "block/stone"}}).encode(),
+    }
+    jar_source = upgrade.MemoryAssetSource({"assets/minecraft/textures/block/stone.png": b"stone"})
+    # Nothing is extracted to or written in the working directory
+    monkeypatch.chdir(tmp_path)
+
+    with upgrade.Upgrader(jar_source=jar_source) as upgrader:
+        upgraded, report = upgrader.upgrade(files)
+        assert report["success"]
+        assert "assets/minecraft/models/item/stick.json" in files
+        assert "assets/minecraft/models/item/stick.json" not in upgraded
+        item = json.loads(upgraded["assets/minecraft/items/stick.json"])
+        assert item["model"]["entries"][0]["model"]["model"] == "item/custom_stick"
+        assert upgraded["assets/minecraft/textures/item/stone.png"] == b"stone"
+        assert {"op": "remove", "path": "assets/minecraft/models/item/stick.json",
+                "size": len(files["assets/minecraft/models/item/stick.json"])} in report["changes"]
+        assert any(record.get("event") == "item_migration_complete" for record in report["records"])
+
+        # A warm instance reuses its conversions, zipped packs go in as well
+        again, report = upgrader.upgrade(upgrade.pack_to_zip(files))
+        assert again == upgraded
+        assert upgrader.conversion_cache.hits == upgrader.conversion_cache.misses == 2
+
+        # Calls from several threads run one at a time, each capturing only its own log
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(upgrader.upgrade, [files, files]))
+        assert [result[0] for result in results] == [upgraded, upgraded]
+        assert [len(result[1]["records"]) for result in results] == [len(report["records"])] * 2
+    assert list(tmp_path.iterdir()) == []